@@ -0,0 +1,44 @@
+# Run the benchmark suite and collect the results in a single JSON lines file.
+# python -m bench --output results/$(git rev-parse --short HEAD).jsonl [--services] [--api http://localhost:8000]
+# Compare two runs with python -m bench.compare results/old.jsonl results/new.jsonl
+import sys
+import argparse
+import subprocess
+
+# Benchmarks running on the cached articles only
+OFFLINE = ["parse_table", "html_cleaner", "strip_markdown", "stopwords", "models", "cache_store", "conversion",
+           "formatting", "translation", "log_manager", "imports"]
+# Benchmarks needing the compose containers
+SERVICES = ["services", "autocomplete", "layout"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite")
+    parser.add_argument("--output", required=True, help="JSON lines file to append the results to")
+    parser.add_argument("--only", nargs="+", help="names of the benchmarks to run")
+    parser.add_argument("--services", action="store_true", help="also run the MongoDB and Elasticsearch benchmarks")
+    parser.add_argument("--api", help="URL of a running API to benchmark")
+    args = parser.parse_args()
+
+    benchmarks = [[name] for name in OFFLINE]
+    if args.services:
+        benchmarks += [[name] for name in SERVICES]
+    if args.api:
+        benchmarks.append(["api", "--url", args.api])
+    if args.only:
+        benchmarks = [benchmark for benchmark in benchmarks if benchmark[0] in args.only]
+
+    failed = []
+    for name, *options in benchmarks:
+        print(f"# bench.{name}", file=sys.stderr)
+        process = subprocess.run([sys.executable, "-m", f"bench.{name}", *options, "--output", args.output])
+        if process.returncode != 0:
+            failed.append(name)
+
+    if failed:
+        print(f"# failed: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# Measure the latency of the API endpoints under concurrency, against a running server
+# (e.g. uvicorn main:app --workers 4 --port 8000 with the compose containers up).
+# python -m bench.api --url http://localhost:8000 --requests 500 --concurrency 1 8 32
+import json
+import random
+import argparse
+import urllib.parse
+import urllib.request
+
+from bench.utils import load, report
+
+
+class APIClient:
+    def __init__(self, url: str, timeout: float = 30.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def get(self, path: str, params: dict = None, body: dict = None):
+        """
+        Send a GET request. Some endpoints read their parameters from a JSON body, even on GET.
+        :return: decoded JSON response
+        """
+        url = f"{self.url}{path}"
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(url, data=data, method="GET",
+                                         headers={"Content-Type": "application/json"} if data else {})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API endpoint latency under concurrency")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=500, help="number of requests per endpoint and concurrency")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--language", default="ko")
+    parser.add_argument("--output", help="JSON lines file to append the results to")
+    args = parser.parse_args()
+
+    client = APIClient(args.url)
+
+    # Collect article ids and search words from the first feed pages
+    articles = []
+    cursor = None
+    while len(articles) < 200:
+        page = client.get("/api/v1/feed/", {"language": args.language, **({"cursor": cursor} if cursor else {})})[0]
+        if not page:
+            break
+        articles += page
+        cursor = page[-1]["id"]
+    if not articles:
+        raise SystemExit("The feed is empty, load some articles first")
+
+    generator = random.Random(0)
+    mongo_ids = [article["id"] for article in articles]
+    words = [word for article in articles for word in article["title"].split() if len(word) > 1]
+
+    cases = {
+        "feed": (lambda cursor_id: client.get("/api/v1/feed/", {"language": args.language,
+                                                                **({"cursor": cursor_id} if cursor_id else {})}),
+                 [None] + [generator.choice(mongo_ids) for _ in range(args.requests - 1)]),
+        "article": (lambda mongo_id: client.get("/api/v1/articles/", body={"article_id": mongo_id,
+                                                                           "language": args.language}),
+                    [generator.choice(mongo_ids) for _ in range(args.requests)]),
+        "search": (lambda query: client.get("/api/v1/search/", body={"query": query, "language": args.language,
+                                                                     "cursor": 0}),
+                   [generator.choice(words) for _ in range(args.requests)]),
+        "autocomplete": (lambda query: client.get("/api/v1/auto-complete/", body={"query": query[:2],
+                                                                                  "language": args.language}),
+                         [generator.choice(words) for _ in range(args.requests)]),
+    }
+
+    results = []
+    for name, (function, arguments) in cases.items():
+        for concurrency in args.concurrency:
+            results.append({"case": name, "language": args.language, **load(function, arguments, concurrency)})
+
+    report("api", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Compare the autocomplete backends (completion suggester and search_as_you_type with bool_prefix) on the cached
+# articles: latency under concurrency, share of queries answered, and memory and disk use of the two fields.
+# Needs the compose containers. The articles go to the benchmark indexes (see bench.services), dropped at the end.
+# python -m bench.autocomplete --articles 1000 --queries 500 --concurrency 1 8
+import random
+import argparse
+
+from bench.services import BENCH_INDEX_PREFIX
+from bench.utils import cache_articles, load, report
+from modules.db import ElasticsearchClient
+from modules.models import Article
+from modules.log_manager import Logger
+
+
+def autocomplete_queries(articles: list[Article], count: int, seed: int = 0) -> dict[str, list[str]]:
+    """
+    Queries typed by users: the first characters of a title, and the first characters of a word inside a title.
+    :return: dictionary of query kind -> queries
+    """
+    generator = random.Random(seed)
+    titles = [article.title for article in articles if article.title]
+    words = [word for title in titles for word in title.split()[1:] if len(word) > 1]
+    return {
+        "title_prefix": [title[:generator.randint(1, 4)] for title in generator.choices(titles, k=count)],
+        "word_prefix": [word[:generator.randint(2, 3)] for word in generator.choices(words, k=count)],
+    }
+
+
+def field_memory(es: ElasticsearchClient, index_name: str) -> dict:
+    """
+    Heap used by the completion FSTs, and disk use of the suggest field and of the search_as_you_type subfields.
+    """
+    stats = es.es.indices.stats(index=index_name, metric="completion,segments")["_all"]["primaries"]
+    usage = es.es.indices.disk_usage(index=index_name, run_expensive_tasks=True)[index_name]["fields"]
+    return {
+        "completion_heap_bytes": stats["completion"]["size_in_bytes"],
+        "segments_heap_bytes": stats["segments"]["memory_in_bytes"],
+        "suggest_disk_bytes": usage.get("suggest", {}).get("total_in_bytes", 0),
+        "prefix_disk_bytes": sum(field["total_in_bytes"] for name, field in usage.items()
+                                 if name.startswith("title_prefix")),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Autocomplete backends on the compose containers")
+    parser.add_argument("--articles", type=int, default=1000, help="number of cached articles to index")
+    parser.add_argument("--queries", type=int, default=500, help="number of queries per kind and concurrency")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--es-url", default="http://localhost:9200")
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark indexes")
+    parser.add_argument("--output", help="JSON lines file to append the results to")
+    args = parser.parse_args()
+
+    Logger(debug=False, log_file=None)
+    es = ElasticsearchClient(args.es_url, index_prefix=BENCH_INDEX_PREFIX)
+    if not es.ping():
+        raise SystemExit("Elasticsearch must be running, see compose.yaml")
+
+    articles = cache_articles(args.articles)
+    index_name = f"{BENCH_INDEX_PREFIX}_ko"
+    results = []
+    try:
+        es.setup_index()
+        for article_id, article in enumerate(articles):
+            es.insert_article(article, str(article_id))
+        es.es.indices.forcemerge(index=index_name, max_num_segments=1)
+        es.es.indices.refresh(index=index_name)
+
+        results.append({"case": "memory", "documents": len(articles), **field_memory(es, index_name)})
+
+        backends = {"completion": es.autocomplete_completion, "prefix": es.autocomplete_prefix}
+        for kind, queries in autocomplete_queries(articles, args.queries).items():
+            for backend, function in backends.items():
+                answered = sum(bool(function(query, "ko")) for query in queries)
+                for concurrency in args.concurrency:
+                    results.append({"case": kind, "backend": backend, "answered": round(answered / len(queries), 4),
+                                    **load(lambda query: function(query, "ko"), queries, concurrency)})
+    finally:
+        if not args.keep:
+            es.es.indices.delete(index=",".join(f"{BENCH_INDEX_PREFIX}_{language}"
+                                                for language in Article.valid_languages), ignore_unavailable=True)
+
+    report("autocomplete", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
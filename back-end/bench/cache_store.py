@@ -0,0 +1,57 @@
+# Compare reading the cached articles from the one-file-per-article folder and from the packed store.
+# python -m bench.cache_store
+import os
+import tempfile
+import argparse
+
+from bench.utils import Timer, report
+from modules.cache_store import ArticleCacheStore
+
+
+def read_file(cache_dir: str, site: str, article_id: int):
+    """Lookup done by GungCrawler.get_cache before the packed store."""
+    path = f"{cache_dir}/{site}/{article_id}.md"
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Packed cache store against the cache folder")
+    parser.add_argument("--cache-dir", default="cache")
+    parser.add_argument("--output", help="JSON lines file to append the results to")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        with ArticleCacheStore(os.path.join(directory, "articles.sqlite3")) as store:
+            with Timer() as migration:
+                store.migrate_directory(args.cache_dir)
+            keys = [(site, article_id) for site, article_id, _ in store.iter_articles()]
+            by_site = {}
+            for site, article_id in keys:
+                by_site.setdefault(site, []).append(article_id)
+
+            cases = {
+                "files_lookup": lambda: [read_file(args.cache_dir, site, article_id) for site, article_id in keys],
+                "store_lookup": lambda: [store.get(site, article_id) for site, article_id in keys],
+                "store_get_many": lambda: [store.get_many(site, ids) for site, ids in by_site.items()],
+                "store_scan": lambda: list(store.iter_articles()),
+            }
+            results = [{"case": "migration", "articles": len(keys), "seconds": round(migration.elapsed, 4)}]
+            for name, case in cases.items():
+                with Timer() as timer:
+                    case()
+                results.append({"case": name, "articles": len(keys), "seconds": round(timer.elapsed, 4),
+                                "articles_per_second": round(len(keys) / timer.elapsed, 2)})
+
+            with Timer() as compaction:
+                store.compact()
+            results.append({"case": "compact", "articles": len(keys), "seconds": round(compaction.elapsed, 4),
+                            "store_bytes": os.path.getsize(store.path)})
+
+    report("cache_store", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# Compare two result files of the benchmark suite and list the regressions.
+# python -m bench.compare results/old.jsonl results/new.jsonl --threshold 0.1
+import sys
+import json
+import argparse
+
+# Fields describing the environment or the outcome of a run, ignored when matching the results
+RUN_FIELDS = {"python", "commit", "errors"}
+
+
+def metric_direction(field: str, value) -> int:
+    """
+    Tell if a result field is a measurement.
+    :return: 1 if higher is better, -1 if lower is better, 0 if the field is not a measurement
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return 0
+    if field.endswith("per_second") or field == "speedup":
+        return 1
+    if field.endswith(("seconds", "_ms", "_us", "us_per_call", "microseconds_per_article")):
+        return -1
+    return 0
+
+
+def load_results(path: str) -> dict:
+    """
+    Read a result file, keyed by the benchmark and the parameters of each row. The last run wins.
+    :return: dictionary of key -> {measurement: value}
+    """
+    results = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            parameters = tuple(sorted((field, value) for field, value in row.items()
+                                      if field not in RUN_FIELDS and not isinstance(value, (dict, list))
+                                      and not metric_direction(field, value)))
+            results[parameters] = {field: value for field, value in row.items() if metric_direction(field, value)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change reported as a regression")
+    args = parser.parse_args()
+
+    baseline = load_results(args.baseline)
+    candidate = load_results(args.candidate)
+
+    regressions = 0
+    for parameters, measurements in candidate.items():
+        if parameters not in baseline:
+            continue
+        name = " ".join(f"{field}={value}" for field, value in parameters)
+        for field, value in measurements.items():
+            old = baseline[parameters].get(field)
+            if not old:
+                continue
+            change = (value - old) / old
+            worse = change * metric_direction(field, value) < -args.threshold
+            regressions += worse
+            print(json.dumps({"case": name, "field": field, "baseline": old, "candidate": value,
+                              "change": round(change, 4), "regression": worse}, ensure_ascii=False))
+
+    print(f"{regressions} regressions above {args.threshold:.0%}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# Measure the HTML to markdown conversion inline and in the process pool stage, on HTML rebuilt from the cache.
+# python -m bench.conversion --workers 1 2 4 8
+import os
+import argparse
+
+from bench.html_cleaner import DOMAIN, board_html
+from bench.utils import Timer, iter_cache_documents, report
+from modules.conversion import ConversionPool, convert_html
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ConversionPool throughput")
+    parser.add_argument("--articles", type=int, default=None, help="number of cached articles (default: all)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--output", help="JSON lines file to append the results to")
+    args = parser.parse_args()
+
+    documents = [(article_id, board_html(content, article_id), DOMAIN)
+                 for _, article_id, content in iter_cache_documents(args.articles)]
+
+    with Timer() as timer:
+        expected = [convert_html(html_content, domain) for _, html_content, domain in documents]
+    results = [{"mode": "inline", "workers": 1, "documents": len(documents), "seconds": round(timer.elapsed, 4),
+                "documents_per_second": round(len(documents) / timer.elapsed, 2)}]
+
+    for workers in args.workers:
+        with ConversionPool(workers) as pool:
+            # Start the worker processes before timing
+            list(pool.map([(0, "", DOMAIN)] * workers))
+            with Timer() as timer:
+                converted = list(pool.map(documents))
+
+        results.append({
+            "mode": "pool",
+            "workers": workers,
+            "documents": len(documents),
+            "seconds": round(timer.elapsed, 4),
+            "documents_per_second": round(len(documents) / timer.elapsed, 2),
+            "in_order": [key for key, _ in converted] == [key for key, _, _ in documents],
+            "mismatches": sum(markdown != reference for (_, markdown), reference in zip(converted, expected)),
+        })
+
+    report("conversion", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+# Generate a synthetic five-language corpus from the cached articles, at 10x-100x the current volume, load it through
+# MongoDBClient and ElasticsearchClient, and measure feed pagination, count, search and reindex at that size.
+# Needs the compose.yaml containers. The corpus goes to the benchmark database and indexes (see bench.services).
+# python -m bench.corpus --articles 100000 --workers 8 --keep
+# python -m bench.corpus --skip-load --keep        (measure again on the corpus kept by a previous run)
+# python -m bench.corpus --articles 1000 --export corpus.jsonl   (only write the documents, no services needed)
+import re
+import json
+import zlib
+import random
+import argparse
+import statistics
+import collections
+from datetime import date, timedelta
+from typing import Iterator
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.services import BENCH_DATABASE, BENCH_INDEX_PREFIX, query_words
+from bench.utils import Timer, iter_cache_documents, load, percentiles, report
+from modules.db import MongoDBClient, ElasticsearchClient
+from modules.models import Article
+from modules.log_manager import Logger, log
+
+hangul_word_re = re.compile(r"[가-힣]+")
+
+# Alphabet of the pseudo-translations, and length of the words in units of the alphabet
+LATIN_SYLLABLES = [consonant + vowel for consonant in "bcdfghlmnprstv" for vowel in "aeiou"]
+SCRIPTS = {
+    "en": (LATIN_SYLLABLES, (1, 4)),
+    "es": (LATIN_SYLLABLES + ["que", "ción", "ñi", "lla"], (1, 4)),
+    "ja": ([chr(code) for code in range(0x3042, 0x3094)] + [chr(code) for code in range(0x30A2, 0x30F4)], (2, 5)),
+    "zh": ([chr(code) for code in range(0x4E00, 0x4E00 + 2500)], (1, 3)),
+}
+
+
+def pseudo_word(word: str, language: str) -> str:
+    """
+    Deterministic stand-in translation of a Korean word. The same word always maps to the same pseudo-word,
+    so the term frequencies of the corpus keep the distribution of the real articles.
+    """
+    alphabet, (shortest, longest) = SCRIPTS[language]
+    checksum = zlib.crc32(f"{language}:{word}".encode("utf-8"))
+    length = shortest + checksum % (longest - shortest + 1)
+    units = []
+    for _ in range(length):
+        checksum = (checksum * 1103515245 + 12345) & 0x7FFFFFFF
+        units.append(alphabet[checksum % len(alphabet)])
+    return "".join(units)
+
+
+def pseudo_translate(text: str, language: str) -> str:
+    """
+    Replace the Korean words of a markdown text, leaving the markdown, numbers and links as they are.
+    """
+    return hangul_word_re.sub(lambda match: pseudo_word(match.group(0), language), text)
+
+
+def generate_articles(count: int, seed: int = 0, years: int = 10) -> Iterator[tuple[Article, dict]]:
+    """
+    Generate synthetic articles from the cached ones. Past the size of the cache, the articles are variants
+    with some paragraphs replaced by paragraphs of other articles.
+    :param count: number of articles
+    :param seed: random seed
+    :param years: the publication dates are spread over this number of years before today
+    :return: iterator of (Korean Article, {language: (title, content)} for the other languages)
+    """
+    with open("config.json") as f:
+        config = json.load(f)
+
+    documents = list(iter_cache_documents())
+    paragraphs = [content.split("\n\n") for _, _, content in documents]
+    generator = random.Random(seed)
+    today = date.today()
+
+    for index in range(count):
+        config_key, _, content = documents[index % len(documents)]
+        variant = index // len(documents)
+        if variant:
+            blocks = list(paragraphs[index % len(documents)])
+            for position in range(1, len(blocks)):
+                if generator.random() < 0.3:
+                    blocks[position] = generator.choice(generator.choice(paragraphs))
+            content = "\n\n".join(blocks)
+
+        title = content.strip().split("\n", 1)[0].strip("#* ")[:80] or "공지사항"
+        if variant:
+            title = f"{title} ({variant + 1}차)"
+
+        site = config[config_key]
+        article_id = index + 1
+        article = Article(source_prefix=site["source_prefix"], article_id=article_id,
+                          source_url=f"{site['domain']}/board/view?id={article_id}", title=title,
+                          time=(today - timedelta(days=generator.randrange(365 * years))).isoformat(),
+                          content=content)
+        translations = {language: (pseudo_translate(title, language), pseudo_translate(content, language))
+                        for language in Article.valid_languages if language != "ko"}
+        yield article, translations
+
+
+def load_article(mongo: MongoDBClient, es: ElasticsearchClient, article: Article, translations: dict) -> bool:
+    """
+    Load an article the way the crawler and the translation script do: insertion in Korean, then one
+    `add_language` and one index per translation.
+    """
+    mongo_id = mongo.insert_article(article)
+    if mongo_id is None:
+        return False
+
+    for language, (title, content) in translations.items():
+        translated = Article(source_prefix=article.source_prefix, article_id=article.article_id,
+                             source_url=article.url, title=title, time=article.time, content=content,
+                             language=language)
+        if not mongo.add_language(language, translated, mongo_id):
+            return False
+        es.insert_article(translated, mongo_id, language)
+    return True
+
+
+def load_corpus(mongo: MongoDBClient, es: ElasticsearchClient, count: int, workers: int, seed: int) -> int:
+    """
+    Load the generated articles from `workers` threads. Only a few articles per worker are generated ahead,
+    so the memory use does not grow with the size of the corpus.
+    :return: number of articles loaded
+    """
+    loaded = 0
+    done = 0
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for article, translations in generate_articles(count, seed):
+            if len(pending) >= workers * 4:
+                loaded += pending.popleft().result()
+                done += 1
+                if done % 1000 == 0:
+                    log.info("Loaded %s/%s articles", done, count)
+            pending.append(executor.submit(load_article, mongo, es, article, translations))
+        while pending:
+            loaded += pending.popleft().result()
+    return loaded
+
+
+def measure(mongo: MongoDBClient, es: ElasticsearchClient, args) -> list[dict]:
+    documents = mongo.get_article_count()
+    results = []
+
+    # count_documents scans the collection, so its cost grows with the corpus, unlike the estimated count
+    # and the counter document maintained by the write paths
+    counts = {
+        "count_exact": lambda: mongo.db.articles.count_documents({}),
+        "count_estimated": mongo.get_article_count,
+        "counts": mongo.get_article_counts,
+    }
+    for name, function in counts.items():
+        durations = []
+        for _ in range(5):
+            with Timer() as timer:
+                function()
+            durations.append(timer.elapsed)
+        results.append({"case": name, "documents": documents,
+                        "median_ms": round(statistics.median(durations) * 1000, 2)})
+
+    # Translation coverage: the aggregation of vetify_translation.py against the former scan of the full documents
+    coverage = {
+        "coverage_scan": lambda: sum(len(document["title"]) != len(Article.valid_languages)
+                                     for document in mongo.db.articles.find({})),
+        "coverage": mongo.get_translation_coverage,
+        "coverage_work_list": lambda: sum(1 for _ in mongo.iter_missing_translations()),
+    }
+    for name, function in coverage.items():
+        with Timer() as timer:
+            function()
+        results.append({"case": name, "documents": documents, "seconds": round(timer.elapsed, 4)})
+
+    # Feed pagination, following the cursors from the first page
+    durations = []
+    cursor = None
+    for _ in range(args.pages):
+        with Timer() as timer:
+            page = mongo.get_latest_summaries("ko", cursor, 20)
+        durations.append(timer.elapsed)
+        if not page:
+            break
+        cursor = page[-1].mongo_id
+    results.append({"case": "feed_pages", "documents": documents, "pages": len(durations),
+                    **percentiles(durations)})
+
+    # Deep pages: cursors taken anywhere in the collection
+    sample = [str(document["_id"]) for document in
+              mongo.db.articles.aggregate([{"$sample": {"size": args.queries}}, {"$project": {"_id": 1}}])]
+    results.append({"case": "feed_deep", "documents": documents,
+                    **load(lambda mongo_id: mongo.get_latest_summaries("ko", mongo_id, 20), sample, 1)})
+
+    titles = [Article.from_mongo(document) for document in
+              mongo.db.articles.aggregate([{"$sample": {"size": 200}}])]
+    queries = query_words(titles, args.queries)
+    for language in ("ko", "en"):
+        if language != "ko":
+            queries = [pseudo_translate(query, language) for query in queries]
+        for concurrency in args.concurrency:
+            results.append({"case": "search", "language": language, "documents": documents,
+                            **load(lambda query: es.search_articles(query, language), queries, concurrency)})
+
+    # Reindex of the Korean documents, as setup.py does
+    reindexed = 0
+    with Timer() as timer:
+        for document in mongo.db.articles.find({}).limit(args.reindex_limit):
+            es.insert_article(Article.from_mongo(document), document["_id"])
+            reindexed += 1
+    results.append({"case": "reindex", "documents": documents, "reindexed": reindexed,
+                    "seconds": round(timer.elapsed, 4), "documents_per_second": round(reindexed / timer.elapsed, 2)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scale test on a synthetic five-language corpus")
+    parser.add_argument("--articles", type=int, default=100000, help="size of the corpus")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=8, help="threads loading the corpus")
+    parser.add_argument("--pages", type=int, default=50, help="number of feed pages to follow")
+    parser.add_argument("--queries", type=int, default=300, help="number of calls per search and deep feed case")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--reindex-limit", type=int, default=10000, help="maximum number of documents to reindex")
+    parser.add_argument("--skip-load", action="store_true", help="measure the corpus left by a previous run")
+    parser.add_argument("--keep", action="store_true", help="keep the corpus for later runs")
+    parser.add_argument("--export", help="write the generated Mongo documents to this JSON lines file and exit")
+    parser.add_argument("--mongo-host", default="localhost")
+    parser.add_argument("--mongo-port", type=int, default=27017)
+    parser.add_argument("--es-url", default="http://localhost:9200")
+    parser.add_argument("--output", help="JSON lines file to append the results to")
+    args = parser.parse_args()
+
+    Logger(debug=False, log_file=None)
+
+    if args.export:
+        with open(args.export, "w", encoding="utf-8") as f, Timer() as timer:
+            for article, translations in generate_articles(args.articles, args.seed):
+                document = {"tag": article.source_prefix, "o_id": article.article_id, "url": article.url,
+                            "time": article.time, "title": {"ko": article.title}, "content": {"ko": article.content}}
+                for language, (title, content) in translations.items():
+                    document["title"][language] = title
+                    document["content"][language] = content
+                f.write(json.dumps(document, ensure_ascii=False) + "\n")
+        report("corpus", [{"case": "generate", "documents": args.articles, "seconds": round(timer.elapsed, 4),
+                           "documents_per_second": round(args.articles / timer.elapsed, 2)}], args.output)
+        return
+
+    es = ElasticsearchClient(args.es_url, index_prefix=BENCH_INDEX_PREFIX)
+    mongo = MongoDBClient(args.mongo_host, args.mongo_port, database=BENCH_DATABASE, es_client=es)
+    if not mongo.ping() or not es.ping():
+        raise SystemExit("MongoDB and Elasticsearch must be running, see compose.yaml")
+
+    results = []
+    try:
+        if not args.skip_load:
+            mongo.client.drop_database(BENCH_DATABASE)
+            mongo.db.articles.create_index([("time", -1)])
+            es.setup_index()
+            with Timer() as timer:
+                loaded = load_corpus(mongo, es, args.articles, args.workers, args.seed)
+            results.append({"case": "load", "documents": loaded, "workers": args.workers,
+                            "seconds": round(timer.elapsed, 4),
+                            "documents_per_second": round(loaded / timer.elapsed, 2)})
+            for language in Article.valid_languages:
+                es.es.indices.refresh(index=f"{BENCH_INDEX_PREFIX}_{language}")
+
+        results += measure(mongo, es, args)
+    finally:
+        if not args.keep:
+            mongo.client.drop_database(BENCH_DATABASE)
+            es.es.indices.delete(index=",".join(f"{BENCH_INDEX_PREFIX}_{language}"
+                                                for language in Article.valid_languages), ignore_unavailable=True)
+
+    report("corpus", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# Measure the formatting stage throughput offline, using the stub client instead of the OpenAI API.
+# python -m bench.formatting --latency 0.5 --concurrency 1 4 16
+import argparse
+
+from bench.utils import Timer, iter_cache_documents, report
+from modules.formatting import NoticeFormatter, StubFormattingClient
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NoticeFormatter throughput with the stub client")
+    parser.add_argument("--articles", type=int, default=200, help="number of cached articles to format")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--latency", type=float, default=0.2, help="maximum stub latency per call in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of failing stub calls")
+    parser.add_argument("--output", help="JSON lines file to append the results to")
+    args = parser.parse_args()
+
+    notices = {(config_key, article_id): content
+               for config_key, article_id, content in iter_cache_documents(args.articles)}
+    results = []
+    for concurrency in args.concurrency:
+        client = StubFormattingClient(latency=args.latency, error_rate=args.error_rate)
+        formatter = NoticeFormatter(async_client=client, max_concurrency=concurrency, backoff=0.01)
+
+        with Timer() as cold:
+            formatted = formatter.run(notices)
+        # Second pass over the same content is answered from the content hash cache
+        with Timer() as warm:
+            formatter.run(notices)
+
+        results.append({
+            "concurrency": concurrency,
+            "articles": len(notices),
+            "formatted": sum(text is not None for text in formatted.values()),
+            "client_calls": client.calls,
+            "seconds": round(cold.elapsed, 4),
+            "articles_per_second": round(len(notices) / cold.elapsed, 2),
+            "cached_seconds": round(warm.elapsed, 4),
+            **formatter.usage.to_dict(),
+        })
+
+    report("formatting", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# Compare the output and speed of HTMLCleaner and LxmlHTMLCleaner on HTML rebuilt from the cached articles.
+# python -m bench.html_cleaner --articles 500 --show-diff 3
+import re
+import random
+import difflib
+import argparse
+
+import markdown
+
+from bench.utils import Timer, iter_cache_documents, report
+from modules.utils import HTMLCleaner, LxmlHTMLCleaner
+
+DOMAIN = "https://www.royalpalace.go.kr"
+
+
+def board_html(content: str, seed: int) -> str:
+    """
+    Render a cached article back to HTML, with the kind of markup the board editors produce:
+    nested wrappers, inline styles, split bold runs, empty paragraphs, scripts and image tables.
+    :param content: markdown of the article
+    :param seed: seed of the random decorations
+    :return: HTML content
+    """
+    rng = random.Random(seed)
+    body = markdown.markdown(content, extensions=["tables"])
+
+    # Tables without a header row, as on the boards
+    if rng.random() < 0.7:
+        body = body.replace("<thead>", "").replace("</thead>", "").replace("<th>", "<td>").replace("</th>", "</td>")
+    body = body.replace("<table>", '<table border="1" cellpadding="0" style="width:100%">')
+
+    # Split some bold runs into adjacent tags, and nest others
+    def split_bold(match):
+        words = match.group(1).split(" ")
+        if len(words) > 1 and rng.random() < 0.5:
+            return " ".join(f"<b>{word}</b>" for word in words)
+        if rng.random() < 0.3:
+            return f"<strong><strong>{match.group(1)}</strong></strong>"
+        return match.group(0)
+
+    body = re.sub(r"<strong>([^<]*)</strong>", split_bold, body)
+
+    paragraphs = []
+    for paragraph in re.split(r"(?<=</p>)\n", body):
+        if paragraph.startswith("<p>") and rng.random() < 0.6:
+            paragraph = paragraph.replace("<p>", '<p style="margin:0"><span style="font-size:10pt">', 1)
+            paragraph = paragraph[:-4] + "</span></p>"
+        paragraphs.append(paragraph)
+        roll = rng.random()
+        if roll < 0.1:
+            paragraphs.append("<p>&nbsp;</p>")
+        elif roll < 0.15:
+            paragraphs.append("<p><span>\u200b</span></p>")
+        elif roll < 0.2:
+            paragraphs.append("<!-- editor break -->")
+
+    if rng.random() < 0.3:
+        paragraphs.append(f'<table><tbody><tr><td><img src="/upload/{seed}.jpg" alt="notice"></td></tr></tbody></table>')
+    if rng.random() < 0.3:
+        paragraphs.append(f'<p><a href="/board/file?id={seed}" onclick="download()">첨부파일</a></p>')
+
+    return '<script type="text/javascript">var view = 1;</script><style>.board_view p { margin: 0; }</style>' \
+           f'<div class="board_view"><div class="content" style="padding:10px">{"".join(paragraphs)}</div></div>'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTMLCleaner vs LxmlHTMLCleaner parity and throughput")
+    parser.add_argument("--articles", type=int, default=500, help="number of cached articles to convert")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs per engine")
+    parser.add_argument("--show-diff", type=int, default=0, help="print the diff of the first N mismatches")
+    parser.add_argument("--output", help="JSON lines file to append the results to")
+    args = parser.parse_args()
+
+    documents = [board_html(content, article_id) for _, article_id, content in iter_cache_documents(args.articles)]
+    total_bytes = sum(len(document.encode("utf-8")) for document in documents)
+
+    outputs = {}
+    results = []
+    for name, engine in (("html.parser", HTMLCleaner), ("lxml", LxmlHTMLCleaner)):
+        best = None
+        for _ in range(args.repeat):
+            converted = []
+            with Timer() as timer:
+                for document in documents:
+                    try:
+                        converted.append(engine().html_to_markdown(document, DOMAIN))
+                    except Exception as e:
+                        converted.append(f"<error: {e}>")
+            best = timer.elapsed if best is None else min(best, timer.elapsed)
+        outputs[name] = converted
+        results.append({
+            "engine": name,
+            "documents": len(documents),
+            "seconds": round(best, 4),
+            "documents_per_second": round(len(documents) / best, 2),
+            "mb_per_second": round(total_bytes / best / 1e6, 3),
+        })
+
+    mismatches = [i for i, (old, new) in enumerate(zip(outputs["html.parser"], outputs["lxml"])) if old != new]
+    for row in results:
+        row["speedup"] = round(results[0]["seconds"] / row["seconds"], 2)
+        row["identical_output"] = len(documents) - len(mismatches)
+    report("html_cleaner", results, args.output)
+
+    for i in mismatches[:args.show_diff]:
+        print(f"--- document {i}")
+        print("\n".join(difflib.unified_diff(outputs["html.parser"][i].splitlines(), outputs["lxml"][i].splitlines(),
+                                             "html.parser", "lxml", lineterm="")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# Measure the import time of the entry points. Only the top-level import statements of each script are run,
+# so setup.py does not reindex and crawl.py does not start a browser.
+# python -m bench.imports --repeat 5
+import ast
+import sys
+import argparse
+import statistics
+import subprocess
+from typing import Optional
+
+from bench.utils import report
+
+SCRIPTS = ("main.py", "setup.py", "crawl.py")
+
+
+def import_statements(script: str) -> str:
+    """
+    Extract the top-level import statements of a script.
+    :param script: path of the script
+    :return: source code of the import statements
+    """
+    with open(script, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def measure(source: str) -> tuple[Optional[int], list[tuple[str, int]], str]:
+    """
+    Run the import statements in a fresh interpreter with `-X importtime`.
+    :param source: import statements
+    :return: (total microseconds or None on failure, [(module, cumulative microseconds)], error message)
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", source], capture_output=True, text=True)
+    modules = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            modules.append((name.rstrip(), int(cumulative)))
+
+    if process.returncode != 0:
+        return None, modules, process.stderr.strip().splitlines()[-1]
+    # Top-level modules are the ones that are not indented
+    total = sum(cumulative for name, cumulative in modules if not name.startswith("  "))
+    return total, modules, ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time of the back-end entry points")
+    parser.add_argument("scripts", nargs="*", default=SCRIPTS, help="scripts, or module names like modules.db")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help="number of slowest top-level imports to report")
+    parser.add_argument("--output", help="JSON lines file to append the results to")
+    args = parser.parse_args()
+
+    results = []
+    for script in args.scripts:
+        source = import_statements(script) if script.endswith(".py") else f"import {script}"
+        totals = []
+        modules, error = [], ""
+        for _ in range(args.repeat):
+            total, modules, error = measure(source)
+            if total is None:
+                break
+            totals.append(total)
+
+        row = {"script": script}
+        if error:
+            row["error"] = error
+        else:
+            row["median_ms"] = round(statistics.median(totals) / 1000, 2)
+            row["min_ms"] = round(min(totals) / 1000, 2)
+        slowest = sorted((item for item in modules if not item[0].startswith("  ")), key=lambda item: -item[1])
+        row["slowest"] = {name.strip(): round(cumulative / 1000, 2) for name, cumulative in slowest[:args.top]}
+        results.append(row)
+
+    report("imports", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Compare the embedded and split storage layouts of the article contents (see MongoDBClient) on a synthetic
+# five-language corpus: feed and article read latency, WiredTiger cache hit ratio during the reads, and collection
+# sizes. The corpus is loaded with the embedded layout, measured, converted with modules.layout, and measured again.
+# The cache hit ratio only differs once the corpus is larger than the WiredTiger cache, e.g. with the mongo container
+# started with --wiredTigerCacheSizeGB 0.25.
+# python -m bench.layout --articles 20000 --reads 2000
+import random
+import argparse
+
+from bench.corpus import load_corpus
+from bench.services import BENCH_DATABASE, BENCH_INDEX_PREFIX
+from bench.utils import load, report
+from modules.db import MongoDBClient, ElasticsearchClient
+from modules.layout import layout_status, split_contents
+from modules.models import Article
+from modules.log_manager import Logger
+
+
+def cache_counters(mongo: MongoDBClient) -> tuple[int, int]:
+    """
+    :return: (pages requested from the WiredTiger cache, pages read into the cache from disk)
+    """
+    cache = mongo.client.admin.command("serverStatus")["wiredTiger"]["cache"]
+    return cache["pages requested from the cache"], cache["pages read into cache"]
+
+
+def measure(mongo: MongoDBClient, layout: str, args) -> list[dict]:
+    generator = random.Random(args.seed)
+    mongo_ids = [str(document["_id"]) for document in mongo.db.articles.find({}, {"_id": 1})]
+    feed_cursors = [None] + [generator.choice(mongo_ids) for _ in range(args.reads // 20)]
+    reads = [(generator.choice(mongo_ids), generator.choice(Article.valid_languages)) for _ in range(args.reads)]
+
+    requested, read = cache_counters(mongo)
+    results = [
+        {"case": "feed", "layout": layout,
+         **load(lambda cursor: mongo.get_latest_article("ko", cursor, 20), feed_cursors, args.concurrency)},
+        {"case": "article", "layout": layout,
+         **load(lambda entry: mongo.get_article_from_id(*entry), reads, args.concurrency)},
+    ]
+    requested_after, read_after = cache_counters(mongo)
+    requests = requested_after - requested
+    results.append({"case": "cache", "layout": layout, "pages_requested": requests,
+                    "pages_read": read_after - read,
+                    "hit_ratio": round(1 - (read_after - read) / requests, 4) if requests else None})
+    results.append({"case": "size", "layout": layout, **layout_status(mongo)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedded and split storage layouts of the article contents")
+    parser.add_argument("--articles", type=int, default=20000, help="size of the corpus")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=8, help="threads loading the corpus")
+    parser.add_argument("--reads", type=int, default=2000, help="number of article reads per layout")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--mongo-host", default="localhost")
+    parser.add_argument("--mongo-port", type=int, default=27017)
+    parser.add_argument("--es-url", default="http://localhost:9200")
+    parser.add_argument("--output", help="JSON lines file to append the results to")
+    args = parser.parse_args()
+
+    Logger(debug=False, log_file=None)
+    es = ElasticsearchClient(args.es_url, index_prefix=BENCH_INDEX_PREFIX)
+    mongo = MongoDBClient(args.mongo_host, args.mongo_port, database=BENCH_DATABASE, es_client=es)
+    if not mongo.ping() or not es.ping():
+        raise SystemExit("MongoDB and Elasticsearch must be running, see compose.yaml")
+
+    results = []
+    try:
+        mongo.client.drop_database(BENCH_DATABASE)
+        mongo.db.articles.create_index([("time", -1)])
+        es.setup_index()
+        load_corpus(mongo, es, args.articles, args.workers, args.seed)
+        results += measure(mongo, "embedded", args)
+
+        split_contents(mongo)
+        results += measure(mongo, "split", args)
+    finally:
+        mongo.client.drop_database(BENCH_DATABASE)
+        es.es.indices.delete(index=",".join(f"{BENCH_INDEX_PREFIX}_{language}"
+                                            for language in Article.valid_languages), ignore_unavailable=True)
+
+    report("layout", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# Cost of a log call on the calling thread, with the synchronous and the queued handlers, and of filtered
+# debug calls with f-strings against lazy %-style arguments.
+# python -m bench.log_manager --records 20000
+import os
+import sys
+import argparse
+import tempfile
+
+from bench.utils import Timer, report
+from modules.log_manager import Logger, log
+from modules.models import PreviewItem
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Logging overhead on the calling thread")
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--output", help="JSON lines file to append the results to")
+    args = parser.parse_args()
+
+    item = PreviewItem(article_id=1, title="title", url="https://example.com", time="2023-12-01")
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        log_file = os.path.join(directory, "bench.log")
+        for json_format in (False, True):
+            for asynchronous in (False, True):
+                # Send the console output to the void, the file handler receives every record in debug mode
+                with open(os.devnull, "w") as devnull:
+                    stderr, sys.stderr = sys.stderr, devnull
+                    Logger(debug=True, log_file=log_file, json_format=json_format, asynchronous=asynchronous)
+                    with Timer() as timer:
+                        for i in range(args.records):
+                            log.info("Inserting: %s", i)
+                    Logger.reset()
+                    sys.stderr = stderr
+                results.append({"case": "info", "json": json_format, "asynchronous": asynchronous,
+                                "records": args.records, "us_per_call": round(timer.elapsed / args.records * 1e6, 2)})
+
+        Logger(debug=False, log_file=None)
+        with Timer() as eager:
+            for _ in range(args.records):
+                log.debug(f"Invalid row: {item}")
+        with Timer() as lazy:
+            for _ in range(args.records):
+                log.debug("Invalid row: %s", item)
+        Logger.reset()
+        results.append({"case": "filtered_fstring", "records": args.records,
+                        "us_per_call": round(eager.elapsed / args.records * 1e6, 2)})
+        results.append({"case": "filtered_lazy", "records": args.records,
+                        "us_per_call": round(lazy.elapsed / args.records * 1e6, 2)})
+
+    report("logging", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
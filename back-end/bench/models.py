@@ -0,0 +1,107 @@
+# Measure the construction and serialization of 10k articles, with validation and from MongoDB documents,
+# against the original dict-backed model.
+# python -m bench.models --count 10000
+import re
+import argparse
+from datetime import datetime
+from typing import Optional
+
+from bson import ObjectId
+
+from bench.utils import Timer, report
+from modules.models import Article
+
+
+class ReferenceArticle:
+    """
+    Original dict-backed Article, kept as the reference.
+    """
+    valid_languages = ["ko", "en", "ja", "zh", "es"]
+
+    def __init__(self, source_prefix: str, article_id: int, source_url: str, title: str, time: str, content: str,
+                 language: str = "ko", mongo_id: Optional[str] = None):
+        if source_prefix and source_prefix not in ["cdg", "cgg", "dsg-e", "dsg-n", "gbg", "jm", "rt-n", "rt-e"]:
+            raise ValueError("Invalid source prefix.")
+        if not article_id or not isinstance(article_id, int) or article_id < 1:
+            raise ValueError(f"Invalid article ID. It must be a positive integer: {article_id}")
+        if not time or not re.match(r"^\d{4}-\d{2}-\d{2}$", time):
+            raise ValueError(f"Invalid time. It must be in the YYYY-MM-DD format: {time}")
+        if not language or language not in self.valid_languages:
+            raise ValueError(f"Invalid language: {language}")
+
+        self.source_prefix = source_prefix
+        self.article_id = article_id
+        self.url = source_url
+        self.title = title
+        self.time = time
+        self.content = content
+        self.language = language
+        self.mongo_id = mongo_id
+
+    def to_dict(self) -> dict:
+        result = {
+            "source_prefix": self.source_prefix,
+            "article_id": self.article_id,
+            "source_url": self.url,
+            "title": self.title,
+            "time": self.time,
+            "content": self.content,
+            "language": self.language,
+        }
+        if self.mongo_id:
+            result["id"] = self.mongo_id
+        return result
+
+
+def mongo_documents(count: int) -> list[dict]:
+    return [{
+        "_id": ObjectId(),
+        "tag": "gbg",
+        "o_id": i + 1,
+        "url": f"https://www.royalpalace.go.kr/content/board/view.asp?seq={i + 1}",
+        "time": datetime(2023, 1 + i % 12, 1 + i % 28),
+        "title": {"ko": f"[경복궁] 공지 {i}", "en": f"[Gyeongbokgung] Notice {i}"},
+        "content": {"ko": "본문 " * 50, "en": "Body " * 50},
+    } for i in range(count)]
+
+
+def from_mongo_reference(document: dict, language: str) -> ReferenceArticle:
+    """Construction done by MongoDBClient before Article.from_mongo."""
+    return ReferenceArticle(document['tag'], document["o_id"], document['url'], document['title'][language],
+                            document['time'].strftime('%Y-%m-%d'), document['content'][language], language,
+                            str(document['_id']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Article construction and serialization")
+    parser.add_argument("--count", type=int, default=10000, help="number of articles per run")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timed runs")
+    parser.add_argument("--output", help="JSON lines file to append the results to")
+    args = parser.parse_args()
+
+    documents = mongo_documents(args.count)
+    fields = [(document["tag"], document["o_id"], document["url"], document["title"]["ko"],
+               document["time"].strftime('%Y-%m-%d'), document["content"]["ko"]) for document in documents]
+
+    cases = {
+        "reference_init": lambda: [ReferenceArticle(*row).to_dict() for row in fields],
+        "init": lambda: [Article(*row).to_dict() for row in fields],
+        "reference_from_mongo": lambda: [from_mongo_reference(document, "en").to_dict() for document in documents],
+        "from_mongo": lambda: [Article.from_mongo(document, "en").to_dict() for document in documents],
+    }
+
+    results = []
+    for name, case in cases.items():
+        best = None
+        for _ in range(args.repeat):
+            with Timer() as timer:
+                case()
+            best = timer.elapsed if best is None else min(best, timer.elapsed)
+        results.append({"case": name, "articles": args.count, "seconds": round(best, 4),
+                        "microseconds_per_article": round(best / args.count * 1e6, 2)})
+
+    report("models", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# Measure GungCrawler.parse_table on board list pages rebuilt from the cached articles, for every site config.
+# The pages are parsed with lxml behind the small subset of the WebElement API that parse_table uses, so the
+# numbers measure the parsing logic rather than the WebDriver round trips.
+# python -m bench.parse_table --pages 200
+import json
+import argparse
+
+import lxml.html
+from selenium.webdriver.common.by import By
+
+from bench.utils import Timer, iter_cache_documents, report
+from crawl import GungCrawler
+
+
+class FixtureElement:
+    """
+    lxml element answering the WebElement calls made by parse_table.
+    """
+
+    def __init__(self, element):
+        self.element = element
+
+    def find_elements(self, by: str, value: str) -> list["FixtureElement"]:
+        if by == By.TAG_NAME:
+            return [FixtureElement(element) for element in self.element.iterdescendants(value)]
+        if by == By.XPATH:
+            return [FixtureElement(element) for element in self.element.xpath(value)]
+        raise ValueError(f"Unsupported locator: {by}")
+
+    def find_element(self, by: str, value: str) -> "FixtureElement":
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise LookupError(f"No element found: {value}")
+        return elements[0]
+
+    @property
+    def text(self) -> str:
+        return self.element.text_content().strip()
+
+    def get_attribute(self, name: str):
+        return self.element.get(name)
+
+
+def board_page(config: dict, rows: list[tuple[int, str]]) -> FixtureElement:
+    """
+    Build the tbody of a board list page with the columns of the site config.
+    :param config: site config (config.json entry)
+    :param rows: list of (article id, title)
+    :return: tbody element
+    """
+    cells = {
+        "": lambda article_id, title: "<td>관리자</td>",
+        "article_id": lambda article_id, title: f"<td>{article_id}</td>",
+        "title_url": lambda article_id, title: f'<td><a href="{config["domain"]}/board/view?id={article_id}">'
+                                               f'{title}</a></td>',
+        "title_js_url": lambda article_id, title: f'<td><a href="javascript:fn_egov_inqire_notice(\'{article_id}\');">'
+                                                  f'{title}</a></td>',
+        "date": lambda article_id, title: "<td>2023-12-01</td>",
+    }
+    body = "".join("<tr>" + "".join(cells[column](article_id, title) for column in config["table_column"]) + "</tr>"
+                   for article_id, title in rows)
+    table = lxml.html.fromstring(f"<table><tbody>{body}</tbody></table>")
+    return FixtureElement(table.find("tbody"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="parse_table throughput on recorded board pages")
+    parser.add_argument("--pages", type=int, default=200, help="number of list pages per site")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="JSON lines file to append the results to")
+    args = parser.parse_args()
+
+    with open("config.json") as f:
+        configs = json.load(f)
+
+    titles = [content.strip().split("\n", 1)[0].strip("#* ")[:80] for _, _, content in iter_cache_documents(500)]
+    results = []
+    for config_key, config in configs.items():
+        # The crawler is only used for its config, no browser is started
+        crawler = GungCrawler.__new__(GungCrawler)
+        crawler.config = config
+
+        per_page = config["articles_per_page"]
+        pages = [board_page(config, [(page * per_page + i + 1, titles[(page * per_page + i) % len(titles)])
+                                     for i in range(per_page)])
+                 for page in range(args.pages)]
+
+        best = None
+        rows = 0
+        for _ in range(args.repeat):
+            with Timer() as timer:
+                rows = sum(len(crawler.parse_table(page, config["table_column"])) for page in pages)
+            best = timer.elapsed if best is None else min(best, timer.elapsed)
+
+        results.append({"case": config_key, "pages": args.pages, "rows": rows, "seconds": round(best, 4),
+                        "rows_per_second": round(rows / best, 2)})
+
+    report("parse_table", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
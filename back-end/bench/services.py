@@ -0,0 +1,97 @@
+# Measure ingest and reindex throughput, search and autocomplete QPS, and the feed and article queries against the
+# MongoDB and Elasticsearch containers of compose.yaml (docker-compose up -d mongo elasticsearch).
+# The cached articles are loaded into a separate database and separate indexes, which are dropped at the end.
+# python -m bench.services --articles 1000 --concurrency 1 4 16
+import random
+import argparse
+
+from bench.utils import Timer, cache_articles, load, report
+from modules.db import MongoDBClient, ElasticsearchClient
+from modules.models import Article
+from modules.log_manager import Logger
+from modules import metrics
+
+BENCH_DATABASE = "articles_bench"
+BENCH_INDEX_PREFIX = "articles_bench"
+
+
+def query_words(articles: list[Article], count: int, seed: int = 0) -> list[str]:
+    """
+    Pick search queries from the words of the article titles.
+    """
+    words = [word for article in articles for word in article.title.split() if len(word) > 1]
+    generator = random.Random(seed)
+    return [generator.choice(words) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MongoDB and Elasticsearch hot paths on the compose containers")
+    parser.add_argument("--articles", type=int, default=1000, help="number of cached articles to load")
+    parser.add_argument("--queries", type=int, default=500, help="number of calls per case and concurrency")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--mongo-host", default="localhost")
+    parser.add_argument("--mongo-port", type=int, default=27017)
+    parser.add_argument("--es-url", default="http://localhost:9200")
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark database and indexes")
+    parser.add_argument("--output", help="JSON lines file to append the results to")
+    args = parser.parse_args()
+
+    Logger(debug=False, log_file=None)
+    es = ElasticsearchClient(args.es_url, index_prefix=BENCH_INDEX_PREFIX)
+    mongo = MongoDBClient(args.mongo_host, args.mongo_port, database=BENCH_DATABASE, es_client=es)
+    if not mongo.ping() or not es.ping():
+        raise SystemExit("MongoDB and Elasticsearch must be running, see compose.yaml")
+
+    articles = cache_articles(args.articles)
+    results = []
+    try:
+        mongo.client.drop_database(BENCH_DATABASE)
+        es.setup_index()
+
+        # Ingest: Mongo upsert and ES index of every article, as the crawler does
+        with Timer() as timer:
+            inserted = sum(mongo.insert_article(article) is not None for article in articles)
+        results.append({"case": "ingest", "documents": inserted, "seconds": round(timer.elapsed, 4),
+                        "documents_per_second": round(inserted / timer.elapsed, 2)})
+
+        # Reindex: rebuild the ES documents from Mongo, as setup.py does
+        documents = list(mongo.db.articles.find({}))
+        with Timer() as timer:
+            for document in documents:
+                es.insert_article(Article.from_mongo(document), document["_id"])
+        results.append({"case": "reindex", "documents": len(documents), "seconds": round(timer.elapsed, 4),
+                        "documents_per_second": round(len(documents) / timer.elapsed, 2)})
+        es.es.indices.refresh(index=f"{BENCH_INDEX_PREFIX}_ko")
+
+        mongo_ids = [str(document["_id"]) for document in documents]
+        queries = query_words(articles, args.queries)
+        generator = random.Random(1)
+        feed_cursors = [None] + [generator.choice(mongo_ids) for _ in range(args.queries - 1)]
+        cases = {
+            "search": (lambda query: es.search_articles(query, "ko"), queries),
+            "autocomplete": (lambda query: es.autocomplete(query[:2], "ko"), queries),
+            "feed": (lambda cursor: mongo.get_latest_summaries("ko", cursor, 20), feed_cursors),
+            # Former feed query, returning the full articles
+            "feed_full": (lambda cursor: mongo.get_latest_article("ko", cursor, 20), feed_cursors),
+            "article": (lambda mongo_id: mongo.get_article_from_id(mongo_id, "ko"),
+                        [generator.choice(mongo_ids) for _ in range(args.queries)]),
+        }
+        for name, (function, arguments) in cases.items():
+            for concurrency in args.concurrency:
+                results.append({"case": name, **load(function, arguments, concurrency)})
+
+        # Share of the searches answered by the exact query, without the fuzzy fallback
+        results.append({"case": "search_tiers",
+                        **{tier: metrics.search_tiers.get(tier) for tier in ("exact", "fuzzy")}})
+    finally:
+        if not args.keep:
+            mongo.client.drop_database(BENCH_DATABASE)
+            # Wildcard deletions are refused by default (action.destructive_requires_name)
+            es.es.indices.delete(index=",".join(f"{BENCH_INDEX_PREFIX}_{language}"
+                                                for language in Article.valid_languages), ignore_unavailable=True)
+
+    report("services", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
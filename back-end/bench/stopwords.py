@@ -0,0 +1,64 @@
+# Compare the stopword filter against the original per-word substring scan, with the shipped stopword list
+# and with larger generated lists.
+# python -m bench.stopwords --sizes 8 1000 5000
+import random
+import argparse
+
+from bench.utils import Timer, iter_cache_documents, report
+from modules.utils import StopwordFilter, get_stopword_filter
+
+
+def reference_no_stopword(text: str, stopwords: list[str]) -> bool:
+    """
+    Original implementation of no_stopword.
+    """
+    for word in stopwords:
+        if word in text:
+            return False
+    return True
+
+
+def generated_stopwords(documents: list[str], size: int, seed: int = 0) -> list[str]:
+    """
+    Sample words of the corpus as additional stopwords, so the list has realistic shared prefixes.
+    """
+    rng = random.Random(seed)
+    vocabulary = sorted({word for document in documents for word in document.split() if len(word) > 1})
+    return rng.sample(vocabulary, min(size, len(vocabulary)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stopword filter throughput")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000],
+                        help="sizes of the generated stopword lists, on top of the shipped list")
+    parser.add_argument("--output", help="JSON lines file to append the results to")
+    args = parser.parse_args()
+
+    documents = [content for _, _, content in iter_cache_documents()]
+    shipped = get_stopword_filter().words
+
+    lists = [shipped] + [shipped + generated_stopwords(documents, size) for size in args.sizes]
+    results = []
+    for stopwords in lists:
+        with Timer() as build:
+            stopword_filter = StopwordFilter(stopwords)
+        with Timer() as filtered:
+            matches = [stopword_filter.find(document) is None for document in documents]
+        with Timer() as reference:
+            expected = [reference_no_stopword(document, stopwords) for document in documents]
+
+        results.append({
+            "stopwords": len(stopword_filter),
+            "documents": len(documents),
+            "build_seconds": round(build.elapsed, 4),
+            "filter_seconds": round(filtered.elapsed, 4),
+            "reference_seconds": round(reference.elapsed, 4),
+            "speedup": round(reference.elapsed / filtered.elapsed, 2),
+            "mismatches": sum(a != b for a, b in zip(matches, expected)),
+        })
+
+    report("stopwords", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
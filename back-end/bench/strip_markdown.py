@@ -0,0 +1,67 @@
+# Compare strip_markdown against the original implementation on the cached articles (golden corpus),
+# and measure the throughput of both.
+# python -m bench.strip_markdown --repeat 5
+import re
+import argparse
+from typing import Union
+
+from bench.utils import Timer, iter_cache_documents, report
+from modules.utils import strip_markdown
+
+
+def reference_strip_markdown(md_string: str) -> Union[str, None]:
+    """
+    Original implementation of strip_markdown, kept as the reference output.
+    """
+    if md_string is None:
+        return None
+
+    md_string = re.sub(r'!\[.*?]\(.*?\)', '', md_string)
+    md_string = re.sub(r'\[(.*?)]\(.*?\)', r'\1', md_string)
+    md_string = re.sub(r'\*\*(.*?)\*\*|\*(.*?)\*|__(.*?)__|_(.*?)_', r'\1\2\3\4', md_string)
+    md_string = re.sub(r'`{1,3}(.*?)`{1,3}', r'\1', md_string)
+    md_string = re.sub(r'~~(.*?)~~', r'\1', md_string)
+    md_string = re.sub(r'(?m)^\s*#{1,6}\s*', '', md_string)
+    md_string = re.sub(r'^\s*[*+-]\s', '', md_string, flags=re.MULTILINE)
+    md_string = re.sub(r'\|', '\n', md_string)
+    md_string = re.sub(r'(\n-{3,})+', '\n', md_string)
+    md_string = '\n'.join([line.strip() for line in md_string.splitlines() if line.strip()])
+    return md_string
+
+
+def main():
+    parser = argparse.ArgumentParser(description="strip_markdown parity and throughput")
+    parser.add_argument("--articles", type=int, default=None, help="number of cached articles (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timed runs per implementation")
+    parser.add_argument("--output", help="JSON lines file to append the results to")
+    args = parser.parse_args()
+
+    documents = [content for _, _, content in iter_cache_documents(args.articles)]
+    megabytes = sum(len(document.encode("utf-8")) for document in documents) / 1e6
+
+    mismatches = sum(strip_markdown(document) != reference_strip_markdown(document) for document in documents)
+
+    results = []
+    for name, function in (("reference", reference_strip_markdown), ("strip_markdown", strip_markdown)):
+        best = None
+        for _ in range(args.repeat):
+            with Timer() as timer:
+                for document in documents:
+                    function(document)
+            best = timer.elapsed if best is None else min(best, timer.elapsed)
+        results.append({
+            "implementation": name,
+            "documents": len(documents),
+            "megabytes": round(megabytes, 3),
+            "seconds": round(best, 4),
+            "mb_per_second": round(megabytes / best, 2),
+            "mismatches": mismatches,
+        })
+
+    for row in results:
+        row["speedup"] = round(results[0]["seconds"] / row["seconds"], 2)
+    report("strip_markdown", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# Measure the ArticleTranslationScript throughput offline, using the stub translation provider.
+# python -m bench.translation --latency 0.05 --error-rate 0.02 --workers 1 4 16
+import argparse
+from typing import Optional
+
+from bench.utils import Timer, cache_articles, report
+from modules.models import Article
+from modules.translate import ArticleTranslationScript, StubProvider
+
+
+class MemoryArticleStore:
+    """In-memory replacement of MongoDBClient, implementing what ArticleTranslationScript needs."""
+
+    def __init__(self, articles: list[Article]):
+        self.articles = {str(i): article for i, article in enumerate(articles)}
+        self.translations = {}
+
+    def get_article_from_id(self, mongo_id: str, language: str = 'ko') -> Optional[Article]:
+        return self.articles.get(mongo_id)
+
+    def add_language(self, language: str, article: Article, mongo_id: str) -> bool:
+        self.translations[(mongo_id, language)] = article
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ArticleTranslationScript throughput with the stub provider")
+    parser.add_argument("--articles", type=int, default=200, help="number of cached articles to translate")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--latency", type=float, default=0.05, help="stub latency per call in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02, help="maximum extra stub latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of failing stub calls")
+    parser.add_argument("--output", help="JSON lines file to append the results to")
+    args = parser.parse_args()
+
+    articles = cache_articles(args.articles)
+    results = []
+    for workers in args.workers:
+        provider = StubProvider(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+        store = MemoryArticleStore(articles)
+        script = ArticleTranslationScript(provider=provider, target_lang="es", db_manager=store)
+
+        with Timer() as timer:
+            translated = script.run(num_workers=workers, article_ids=list(store.articles))
+
+        results.append({
+            "workers": workers,
+            "articles": len(articles),
+            "translated": translated,
+            "provider_calls": provider.calls,
+            "provider_errors": provider.errors,
+            "seconds": round(timer.elapsed, 4),
+            "articles_per_second": round(len(articles) / timer.elapsed, 2),
+        })
+
+    report("translation", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# Shared helpers for the benchmark scripts. Run the benchmarks from the back-end directory, e.g.
+# python -m bench.translation
+import os
+import json
+import time
+import platform
+import functools
+import itertools
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Optional
+
+from modules.cache_store import ArticleCacheStore
+from modules.models import Article
+
+CACHE_DIR = "cache"
+CACHE_STORE = "articles.sqlite3"  # packed cache store, inside CACHE_DIR
+
+
+def iter_cache_documents(limit: Optional[int] = None, cache_dir: str = CACHE_DIR) -> Iterator[tuple[str, int, str]]:
+    """
+    Iterate through the formatted articles of the packed cache store, in storage order. Falls back to the
+    `{site}/{id}.md` files of the cache folder when it was not migrated to the store yet.
+    :param limit: maximum number of documents to yield
+    :param cache_dir: path of the cache folder
+    :return: iterator of (config key, article id, markdown content)
+    """
+    store_path = os.path.join(cache_dir, CACHE_STORE)
+    if os.path.exists(store_path):
+        with ArticleCacheStore(store_path) as store:
+            if store.count():
+                yield from itertools.islice(store.iter_articles(), limit)
+                return
+
+    yield from itertools.islice(iter_cache_files(cache_dir), limit)
+
+
+def iter_cache_files(cache_dir: str = CACHE_DIR) -> Iterator[tuple[str, int, str]]:
+    """
+    Iterate through the legacy `{site}/{id}.md` files of the cache folder, in (site, article id) order.
+    """
+    for config_key in sorted(os.listdir(cache_dir)):
+        site_dir = os.path.join(cache_dir, config_key)
+        if not os.path.isdir(site_dir):
+            continue
+
+        file_names = [name for name in os.listdir(site_dir) if name.endswith(".md") and name[:-3].isdigit()]
+        for file_name in sorted(file_names, key=lambda name: int(name[:-3])):
+            with open(os.path.join(site_dir, file_name), "r", encoding="utf-8") as f:
+                yield config_key, int(file_name[:-3]), f.read()
+
+
+def cache_articles(limit: Optional[int] = None, cache_dir: str = CACHE_DIR) -> list[Article]:
+    """
+    Build Article objects from the cached articles. The cache only holds the content, so the title is
+    taken from the first line of the article.
+    :param limit: maximum number of articles
+    :param cache_dir: path of the cache folder
+    :return: list of Article objects
+    """
+    with open("config.json") as f:
+        config = json.load(f)
+
+    articles = []
+    for config_key, article_id, content in iter_cache_documents(limit, cache_dir):
+        title = content.strip().split("\n", 1)[0].strip("#* ")[:80] or str(article_id)
+        articles.append(Article(source_prefix=config[config_key]["source_prefix"], article_id=article_id,
+                                source_url=config[config_key]["domain"], title=title, time="2023-12-01",
+                                content=content))
+    return articles
+
+
+class Timer:
+    """Context manager measuring the wall time of a block in seconds."""
+
+    def __init__(self):
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.elapsed = time.perf_counter() - self._start
+
+
+@functools.lru_cache(maxsize=None)
+def git_commit() -> Optional[str]:
+    """
+    Short hash of the checked out commit, recorded with the results to compare versions.
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentiles(durations: list[float]) -> dict:
+    """
+    Latency summary of a list of durations in seconds.
+    :return: dictionary with the p50, p95, p99 and max in milliseconds
+    """
+    durations = sorted(durations)
+    if not durations:
+        return {}
+
+    def nearest_rank(fraction: float) -> float:
+        return durations[min(len(durations) - 1, max(0, round(fraction * len(durations) + 0.5) - 1))]
+
+    return {
+        "p50_ms": round(nearest_rank(0.5) * 1000, 2),
+        "p95_ms": round(nearest_rank(0.95) * 1000, 2),
+        "p99_ms": round(nearest_rank(0.99) * 1000, 2),
+        "max_ms": round(durations[-1] * 1000, 2),
+    }
+
+
+def load(function: Callable, arguments: Iterable, concurrency: int) -> dict:
+    """
+    Call a function once per argument from `concurrency` threads, and summarize the latency and throughput.
+    :param function: function to call, with a single argument
+    :param arguments: arguments of the calls
+    :param concurrency: number of threads
+    :return: dictionary with the number of calls and errors, the calls per second and the latency percentiles
+    """
+    def timed_call(argument):
+        start = time.perf_counter()
+        try:
+            function(argument)
+            return time.perf_counter() - start, False
+        except Exception:
+            return time.perf_counter() - start, True
+
+    arguments = list(arguments)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor, Timer() as timer:
+        outcomes = list(executor.map(timed_call, arguments))
+
+    return {
+        "concurrency": concurrency,
+        "calls": len(outcomes),
+        "errors": sum(failed for _, failed in outcomes),
+        "calls_per_second": round(len(outcomes) / timer.elapsed, 2),
+        **percentiles([duration for duration, _ in outcomes]),
+    }
+
+
+def report(benchmark: str, results: list[dict], output: Optional[str] = None) -> None:
+    """
+    Print the results of a benchmark as JSON lines, and optionally append them to a file.
+    :param benchmark: name of the benchmark
+    :param results: list of result rows
+    :param output: path of a JSON lines file to append the results to
+    """
+    lines = []
+    for row in results:
+        entry = {"benchmark": benchmark, "python": platform.python_version(), "commit": git_commit(), **row}
+        lines.append(json.dumps(entry, ensure_ascii=False))
+
+    print("\n".join(lines))
+    if output:
+        with open(output, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
@@ -1,15 +1,21 @@
 import os
 import time
 import json
+import argparse
 from typing import Union
 from selenium.webdriver.common.by import By
 from selenium.webdriver.remote.webelement import WebElement
 
 from modules.log_manager import Logger, log
-from modules.utils import HTMLCleaner, no_stopword
+from modules.utils import LxmlHTMLCleaner, find_stopword
 from modules.browser import BaseCrawler
 from modules.models import *
-from modules.formatting import format_notice
+from modules.formatting import NoticeFormatter, content_hash
+from modules.conversion import ConversionPool
+from modules.cache_store import ArticleCacheStore
+from modules.db import MongoDBClient, ElasticsearchClient
+from modules.related import RelatedArticles
+from modules import tracing
 
 
 class GungCrawler(BaseCrawler):
@@ -26,6 +32,7 @@ class GungCrawler(BaseCrawler):
         self.config = self.load_config(config_key)
         self.config_key = config_key
         self.last_article_id_cache = None
+        self.cache_store = None
 
     @staticmethod
     def load_config(config_key):
@@ -36,6 +43,12 @@ class GungCrawler(BaseCrawler):
     def get_config_key(self) -> str:
         return self.config_key
 
+    def close_driver(self) -> None:
+        super().close_driver()
+        if self.cache_store is not None:
+            self.cache_store.close()
+            self.cache_store = None
+
     def parse_table(self, table_object: WebElement, column_type: list) -> list[PreviewItem]:
         """
         Iterate through the rows of the table and parse the data.
@@ -89,7 +102,7 @@ class GungCrawler(BaseCrawler):
                     if col_type == "date":
                         rowitem.set_time(columns[i].text)
                 except Exception as e:
-                    log.debug(f"Invalid row. Error: {e}")
+                    log.debug("Invalid row. Error: %s", e)
                     break
             if rowitem.is_valid():
                 table_data.append(rowitem)
@@ -136,9 +149,10 @@ class GungCrawler(BaseCrawler):
         if page > self.last_page_number():
             raise ValueError("Page number is out of bounds")
 
-        self.get(self.config["url"] + str(page))
-        list_table = self.element_from_xpath(self.config["table"])
-        return self.parse_table(list_table, self.config["table_column"])
+        with tracing.span("list_fetch"):
+            self.get(self.config["url"] + str(page))
+            list_table = self.element_from_xpath(self.config["table"])
+            return self.parse_table(list_table, self.config["table_column"])
 
     def fetch_article_list_range(self, page_start: int = 1, page_end: int = None) -> list[PreviewItem]:
         """
@@ -225,6 +239,17 @@ class GungCrawler(BaseCrawler):
 
         return master_list
 
+    def get_article_html(self, url: str, load_page: bool = True) -> str:
+        """
+        Get the raw HTML of the article container
+        :param url: url of the article
+        :param load_page: if True, load the page before getting the article body
+        :return: innerHTML of the article container
+        """
+        if load_page:
+            self.get(url)
+        return self.element_from_xpath(self.config["article_container"]).get_attribute("innerHTML")
+
     def get_article_body(self, url: str, load_page: bool = True) -> str:
         """
         Get the article body from the url with the minimal HTML structure
@@ -232,12 +257,9 @@ class GungCrawler(BaseCrawler):
         :param load_page: if True, load the page before getting the article body
         :return: article body in minimal HTML structure
         """
-        if load_page:
-            self.get(url)
-        # get innerHTML and textContent of the article container
-        article_html = self.element_from_xpath(self.config["article_container"]).get_attribute("innerHTML")
-        # Clean HTML using HTMLCleaner
-        clean_html = HTMLCleaner().html_to_markdown(article_html, self.config["domain"])
+        article_html = self.get_article_html(url, load_page)
+        # Clean HTML using LxmlHTMLCleaner
+        clean_html = LxmlHTMLCleaner().html_to_markdown(article_html, self.config["domain"])
         return clean_html
 
     def get_article(self, item: PreviewItem, load_page: bool = True) -> Article:
@@ -247,33 +269,71 @@ class GungCrawler(BaseCrawler):
         :param load_page: if True, load the page before getting the article body
         :return: Article object
         """
-        article_body = self.get_article_body(item.url, load_page)
+        article_html = self.get_article_html(item.url, load_page)
+        with tracing.span("clean", tracing.article_key(self.config["source_prefix"], item.article_id)):
+            article_body = LxmlHTMLCleaner().html_to_markdown(article_html, self.config["domain"])
 
         return Article(source_prefix=self.config["source_prefix"], article_id=item.article_id, source_url=item.url,
                        title=item.title, time=item.time, content=article_body)
 
-    def get_articles(self, items: list[PreviewItem], max_workers: int = 5) -> list[Article]:
+    def get_articles(self, items: list[PreviewItem], max_workers: int = 5,
+                     pool: ConversionPool = None) -> list[Article]:
+        """
+        Get the articles of the PreviewItems, loading up to `max_workers` tabs at once.
+        :param items: list of PreviewItem objects
+        :param max_workers: number of tabs to load at once
+        :param pool: if given, the HTML is cleaned and converted in this process pool instead of inline
+        :return: list of Article objects
+        """
         article_list = []
         tabs = []
         item_index = 0
+        opened = {}  # tab name -> time the tab was opened, for the pipeline trace
+        submitted = set()  # indexes of the items converted in the pool
+
+        def trace_key(index: int) -> str:
+            return tracing.article_key(self.config["source_prefix"], items[index].article_id)
+
+        def collect(results):
+            for index, article_body in results:
+                # The board list can repeat an article, so the results are keyed by item index, not article ID
+                if index not in submitted:
+                    continue
+                submitted.discard(index)
+                if article_body is None:
+                    continue
+                item = items[index]
+                article_list.append(Article(source_prefix=self.config["source_prefix"], article_id=item.article_id,
+                                            source_url=item.url, title=item.title, time=item.time,
+                                            content=article_body))
 
         max_workers = min(max_workers, len(items))
 
         # Open initial tabs
         for i in range(max_workers):
             if i < len(items):
-                log.info(f"Gathering article {items[i].article_id}")
+                log.info("Gathering article %s", items[i].article_id)
                 tabs.append(self.get_url_in_new_tab(items[item_index].url, str(item_index)))
+                opened[tabs[-1]] = time.perf_counter()
                 item_index += 1
 
         while len(tabs) > 0:
             self.switch_to_tab(tabs[0])
             if self.element_from_xpath_exists(self.config["article_container"]):
+                index = int(tabs[0])
+                tracing.record("article_fetch", time.perf_counter() - opened.pop(tabs[0]), trace_key(index))
 
                 try:
-                    article_list.append(self.get_article(items[int(tabs[0])], False))
+                    if pool:
+                        article_html = self.get_article_html(items[index].url, False)
+                        # Never blocks: the documents wait in the pool while the tabs keep loading
+                        pool.submit(index, article_html, self.config["domain"], trace_key(index), block=False)
+                        submitted.add(index)
+                        collect(pool.ready())
+                    else:
+                        article_list.append(self.get_article(items[index], False))
                 except Exception as e:
-                    log.error(f"Error getting article: {e} (URL: {items[int(tabs[0])].url})")
+                    log.error(f"Error getting article: {e} (URL: {items[index].url})")
 
                 # close the current tab
                 self.close_current_tab()
@@ -282,31 +342,54 @@ class GungCrawler(BaseCrawler):
                 # open a new tab if there are more items
                 if item_index < len(items):
                     self.switch_to_tab(tabs[0])
-                    log.info(f"Gathering article {items[item_index].article_id}")
+                    log.info("Gathering article %s", items[item_index].article_id)
                     tabs.append(self.get_url_in_new_tab(items[item_index].url, str(item_index)))
+                    opened[tabs[-1]] = time.perf_counter()
                     item_index += 1
             else:
                 # move the first item to the end of the list
                 tabs.append(tabs[0])
                 del tabs[0]
 
+        if pool:
+            collect(pool.drain())
+
         time.sleep(1)
         return article_list
 
+    def get_cache_store(self) -> ArticleCacheStore:
+        if self.cache_store is None:
+            self.cache_store = ArticleCacheStore()
+            # First run after the move to the packed store: import the legacy cache/{site}/*.md files and their
+            # hashes, so the articles formatted before are not sent to the formatter again
+            if self.cache_store.count() == 0 and os.path.isdir("cache"):
+                log.info("Imported %s articles of the legacy cache folder",
+                         self.cache_store.migrate_directory("cache"))
+        return self.cache_store
+
     def get_cache(self, article: PreviewItem) -> Union[Article, None]:
         """
-        Get the cache of the article from local storage (cache folder)
+        Get the cache of the article from local storage (packed cache store)
         :param article: Article object
         :return: cache of the article
         """
-        # check if the article is cached
-        if not os.path.exists(f"cache/{self.config_key}/{article.article_id}.md"):
-            # if not, get the article and cache it
+        content = self.get_cache_store().get(self.config_key, article.article_id)
+        if content is None:
             return None
 
-        with open(f"cache/{self.config_key}/{article.article_id}.md", "r", encoding="utf-8") as f:
-            return Article(source_prefix=self.config["source_prefix"], article_id=article.article_id,
-                           source_url=article.url, title=article.title, time=article.time, content=f.read())
+        return Article(source_prefix=self.config["source_prefix"], article_id=article.article_id,
+                       source_url=article.url, title=article.title, time=article.time, content=content)
+
+    def get_caches(self, items: list[PreviewItem]) -> list[Article]:
+        """
+        Get the cache of several articles in one lookup
+        :param items: list of PreviewItem objects
+        :return: list of the cached articles, in the order of the items
+        """
+        contents = self.get_cache_store().get_many(self.config_key, [item.article_id for item in items])
+        return [Article(source_prefix=self.config["source_prefix"], article_id=item.article_id, source_url=item.url,
+                        title=item.title, time=item.time, content=contents[item.article_id])
+                for item in items if item.article_id in contents]
 
 
 class GyeongbokgungCrawler(GungCrawler):
@@ -349,36 +432,89 @@ class RoyalTombsEventsCrawler(GungCrawler):
         super().__init__("royal_tombs_events", headless, no_images, keep_window)
 
 
-def save_to_cache(site_crawler):
+def save_to_cache(site_crawler, formatter: NoticeFormatter = None, max_concurrency: int = 4,
+                  pool: ConversionPool = None):
     # result = back-end.fetch_article_in_range(270, 280)
     index_result = site_crawler.fetch_article_until(1)
     # index_result = back-end.fetch_article_list_range(1, 2)
-    articles = site_crawler.get_articles(index_result, max_workers=5)
+    articles = site_crawler.get_articles(index_result, max_workers=5, pool=pool)
+
+    store = site_crawler.get_cache_store()
+    hashes = store.source_hashes(site_crawler.get_config_key())
+    pending = {}  # trace key -> article to format
 
     for document in articles:
+        stopword = find_stopword(document.content)
         if len(document.content) > 16000:
-            log.info(f"Skipping article {document.article_id} due to length")
-        elif not no_stopword(document.content):
-            log.info(f"Skipping article {document.article_id} due to stopword")
+            log.info("Skipping article %s due to length", document.article_id)
+        elif stopword:
+            log.info("Skipping article %s due to stopword: %s", document.article_id, stopword)
+        elif hashes.get(document.article_id) == content_hash(document.content):
+            log.debug("Skipping article %s, unchanged since last formatting", document.article_id)
         else:
-            log.info(f"Formatting article {document.article_id}")
+            log.info("Formatting article %s", document.article_id)
+            pending[tracing.article_key(document.source_prefix, document.article_id)] = document
+
+    if not pending:
+        return
+
+    if formatter is None:
+        formatter = NoticeFormatter(max_concurrency=max_concurrency)
+    results = formatter.run({key: document.content for key, document in pending.items()})
+
+    formatted_articles = []
+    for key, formatted in results.items():
+        document = pending[key]
+        if formatted is None:
+            log.error(f"Error formatting article {document.article_id}")
+            continue
+        formatted_articles.append((document.article_id, formatted, content_hash(document.content)))
+
+    with tracing.span("cache_write", items=len(formatted_articles)):
+        store.put_many(site_crawler.get_config_key(), formatted_articles)
+    log.info(f"Formatted {len(pending)} articles: {formatter.usage}")
 
-            try:
-                formatted = format_notice(document.content)
-            except Exception as e:
-                log.error(f"Error formatting article {document.article_id}: {e}")
-                continue
 
-            with open(f"cache/{site_crawler.get_config_key()}/{document.article_id}.md", "w", encoding="utf-8") as f:
-                f.write(formatted)
+CRAWLERS = {
+    "gyeongbokgung": GyeongbokgungCrawler,
+    "changgyeonggung": ChanggyeonggungCrawler,
+    "changdeokgung": ChangdeokgungCrawler,
+    "jongmyo": JongmyoCrawler,
+    "deoksugung_events": DeoksugungEventsCrawler,
+    "deoksugung_notice": DeoksugungNoticeCrawler,
+    "royal_tombs_notice": RoyalTombsNoticeCrawler,
+    "royal_tombs_events": RoyalTombsEventsCrawler,
+}
 
 
 if __name__ == "__main__":
     Logger(debug=False)
 
-    with GyeongbokgungCrawler() as crawler:
-        result = crawler.fetch_article_until(1)
-        for preview_item in result:
-            article_item = crawler.get_cache(preview_item)
-            if article_item:
-                log.info(f"Inserting: {article_item.article_id}")
+    parser = argparse.ArgumentParser(description="Crawl the sites and cache the formatted articles")
+    parser.add_argument("--site", nargs="+", default=["gyeongbokgung"], choices=list(CRAWLERS))
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes converting the article HTML to markdown (default: number of CPUs)")
+    parser.add_argument("--cached-only", action="store_true",
+                        help="only insert the cached articles of the sites, without crawling and formatting")
+    args = parser.parse_args()
+
+    es = ElasticsearchClient()
+    mongo = MongoDBClient(es_client=es)
+    if not mongo.ping() or not es.ping():
+        exit(1)
+
+    tracing.start_run("crawl")
+    # One conversion pool for every site, so the worker processes are started once
+    with ConversionPool(args.workers) as conversion_pool:
+        for site in args.site:
+            with CRAWLERS[site]() as crawler:
+                if not args.cached_only:
+                    save_to_cache(crawler, pool=conversion_pool)
+                result = crawler.fetch_article_until(1)
+                for article_item in crawler.get_caches(result):
+                    log.info("Inserting: %s", article_item.article_id)
+                    mongo.insert_article(article_item)
+
+    # Related articles of the new articles, and of their neighbours whose lists may now include them
+    RelatedArticles(mongo, es).update("ko")
+    tracing.finish_run()
@@ -1,13 +1,16 @@
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, HTTPException, Request, Response, status
 from pydantic import BaseModel
 from typing import Optional
+import time
+from datetime import datetime
 
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from modules.db import MongoDBClient, ElasticsearchClient
-from modules.models import Article
+from modules.models import Article, date_re
+from modules import metrics, shared_cache
 
 
 class ArticleRequest(BaseModel):
@@ -19,6 +22,11 @@ class SearchRequest(BaseModel):
     query: str
     language: str
     cursor: int
+    tags: Optional[list[str]] = None
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+    # Search these languages together instead of `language` only
+    languages: Optional[list[str]] = None
 
 
 class AutoCompleteRequest(BaseModel):
@@ -45,8 +53,33 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+if metrics.enabled:
+    @app.middleware("http")
+    async def measure_request(request: Request, call_next):
+        labels = {}
+        metrics.request_labels.set(labels)
+        start = time.perf_counter()
+        response = await call_next(request)
+        elapsed = time.perf_counter() - start
+
+        # Label with the route template rather than the path, so the number of series stays bounded
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        metrics.request_duration.observe(elapsed, path, request.method, labels.get("language", ""),
+                                         response.status_code)
+        return response
+
+    if metrics.shared_directory:
+        # Runs in every worker, after the fork
+        @app.on_event("startup")
+        def share_metrics():
+            metrics.registry.share(metrics.shared_directory)
+
+# The clients connect on the first request, use the readiness probe to check the servers
 mongo_client = MongoDBClient()
 es_client = ElasticsearchClient()
+# Shared by the worker processes, and invalidated by the article writes (namespace "articles")
+cache = shared_cache.get_cache()
 
 ui_language = {}
 # read languages from config file
@@ -55,15 +88,30 @@ for lang in Article.valid_languages:
         ui_language[lang] = f.read()
 
 
+def valid_date(date: str) -> bool:
+    """
+    :return: True if the date is an existing day in the YYYY-MM-DD format
+    """
+    if not date_re.match(date):
+        return False
+    try:
+        datetime.strptime(date, "%Y-%m-%d")
+        return True
+    except ValueError:
+        return False
+
+
 async def validate_language(language: str) -> Optional[HTTPException]:
     """
     Validates the language parameter in the request as a dependency.
     :param language: The language code to validate.
     :raise HTTPException: If the language is invalid.
     """
-    if language not in Article.valid_languages:
+    if language not in Article.language_set:
+        metrics.set_request_label("language", "invalid")
         return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid language: {language}")
     else:
+        metrics.set_request_label("language", language)
         return None
 
 
@@ -72,14 +120,57 @@ def read_root():
     return FileResponse('static/index.html')
 
 
+@app.get("/api/v1/health/live/")
+async def liveness():
+    return {"status": "ok"}
+
+
+@app.get("/api/v1/health/ready/")
+def readiness(response: Response):
+    checks = {"mongodb": mongo_client.ping(), "elasticsearch": es_client.ping()}
+    ready = all(checks.values())
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"ready": ready, "checks": checks}
+
+
+@app.get("/metrics")
+def read_metrics():
+    if not metrics.enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/api/v1/search/")
 async def search(request_data: SearchRequest):
     validation = await validate_language(request_data.language)
     if validation:
         return validation
 
+    for date in (request_data.date_from, request_data.date_to):
+        if date and not valid_date(date):
+            return {"message": f"Invalid date. It must be a valid date in the YYYY-MM-DD format: {date}"}, \
+                status.HTTP_400_BAD_REQUEST
+
+    if request_data.cursor < 0 or request_data.cursor + 20 > es_client.max_result_window:
+        return {"message": f"Invalid cursor. It must be between 0 and {es_client.max_result_window - 20}: "
+                           f"{request_data.cursor}"}, status.HTTP_400_BAD_REQUEST
+
+    if request_data.languages:
+        for language in request_data.languages:
+            if language not in Article.language_set:
+                return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid language: {language}")
+
+        # One round trip for every language, the articles found in several languages are returned once
+        result = es_client.search_languages(query=request_data.query, languages=request_data.languages,
+                                            cursor=request_data.cursor, limit=20, tags=request_data.tags,
+                                            date_from=request_data.date_from, date_to=request_data.date_to)
+        return {"total": result["total"], "articles": [hit["_id"] for hit in result["hits"]],
+                "languages": {hit["_id"]: hit["languages"] for hit in result["hits"]}}, status.HTTP_200_OK
+
     query = es_client.search_articles(query=request_data.query, language=request_data.language,
-                                      cursor=request_data.cursor, limit=20)
+                                      cursor=request_data.cursor, limit=20, tags=request_data.tags,
+                                      date_from=request_data.date_from, date_to=request_data.date_to)
 
     # From the elastic search raw response, we only need the mongoDB id of the article
 
@@ -97,7 +188,10 @@ async def feed(language: str, cursor: Optional[str] = None):
     if validation:
         return validation
 
-    return mongo_client.get_latest_article(language, cursor, 20), status.HTTP_200_OK
+    # Cards only: the content is read with /api/v1/articles/ when an article is opened
+    page = cache.get_or_set("articles", f"feed:{language}:{cursor}", lambda: [
+        summary.to_dict() for summary in mongo_client.get_latest_summaries(language, cursor, 20)])
+    return page, status.HTTP_200_OK
 
 
 @app.get("/api/v1/auto-complete/")
@@ -106,7 +200,8 @@ async def auto_complete(request_data: AutoCompleteRequest):
     if validation:
         return validation
 
-    query = es_client.autocomplete(query=request_data.query, language=request_data.language)
+    query = cache.get_or_set("articles", f"suggest:{request_data.language}:{request_data.query}",
+                             lambda: es_client.autocomplete(query=request_data.query, language=request_data.language))
     return {"suggest": query}, status.HTTP_200_OK
 
 
@@ -116,7 +211,12 @@ async def get_article(request_data: ArticleRequest):
     if validation:
         return validation
 
-    document = mongo_client.get_article_from_id(request_data.article_id, request_data.language)
+    def read_article() -> Optional[dict]:
+        article = mongo_client.get_article_from_id(request_data.article_id, request_data.language)
+        return article.to_dict() if article else None
+
+    document = cache.get_or_set("articles", f"article:{request_data.language}:{request_data.article_id}",
+                                read_article)
 
     if document:
         return document, status.HTTP_200_OK
@@ -129,6 +229,11 @@ async def get_article_count():
     return mongo_client.get_article_count(), status.HTTP_200_OK
 
 
+@app.get("/api/v1/articles/counts/")
+async def get_article_counts():
+    return mongo_client.get_article_counts(), status.HTTP_200_OK
+
+
 @app.get("/api/v1/languages/")
 async def get_languages(language: str):
     validation = await validate_language(language)
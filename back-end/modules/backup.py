@@ -0,0 +1,348 @@
+import os
+import json
+import gzip
+import argparse
+import collections
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, Optional
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.db import MongoDBClient, ElasticsearchClient
+from modules.models import Article
+from modules.log_manager import Logger, log
+from modules import shared_cache
+
+
+def write_chunk(path: str, lines: list[str]) -> None:
+    # zlib releases the GIL while compressing, so the chunks of the streams are written concurrently
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=6) as f:
+        f.writelines(lines)
+
+
+def read_chunks(paths: Iterable[str]) -> Iterator[str]:
+    for path in paths:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            yield from f
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class BackupTool:
+    def __init__(self, mongo: MongoDBClient, es: ElasticsearchClient, directory: str = "../backup",
+                 chunk_size: int = 5000, workers: int = 4):
+        """
+        Logical backup of the running services, replacing the tarballs of the data volumes made by save_data.sh.
+        The `articles` collection and every per-language index are streamed into gzip NDJSON chunks
+        (`{directory}/{name}/{stream}-{n}.ndjson.gz`), described by a manifest.json. Restoring upserts the
+        documents into the running services, so no container restart is needed.
+
+        :param mongo: MongoDB client
+        :param es: Elasticsearch client
+        :param directory: folder of the backups and of the checkpoint file
+        :param chunk_size: number of documents per chunk file
+        :param workers: number of streams backed up or restored at the same time
+        """
+        self.mongo = mongo
+        self.es = es
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.checkpoint_path = os.path.join(directory, "checkpoint.json")
+
+    def read_checkpoint(self) -> Optional[dict]:
+        """
+        :return: name and start time of the last backup, None if there is none
+        """
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path) as f:
+            return json.load(f)
+
+    def read_manifest(self, name: str) -> dict:
+        with open(os.path.join(self.directory, name, "manifest.json")) as f:
+            return json.load(f)
+
+    def stream(self, folder: str, prefix: str, lines: Iterable[str], executor: ThreadPoolExecutor) -> dict:
+        """
+        Write the lines into chunk files, compressing a chunk while the next one is read.
+        :return: manifest entry of the stream, with its chunk files and number of documents
+        """
+        chunks = []
+        writes = collections.deque()
+        documents = 0
+        for index, chunk in enumerate(batched(lines, self.chunk_size)):
+            # At most two chunks of the stream in memory
+            while len(writes) >= 2:
+                writes.popleft().result()
+            file_name = f"{prefix}-{index:05d}.ndjson.gz"
+            writes.append(executor.submit(write_chunk, os.path.join(folder, file_name), chunk))
+            chunks.append(file_name)
+            documents += len(chunk)
+        while writes:
+            writes.popleft().result()
+        return {"chunks": chunks, "documents": documents}
+
+    def mongo_lines(self, collection: str, since: Optional[datetime]) -> Iterator[str]:
+        from bson import json_util
+
+        # Articles written before the `updated` field existed only appear in full backups
+        query = {"updated": {"$gte": since}} if since else {}
+        for document in self.mongo.db[collection].find(query).sort("_id", 1).batch_size(self.chunk_size):
+            yield json_util.dumps(document, json_options=json_util.RELAXED_JSON_OPTIONS) + "\n"
+
+    def es_lines(self, index_name: str, ids: Optional[list[str]]) -> Iterator[str]:
+        from elasticsearch import helpers
+
+        if ids is None:
+            batches = [{"query": {"match_all": {}}}]
+        else:
+            batches = [{"query": {"ids": {"values": batch}}} for batch in batched(ids, 1000)]
+        for query in batches:
+            for hit in helpers.scan(self.es.es, index=index_name, query=query, size=1000, preserve_order=False):
+                yield json.dumps({"_id": hit["_id"], "_source": hit["_source"]}, ensure_ascii=False) + "\n"
+
+    def index_definition(self, index_name: str) -> dict:
+        """
+        Mappings and analysis settings of an index, enough to create it again before a restore.
+        """
+        definition = self.es.es.indices.get(index=index_name)[index_name]
+        settings = definition["settings"]["index"]
+        return {
+            "settings": {"index": {key: settings[key] for key in ("analysis", "number_of_shards") if key in settings}},
+            "mappings": definition["mappings"],
+        }
+
+    def backup(self, incremental: bool = False, snapshot_repository: Optional[str] = None) -> str:
+        """
+        Back up the articles collection and the Elasticsearch indexes.
+        :param incremental: only back up the articles written since the start of the last backup
+        :param snapshot_repository: take an Elasticsearch snapshot in this registered repository instead of
+        streaming the indexes (snapshots are incremental by themselves)
+        :return: name of the backup
+        """
+        started = datetime.now(timezone.utc)
+        name = started.strftime("%Y%m%d-%H%M%S")
+        folder = os.path.join(self.directory, name)
+        os.makedirs(folder, exist_ok=True)
+
+        checkpoint = self.read_checkpoint() if incremental else None
+        if incremental and checkpoint is None:
+            log.warning("No previous backup, taking a full backup")
+        since = datetime.fromisoformat(checkpoint["time"]) if checkpoint else None
+
+        manifest = {
+            "name": name,
+            "type": "incremental" if since else "full",
+            "base": checkpoint["name"] if since else None,
+            "since": checkpoint["time"] if since else None,
+            "started": started.isoformat(),
+            "database": self.mongo.database,
+            "index_prefix": self.es.index_prefix,
+            "streams": {},
+        }
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            log.info("Backing up the articles collection into %s", folder)
+            manifest["streams"]["articles"] = self.stream(folder, "articles", self.mongo_lines("articles", since),
+                                                          executor)
+            # Contents of the articles stored with the split layout (see MongoDBClient)
+            if "article_bodies" in self.mongo.db.list_collection_names():
+                manifest["streams"]["article_bodies"] = self.stream(folder, "article_bodies",
+                                                                    self.mongo_lines("article_bodies", since), executor)
+
+            if snapshot_repository:
+                indices = [f"{self.es.index_prefix}_{language}" for language in Article.valid_languages]
+                self.es.es.snapshot.create(repository=snapshot_repository, snapshot=name, indices=",".join(indices),
+                                           include_global_state=False, wait_for_completion=True)
+                manifest["snapshot"] = {"repository": snapshot_repository, "snapshot": name, "indices": indices}
+                log.info("Elasticsearch snapshot %s taken in repository %s", name, snapshot_repository)
+            else:
+                ids = None
+                if since:
+                    # The ES documents have the id of their Mongo article
+                    from bson import json_util
+                    ids = [str(json_util.loads(line)["_id"]) for line in
+                           read_chunks(os.path.join(folder, chunk)
+                                       for chunk in manifest["streams"]["articles"]["chunks"])]
+
+                def language_stream(language: str) -> tuple[str, dict]:
+                    index_name = f"{self.es.index_prefix}_{language}"
+                    if not self.es.es.indices.exists(index=index_name):
+                        log.warning("Index %s does not exist, skipping", index_name)
+                        return index_name, {"chunks": [], "documents": 0}
+                    entry = self.stream(folder, index_name, self.es_lines(index_name, ids), executor)
+                    entry["definition"] = self.index_definition(index_name)
+                    return index_name, entry
+
+                # One stream per language, each compressing its chunks on the shared executor
+                with ThreadPoolExecutor(max_workers=len(Article.valid_languages)) as streams:
+                    for index_name, entry in streams.map(language_stream, Article.valid_languages):
+                        manifest["streams"][index_name] = entry
+
+        with open(os.path.join(folder, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+        # The start time is the checkpoint, so the articles written during this backup are in the next one
+        with open(self.checkpoint_path, "w") as f:
+            json.dump({"name": name, "time": started.isoformat()}, f)
+
+        for stream, entry in manifest["streams"].items():
+            log.info("%s: %s documents in %s chunks", stream, entry["documents"], len(entry["chunks"]))
+        return name
+
+    def chain(self, name: str) -> list[dict]:
+        """
+        Manifests to restore in order: the full backup, then the incremental backups up to `name`.
+        """
+        manifests = [self.read_manifest(name)]
+        while manifests[0]["base"]:
+            manifests.insert(0, self.read_manifest(manifests[0]["base"]))
+        return manifests
+
+    def restore_collection(self, folder: str, collection: str, chunks: list[str]) -> int:
+        from bson import json_util
+        from pymongo import ReplaceOne
+
+        def request(document: dict) -> ReplaceOne:
+            if collection == "article_bodies":
+                # Matched on the unique (article, language) key, the body may exist under another _id
+                del document["_id"]
+                return ReplaceOne({"article": document["article"], "language": document["language"]}, document,
+                                  upsert=True)
+            return ReplaceOne({"_id": document["_id"]}, document, upsert=True)
+
+        def restore_chunk(chunk: str) -> int:
+            requests = [request(document)
+                        for document in map(json_util.loads, read_chunks([os.path.join(folder, chunk)]))]
+            if not requests:
+                return 0
+            result = self.mongo.db[collection].bulk_write(requests, ordered=False)
+            return result.upserted_count + result.matched_count
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return sum(executor.map(restore_chunk, chunks))
+
+    def restore_index(self, folder: str, index_name: str, entry: dict, replace: bool) -> int:
+        from elasticsearch import helpers
+
+        if replace and self.es.es.indices.exists(index=index_name):
+            self.es.es.indices.delete(index=index_name)
+        if not self.es.es.indices.exists(index=index_name):
+            self.es.es.indices.create(index=index_name, **entry["definition"])
+
+        def actions() -> Iterator[dict]:
+            for line in read_chunks(os.path.join(folder, chunk) for chunk in entry["chunks"]):
+                document = json.loads(line)
+                yield {"_index": index_name, "_id": document["_id"], "_source": document["_source"]}
+
+        indexed = 0
+        for ok, item in helpers.streaming_bulk(self.es.es, actions(), chunk_size=500, raise_on_error=False):
+            if ok:
+                indexed += 1
+            else:
+                log.error("Failed restoring a document of %s: %s", index_name, item)
+        self.es.es.indices.refresh(index=index_name)
+        return indexed
+
+    def restore_snapshot(self, snapshot: dict) -> None:
+        # Restoring over open indexes is refused, they are closed for the duration of the restore
+        indices = ",".join(snapshot["indices"])
+        self.es.es.indices.close(index=indices, ignore_unavailable=True)
+        self.es.es.snapshot.restore(repository=snapshot["repository"], snapshot=snapshot["snapshot"],
+                                    indices=indices, include_global_state=False, wait_for_completion=True)
+
+    def restore(self, name: str, replace: bool = False) -> dict:
+        """
+        Restore a backup into the running services. An incremental backup is restored on top of the backups
+        it was taken after.
+        :param name: name of the backup
+        :param replace: drop the articles collection and the indexes first, instead of upserting into them
+        :return: number of restored documents per stream
+        """
+        manifests = self.chain(name)
+        if replace:
+            self.mongo.db.articles.delete_many({})
+            self.mongo.db.article_bodies.delete_many({})
+        if any("article_bodies" in manifest["streams"] for manifest in manifests):
+            self.mongo.ensure_bodies_collection()
+
+        restored = {}
+        for manifest in manifests:
+            folder = os.path.join(self.directory, manifest["name"])
+            log.info("Restoring %s backup %s", manifest["type"], manifest["name"])
+            for collection in ("articles", "article_bodies"):
+                if collection in manifest["streams"]:
+                    restored[collection] = restored.get(collection, 0) + \
+                        self.restore_collection(folder, collection, manifest["streams"][collection]["chunks"])
+
+            if "snapshot" in manifest:
+                # Snapshots hold the whole indexes, only the last one of the chain is restored
+                if manifest is manifests[-1]:
+                    self.restore_snapshot(manifest["snapshot"])
+                continue
+
+            # The indexes of the backup may have another prefix than the client's
+            for stream, entry in manifest["streams"].items():
+                if stream in ("articles", "article_bodies") or not entry["chunks"]:
+                    continue
+                language = stream[len(manifest["index_prefix"]) + 1:]
+                index_name = f"{self.es.index_prefix}_{language}"
+                restored[index_name] = restored.get(index_name, 0) + \
+                    self.restore_index(folder, index_name, entry, replace and manifest is manifests[0])
+
+        log.info("Article counters: %s", self.mongo.rebuild_counters())
+        shared_cache.invalidate("articles")
+        for stream, documents in restored.items():
+            log.info("%s: %s documents restored", stream, documents)
+        return restored
+
+
+if __name__ == "__main__":
+    Logger(debug=False)
+
+    parser = argparse.ArgumentParser(description="Live backup and restore of MongoDB and Elasticsearch")
+    parser.add_argument("command", choices=["backup", "restore", "list"])
+    parser.add_argument("name", nargs="?", help="backup to restore, defaults to the last one")
+    parser.add_argument("--directory", default="../backup", help="folder of the backups")
+    parser.add_argument("--incremental", action="store_true", help="only back up what changed since the last backup")
+    parser.add_argument("--snapshot-repository", help="registered Elasticsearch snapshot repository to use")
+    parser.add_argument("--replace", action="store_true", help="drop the existing data before restoring")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="documents per chunk file")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--mongo-host", default="localhost")
+    parser.add_argument("--mongo-port", type=int, default=27017)
+    parser.add_argument("--es-url", default="http://localhost:9200")
+    args = parser.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    es = ElasticsearchClient(args.es_url)
+    mongo = MongoDBClient(args.mongo_host, args.mongo_port, es_client=es)
+    tool = BackupTool(mongo, es, args.directory, args.chunk_size, args.workers)
+
+    if args.command == "list":
+        for entry in sorted(os.listdir(args.directory)):
+            if os.path.exists(os.path.join(args.directory, entry, "manifest.json")):
+                manifest = tool.read_manifest(entry)
+                log.info("%s: %s backup, %s articles", entry, manifest["type"],
+                         manifest["streams"]["articles"]["documents"])
+        exit(0)
+
+    if not mongo.ping() or not es.ping():
+        exit(1)
+
+    if args.command == "backup":
+        log.info("Backup %s done", tool.backup(args.incremental, args.snapshot_repository))
+    else:
+        name = args.name or (tool.read_checkpoint() or {}).get("name")
+        if name is None:
+            log.error("No backup found in %s", args.directory)
+            exit(1)
+        tool.restore(name, args.replace)
@@ -0,0 +1,174 @@
+import os
+import json
+import sqlite3
+import argparse
+from typing import Iterable, Iterator, Optional
+
+from modules.log_manager import Logger, log
+from modules import metrics
+
+
+class ArticleCacheStore:
+    def __init__(self, path: str = "cache/articles.sqlite3"):
+        """
+        Packed store of the formatted articles, replacing the `cache/{site}/{id}.md` files.
+        Articles are kept in a single SQLite file, clustered by (site, article id), so lookups go through the
+        primary key index and reading a whole site is a sequential scan.
+
+        :param path: path of the SQLite file
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS articles (
+                site TEXT NOT NULL,
+                article_id INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                source_hash TEXT,
+                PRIMARY KEY (site, article_id)
+            ) WITHOUT ROWID
+        """)
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def get(self, site: str, article_id: int) -> Optional[str]:
+        """
+        Get the content of a cached article.
+        :param site: config key of the site
+        :param article_id: article id on the site
+        :return: markdown content, or None if the article is not cached
+        """
+        row = self.connection.execute("SELECT content FROM articles WHERE site = ? AND article_id = ?",
+                                      (site, article_id)).fetchone()
+        metrics.cache_lookup("articles", hits=int(row is not None), misses=int(row is None))
+        return row[0] if row else None
+
+    def get_many(self, site: str, article_ids: Iterable[int]) -> dict[int, str]:
+        """
+        Get the content of several cached articles in one query.
+        :param site: config key of the site
+        :param article_ids: article ids on the site
+        :return: dictionary of article id -> markdown content, for the cached articles only
+        """
+        article_ids = list(article_ids)
+        result = {}
+        # Stay below the SQLite limit of bound parameters
+        for start in range(0, len(article_ids), 500):
+            chunk = article_ids[start:start + 500]
+            rows = self.connection.execute(
+                f"SELECT article_id, content FROM articles WHERE site = ? AND article_id IN "
+                f"({', '.join('?' * len(chunk))})", (site, *chunk))
+            result.update(rows)
+        metrics.cache_lookup("articles", hits=len(result), misses=len(article_ids) - len(result))
+        return result
+
+    def put(self, site: str, article_id: int, content: str, source_hash: Optional[str] = None) -> None:
+        self.put_many(site, [(article_id, content, source_hash)])
+
+    def put_many(self, site: str, articles: Iterable[tuple[int, str, Optional[str]]]) -> None:
+        """
+        Insert or replace several articles in one transaction.
+        :param site: config key of the site
+        :param articles: iterable of (article id, markdown content, hash of the source markdown)
+        """
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO articles (site, article_id, content, source_hash) VALUES (?, ?, ?, ?)",
+                ((site, article_id, content, source_hash) for article_id, content, source_hash in articles))
+
+    def delete(self, site: str, article_id: int) -> None:
+        with self.connection:
+            self.connection.execute("DELETE FROM articles WHERE site = ? AND article_id = ?", (site, article_id))
+
+    def source_hashes(self, site: str) -> dict[int, str]:
+        """
+        Get the hashes of the source markdown of the formatted articles of a site.
+        :param site: config key of the site
+        :return: dictionary of article id -> content hash
+        """
+        rows = self.connection.execute(
+            "SELECT article_id, source_hash FROM articles WHERE site = ? AND source_hash IS NOT NULL", (site,))
+        return dict(rows)
+
+    def iter_articles(self, site: Optional[str] = None) -> Iterator[tuple[str, int, str]]:
+        """
+        Iterate through the cached articles in (site, article id) order, which is the storage order.
+        :param site: config key of the site. All sites when not specified.
+        :return: iterator of (site, article id, markdown content)
+        """
+        if site is None:
+            return self.connection.execute("SELECT site, article_id, content FROM articles ORDER BY site, article_id")
+        return self.connection.execute(
+            "SELECT site, article_id, content FROM articles WHERE site = ? ORDER BY article_id", (site,))
+
+    def count(self, site: Optional[str] = None) -> int:
+        if site is None:
+            return self.connection.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+        return self.connection.execute("SELECT COUNT(*) FROM articles WHERE site = ?", (site,)).fetchone()[0]
+
+    def compact(self) -> None:
+        """
+        Rewrite the store file without the space left by replaced and deleted articles.
+        """
+        self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.connection.execute("VACUUM")
+
+    def migrate_directory(self, cache_dir: str = "cache") -> int:
+        """
+        Import the `{site}/{id}.md` files (and `{site}/hashes.json` if present) of the cache folder.
+        :param cache_dir: path of the cache folder
+        :return: number of imported articles
+        """
+        imported = 0
+        for site in sorted(os.listdir(cache_dir)):
+            site_dir = os.path.join(cache_dir, site)
+            if not os.path.isdir(site_dir):
+                continue
+
+            hashes = {}
+            if os.path.exists(os.path.join(site_dir, "hashes.json")):
+                with open(os.path.join(site_dir, "hashes.json"), "r", encoding="utf-8") as f:
+                    hashes = json.load(f)
+
+            articles = []
+            for file_name in os.listdir(site_dir):
+                if not file_name.endswith(".md") or not file_name[:-3].isdigit():
+                    continue
+                with open(os.path.join(site_dir, file_name), "r", encoding="utf-8") as f:
+                    articles.append((int(file_name[:-3]), f.read(), hashes.get(file_name[:-3])))
+
+            self.put_many(site, sorted(articles))
+            imported += len(articles)
+            log.info(f"Imported {len(articles)} cached articles of {site}")
+        return imported
+
+
+if __name__ == "__main__":
+    Logger(debug=False)
+
+    parser = argparse.ArgumentParser(description="Manage the packed article cache")
+    parser.add_argument("command", choices=["migrate", "compact", "count"])
+    parser.add_argument("--store", default="cache/articles.sqlite3", help="path of the store file")
+    parser.add_argument("--cache-dir", default="cache", help="cache folder to migrate")
+    args = parser.parse_args()
+
+    with ArticleCacheStore(args.store) as store:
+        if args.command == "migrate":
+            log.info(f"Imported {store.migrate_directory(args.cache_dir)} articles into {args.store}")
+        elif args.command == "compact":
+            store.compact()
+        log.info(f"{store.count()} articles in {args.store}")
@@ -0,0 +1,193 @@
+import os
+import time
+import argparse
+import collections
+import markdown
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Hashable, Iterable, Iterator, Optional
+
+from modules.utils import LxmlHTMLCleaner
+from modules.log_manager import Logger, log
+from modules import tracing
+
+
+def convert_html(html_content: str, domain: str) -> str:
+    """
+    Clean the HTML content and convert it to markdown. Runs in the worker processes.
+    :param html_content: raw HTML content (innerHTML of the article container)
+    :param domain: domain of the website, for the relative links
+    :return: markdown content
+    """
+    return LxmlHTMLCleaner().html_to_markdown(html_content, domain)
+
+
+def timed_convert_html(html_content: str, domain: str) -> tuple[str, float]:
+    """
+    `convert_html` returning the time spent in the worker as well, for the pipeline trace.
+    """
+    start = time.perf_counter()
+    markdown = convert_html(html_content, domain)
+    return markdown, time.perf_counter() - start
+
+
+class ConversionPool:
+    def __init__(self, workers: Optional[int] = None, max_pending: Optional[int] = None):
+        """
+        Process pool stage cleaning and converting HTML to markdown, off the crawler's thread.
+        Results are returned in submission order. When `max_pending` documents are being converted,
+        `submit` waits for the oldest one, so the memory held by the stage stays bounded; with `block=False` the
+        document waits in a queue instead, and the fetcher keeps going.
+
+        :param workers: number of worker processes. Defaults to the number of CPUs.
+        :param max_pending: maximum number of documents in flight. Defaults to 4 per worker.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self.executor = None
+        self.pending = collections.deque()  # (key, trace key, future), in submission order
+        self.finished = collections.deque()  # (key, markdown), collected while waiting for a free slot
+        self.waiting = collections.deque()  # (key, trace key, html content, domain), submitted without blocking
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self) -> None:
+        if self.executor is None:
+            # The workers log with the handlers of the parent, see Logger.configure_worker
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=Logger.configure_worker)
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    def submit(self, key: Hashable, html_content: str, domain: str, trace_key: Optional[str] = None,
+               block: bool = True) -> None:
+        """
+        Queue a document for conversion.
+        :param key: identifier returned with the result
+        :param html_content: raw HTML content
+        :param domain: domain of the website
+        :param trace_key: key of the "clean" trace span. Defaults to `key`.
+        :param block: if True, wait for the oldest conversion when `max_pending` documents are in flight.
+        If False, never wait: the document is sent to the workers by `ready` or `drain` once a slot is free.
+        """
+        self.start()
+        if not block:
+            self.waiting.append((key, trace_key or key, html_content, domain))
+            self.fill()
+            return
+        while len(self.pending) >= self.max_pending:
+            self.finished.append(self._result(*self.pending.popleft()))
+            self.fill()
+        self.pending.append((key, trace_key or key, self.executor.submit(timed_convert_html, html_content, domain)))
+
+    def fill(self) -> None:
+        """
+        Send the waiting documents to the workers while there are free slots.
+        """
+        while self.waiting and len(self.pending) < self.max_pending:
+            key, trace_key, html_content, domain = self.waiting.popleft()
+            self.pending.append((key, trace_key, self.executor.submit(timed_convert_html, html_content, domain)))
+
+    def ready(self) -> Iterator[tuple[Hashable, Optional[str]]]:
+        """
+        Yield the converted documents that are ready, in submission order, without blocking.
+        :return: iterator of (key, markdown). The markdown is None if the conversion failed.
+        """
+        while self.finished:
+            yield self.finished.popleft()
+        self.fill()
+        while self.pending and self.pending[0][-1].done():
+            yield self._result(*self.pending.popleft())
+            self.fill()
+
+    def drain(self) -> Iterator[tuple[Hashable, Optional[str]]]:
+        """
+        Yield every remaining document in submission order, waiting for the conversions to finish.
+        """
+        yield from self.ready()
+        while self.pending:
+            yield self._result(*self.pending.popleft())
+            self.fill()
+
+    def map(self, documents: Iterable[tuple[Hashable, str, str]]) -> Iterator[tuple[Hashable, Optional[str]]]:
+        """
+        Convert a stream of documents, yielding the results in order as they become available.
+        :param documents: iterable of (key, html content, domain)
+        :return: iterator of (key, markdown)
+        """
+        for key, html_content, domain in documents:
+            self.submit(key, html_content, domain)
+            yield from self.ready()
+        yield from self.drain()
+
+    @staticmethod
+    def _result(key: Hashable, trace_key: Hashable, future: Future) -> tuple[Hashable, Optional[str]]:
+        try:
+            markdown, duration = future.result()
+            tracing.record("clean", duration, trace_key)
+            return key, markdown
+        except Exception as e:
+            log.error(f"Error converting document {key}: {e}")
+            return key, None
+
+
+def convert_directory(source_dir: str, target_dir: str, domain: str, workers: Optional[int] = None) -> int:
+    """
+    Convert every `{id}.html` file of a directory into `{id}.md` files, on all cores.
+    The `{id}.md` files of the directory, such as the cache folders `cache/{site}`, are rendered to HTML and
+    converted again, to apply the current cleaning rules to articles converted before.
+    :param source_dir: directory of the raw HTML or markdown files
+    :param target_dir: directory to write the markdown files to
+    :param domain: domain of the website
+    :param workers: number of worker processes
+    :return: number of converted files
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    # The raw HTML is preferred over the markdown of the same article
+    sources = {}
+    for file_name in sorted(os.listdir(source_dir), key=lambda name: name.endswith(".html")):
+        name, extension = os.path.splitext(file_name)
+        if extension in (".html", ".md") and name.isdigit():
+            sources[name] = file_name
+    file_names = [sources[name] for name in sorted(sources, key=int)]
+
+    def read_documents():
+        for file_name in file_names:
+            name, extension = os.path.splitext(file_name)
+            with open(os.path.join(source_dir, file_name), "r", encoding="utf-8") as f:
+                content = f.read()
+            if extension == ".md":
+                content = markdown.markdown(content, extensions=["tables"])
+            yield name, content, domain
+
+    converted = 0
+    with ConversionPool(workers) as pool:
+        for name, converted_markdown in pool.map(read_documents()):
+            if converted_markdown is None:
+                continue
+            with open(os.path.join(target_dir, f"{name}.md"), "w", encoding="utf-8") as f:
+                f.write(converted_markdown)
+            converted += 1
+
+    log.info(f"Converted {converted}/{len(file_names)} documents from {source_dir}")
+    return converted
+
+
+if __name__ == "__main__":
+    Logger(debug=False)
+
+    parser = argparse.ArgumentParser(description="Convert a directory of raw article HTML (or markdown) files to "
+                                                 "markdown")
+    parser.add_argument("source_dir")
+    parser.add_argument("target_dir")
+    parser.add_argument("--domain", required=True, help="domain of the website, for the relative links")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    convert_directory(args.source_dir, args.target_dir, args.domain, args.workers)
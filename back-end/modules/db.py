@@ -1,33 +1,123 @@
+import os
 from datetime import datetime, timezone, timedelta
+from typing import Iterable, Iterator
 from bson import ObjectId
-from elasticsearch import Elasticsearch
-from pymongo import MongoClient, DESCENDING
 
 from modules.models import *
-from modules.utils import strip_markdown
 from modules.log_manager import log
+from modules import metrics, tracing, shared_cache
 
 
 class MongoDBClient:
-    def __init__(self):
-        # mongoDB
-        self.client = MongoClient("localhost", 27017)
-        self.db = self.client["articles"]
-
-        # ping the server to check if it's available
+    def __init__(self, host: str = "localhost", port: int = 27017, database: str = "articles", es_client=None):
+        """
+        MongoDB client. pymongo is imported and the client created on first use, and the connection is opened
+        by the first query, so creating this object is cheap and never fails. Use `ping` to check the server.
+
+        :param host: host of the MongoDB server
+        :param port: port of the MongoDB server
+        :param database: name of the database (the benchmarks use a separate one)
+        :param es_client: ElasticsearchClient the inserted articles are indexed with. Created on first insertion
+        when not specified.
+
+        The contents of the articles are stored in one of two layouts. "embedded": a `content` map of every language
+        in the article document. "split": one document per article and language in the zstd compressed
+        `article_bodies` collection, the article document listing the languages in `bodies`, so reading an article
+        or a feed page only brings the requested language into the cache. The layout is a property of the stored
+        data, converted with `python -m modules.layout`: every writer follows the stored documents (see
+        `stored_layout`), and the readers accept both.
+        """
+        self.host = host
+        self.port = port
+        self.database = database
+        self.es_client = es_client
+        self._client = None
+        self._bodies_ready = False
+
+    @property
+    def client(self):
+        if self._client is None:
+            from pymongo import MongoClient
+            self._client = MongoClient(self.host, self.port, connect=False)
+        return self._client
+
+    @property
+    def db(self):
+        return self.client[self.database]
+
+    def ping(self) -> bool:
+        """
+        Check if the MongoDB server is available.
+        :return: True if the server answered, False otherwise.
+        """
         try:
-            self.client.admin.command('ismaster')
-            log.info("Connected to MongoDB server")
+            self.client.admin.command('ping')
+            return True
         except Exception as e:
             log.error(f"Error connecting to MongoDB server: {e}")
-            exit(1)
+            return False
 
-    def insert_article(self, article: Article) -> bool:
+    def stored_layout(self) -> str:
+        """
+        Layout of the new articles: "split" once the articles were converted (`article_bodies` holds contents),
+        "embedded" otherwise. The existing articles keep the layout of their document.
+        """
+        with metrics.mongo_duration.time("find_one"):
+            return "split" if self.db.article_bodies.find_one({}, {"_id": 1}) else "embedded"
+
+    def ensure_bodies_collection(self) -> None:
+        """
+        Create the `article_bodies` collection with zstd block compression, and its (article, language) index.
+        The contents compress well and are read one at a time, so zstd saves disk and cache for little CPU.
+        """
+        if self._bodies_ready:
+            return
+        from pymongo import ASCENDING
+
+        if "article_bodies" not in self.db.list_collection_names():
+            self.db.create_collection("article_bodies",
+                                      storageEngine={"wiredTiger": {"configString": "block_compressor=zstd"}})
+        self.db.article_bodies.create_index([("article", ASCENDING), ("language", ASCENDING)], unique=True)
+        self._bodies_ready = True
+
+    def write_body(self, mongo_id: ObjectId, language: str, content: str) -> None:
+        self.ensure_bodies_collection()
+        with metrics.mongo_duration.time("body_write"):
+            self.db.article_bodies.update_one({"article": mongo_id, "language": language},
+                                              {"$set": {"content": content}, "$currentDate": {"updated": True}},
+                                              upsert=True)
+
+    def load_contents(self, documents: list[dict], language: Optional[str] = None) -> list[dict]:
+        """
+        Fill the `content` map of article documents stored with the split layout, in a single query.
+        Documents which still embed their content are left as they are.
+        :param documents: article documents
+        :param language: language of the contents to load, None for all of them
+        :return: the documents
+        """
+        missing = {document["_id"]: document for document in documents if "content" not in document}
+        if not missing:
+            return documents
+
+        query = {"article": {"$in": list(missing)}}
+        if language:
+            query["language"] = language
+        for document in missing.values():
+            document["content"] = {}
+        with metrics.mongo_duration.time("body_read"):
+            for body in self.db.article_bodies.find(query, {"_id": 0, "article": 1, "language": 1, "content": 1}):
+                missing[body["article"]]["content"][body["language"]] = body["content"]
+        return documents
+
+    def insert_article(self, article: Article) -> Optional[str]:
         """
         Insert a new article into the database.
         :param article: Article object to insert.
-        :return: True if the insertion was successful, False otherwise.
+        :return: MongoDB ID of the article if the insertion was successful, None otherwise.
         """
+        # Only needed when writing, and pulls in the HTML libraries
+        from modules.utils import make_excerpt
+
         if article.language != "ko":
             log.warning(f"Initial article language is not Korean. Skipping: {article.language}")
 
@@ -35,38 +125,61 @@ class MongoDBClient:
         entry_time = datetime.strptime(article.time, "%Y-%m-%d").replace(tzinfo=timezone.utc).astimezone(
             tz=timezone(timedelta(hours=9)))
 
+        # The article is identified by its source and its ID there. The Korean fields are set one by one, so an
+        # update keeps the translations.
+        identity = {"tag": article.source_prefix, "o_id": article.article_id}
         entry = {
-            "tag": article.source_prefix,
-            "o_id": article.article_id,
+            **identity,
             "url": article.url,
             "time": entry_time,
-            "title": {
-                "ko": article.title,
-            },
-            "content": {
-                "ko": article.content,
-            }
+            "title.ko": article.title,
+            "excerpt.ko": make_excerpt(article.content),
         }
 
         try:
+            # Write in the layout of the stored document, whatever this process was started with
+            with metrics.mongo_duration.time("find_one"):
+                existing_entry = self.db.articles.find_one(identity, {"_id": 1, "content": 1})
+            if existing_entry:
+                split = "content" not in existing_entry
+            else:
+                split = self.stored_layout() == "split"
+
+            update = {"$set": entry, "$currentDate": {"updated": True}}
+            if split:
+                update["$addToSet"] = {"bodies": "ko"}
+            else:
+                entry["content.ko"] = article.content
+
             # Using upsert to insert if not exists, else update
-            result = self.db.articles.update_one(entry, {"$set": entry}, upsert=True)
+            with metrics.mongo_duration.time("upsert"), \
+                    tracing.span("mongo_upsert", tracing.article_key(article.source_prefix, article.article_id)):
+                result = self.db.articles.update_one(identity, update, upsert=True)
+            metrics.mongo_documents.inc("upsert")
 
             # Check if it was an insertion or an update
             if result.upserted_id:
-                log.info(f"Inserted new article: {article.article_id}")
+                log.info("Inserted new article: %s", article.article_id)
                 entry_id = result.upserted_id
+                self.update_counters({"total": 1, f"tags.{article.source_prefix}": 1, "languages.ko": 1})
             else:
-                log.info(f"Updated article: {article.article_id}")
-                entry_id = result.matched_count
+                log.info("Updated article: %s", article.article_id)
+                entry_id = existing_entry["_id"] if existing_entry else \
+                    self.db.articles.find_one(identity, {"_id": 1})["_id"]
+
+            if split:
+                self.write_body(entry_id, "ko", article.content)
 
             # Continue with Elasticsearch insertion
-            ElasticsearchClient().insert_article(article, entry_id)
+            if self.es_client is None:
+                self.es_client = ElasticsearchClient()
+            self.es_client.insert_article(article, entry_id)
+            shared_cache.invalidate("articles")
         except Exception as e:
             # Broad catch for any other exceptions
             log.error(f"Error in article insertion/updation: {e}")
-            return False
-        return True
+            return None
+        return str(entry_id)
 
     def add_language(self, language: str, article: Article, mongo_id: str) -> bool:
         """
@@ -76,29 +189,49 @@ class MongoDBClient:
         :param mongo_id: MongoDB ID of the article.
         :return: True if the update was successful, False otherwise.
         """
+        from modules.utils import make_excerpt
+
         try:
             mongo_id = ObjectId(mongo_id)
             # Fetch the existing article from the database
-            existing_entry = self.db.articles.find_one({"_id": mongo_id})
+            with metrics.mongo_duration.time("find_one"):
+                existing_entry = self.db.articles.find_one({"_id": mongo_id})
 
             if not existing_entry:
                 log.error(f"No article found with ID: {mongo_id}")
                 return False
 
+            new_language = language not in existing_entry["title"]
+
             # Update the title and content with the new language
             # This will overwrite the existing title and content for specified language
             updated_entry = existing_entry
             updated_entry["title"][language] = article.title
-            updated_entry["content"][language] = article.content
+            updated_entry.setdefault("excerpt", {})[language] = make_excerpt(article.content)
+            updated_entry.pop("updated", None)
+            # Articles not converted yet keep their embedded content, whatever the layout
+            split = "content" not in existing_entry
+            if split:
+                updated_entry["bodies"] = sorted(set(updated_entry.get("bodies", [])) | {language})
+            else:
+                updated_entry["content"][language] = article.content
 
             # Save the updated entry back to the database
-            result = self.db.articles.update_one({"_id": mongo_id}, {"$set": updated_entry})
+            with metrics.mongo_duration.time("update"):
+                result = self.db.articles.update_one({"_id": mongo_id}, {"$set": updated_entry,
+                                                                         "$currentDate": {"updated": True}})
+            metrics.mongo_documents.inc("update", amount=result.modified_count)
 
             if result.matched_count == 0:
                 log.error(f"Error while updating article: {mongo_id} ({result.raw_result})")
                 return False
+            if split:
+                self.write_body(mongo_id, language, article.content)
 
-            log.info(f"Added language '{language}' to article: {mongo_id}")
+            if new_language:
+                self.update_counters({f"languages.{language}": 1})
+            shared_cache.invalidate("articles")
+            log.info("Added language '%s' to article: %s", language, mongo_id)
         except Exception as e:
             log.error(f"Error in adding language to article: {e}")
             return False
@@ -108,56 +241,260 @@ class MongoDBClient:
         try:
             # Convert string ID to ObjectId
             object_id = ObjectId(mongo_id)
-            article = self.db.articles.find_one({"_id": object_id})
+            with metrics.mongo_duration.time("find_one"):
+                article = self.db.articles.find_one({"_id": object_id})
             if not article:
                 log.error(f"No article found with ID: {mongo_id}")
                 return None
 
-            time_formatted = article['time'].strftime('%Y-%m-%d')
-
-            return Article(article['tag'], article['o_id'], article['url'], article['title'][language],
-                           time_formatted, article['content'][language])
+            metrics.mongo_documents.inc("find_one")
+            self.load_contents([article], language)
+            return Article.from_mongo(article, language, with_id=False)
         except Exception as e:
             log.error(f"Error fetching article from ID: {e}")
             return None
 
-    def get_latest_article(self, language: str = 'ko', cursor_id: str = None, limit: int = 20) -> list[Article]:
-        query = {}
-
+    def feed_query(self, cursor_id: Optional[str]) -> dict:
+        """
+        Query of the feed page after the article `cursor_id`.
+        """
         if cursor_id:
-            starting_article = self.db.articles.find_one({"_id": ObjectId(cursor_id)}, {"time": 1})
+            with metrics.mongo_duration.time("feed_cursor"):
+                starting_article = self.db.articles.find_one({"_id": ObjectId(cursor_id)}, {"time": 1})
             if starting_article:
-                query = {"time": {"$lt": starting_article["time"]}}
+                return {"time": {"$lt": starting_article["time"]}}
+        return {}
+
+    def get_latest_summaries(self, language: str = 'ko', cursor_id: str = None,
+                             limit: int = 20) -> list[ArticleSummary]:
+        """
+        Feed page: the latest articles without their content, projected on the server to the fields of the cards.
+        :param language: language of the titles and excerpts
+        :param cursor_id: MongoDB ID of the last article of the previous page
+        :param limit: number of articles
+        """
+        from pymongo import DESCENDING
 
-        articles = self.db.articles.find(query).sort("time", DESCENDING).limit(limit)
-        article_list = []
+        query = self.feed_query(cursor_id)
+        projection = {"tag": 1, "time": 1, f"title.{language}": 1, f"excerpt.{language}": 1}
+        with metrics.mongo_duration.time("feed_summaries"):
+            summaries = [ArticleSummary.from_mongo(document, language) for document in
+                         self.db.articles.find(query, projection).sort("time", DESCENDING).limit(limit)]
+        metrics.mongo_documents.inc("feed_summaries", amount=len(summaries))
+        return summaries
 
-        for article in articles:
-            mongo_id = str(article['_id'])
-            time_formatted = article['time'].strftime('%Y-%m-%d')
-            article_list.append(Article(article['tag'], article["o_id"], article['url'], article['title'][language],
-                                        time_formatted, article['content'][language], language, mongo_id))
+    def backfill_excerpts(self, batch_size: int = 500) -> int:
+        """
+        Write the excerpts of the articles stored before the excerpts were written on insertion.
+        :return: number of articles updated
+        """
+        updated = 0
+        batch = []
+        for document in self.db.articles.find({"excerpt": {"$exists": False}}, {"content": 1}):
+            batch.append(document)
+            if len(batch) >= batch_size:
+                updated += self.write_excerpts(batch)
+                batch = []
+        if batch:
+            updated += self.write_excerpts(batch)
+        if updated:
+            shared_cache.invalidate("articles")
+        return updated
+
+    def write_excerpts(self, documents: list[dict]) -> int:
+        from pymongo import UpdateOne
+        from modules.utils import make_excerpt
+
+        requests = [UpdateOne({"_id": document["_id"]},
+                              {"$set": {f"excerpt.{language}": make_excerpt(content)
+                                        for language, content in document["content"].items()},
+                               # Picked up by the next incremental backup
+                               "$currentDate": {"updated": True}})
+                    for document in self.load_contents(documents) if document["content"]]
+        return self.db.articles.bulk_write(requests, ordered=False).modified_count if requests else 0
+
+    def get_latest_article(self, language: str = 'ko', cursor_id: str = None, limit: int = 20) -> list[Article]:
+        from pymongo import DESCENDING
+
+        query = self.feed_query(cursor_id)
 
-        return article_list
+        # The cursor is consumed in the block, so the timing includes fetching the documents
+        with metrics.mongo_duration.time("feed"):
+            documents = self.load_contents(list(self.db.articles.find(query).sort("time", DESCENDING).limit(limit)),
+                                           language)
+            articles = [Article.from_mongo(article, language) for article in documents]
+        metrics.mongo_documents.inc("feed", amount=len(articles))
+        return articles
 
     def get_article_count(self) -> int:
-        return self.db.articles.count_documents({})
+        """
+        Number of articles, from the collection metadata instead of a scan of the collection.
+        """
+        with metrics.mongo_duration.time("count"):
+            return self.db.articles.estimated_document_count()
+
+    def update_counters(self, increments: dict) -> None:
+        """
+        Increment the fields of the counter document, maintained by the write paths.
+        :param increments: dictionary of field -> increment, e.g. {"tags.gbg": 1}
+        """
+        with metrics.mongo_duration.time("counters_update"):
+            self.db.counters.update_one({"_id": "articles"}, {"$inc": increments}, upsert=True)
+
+    def rebuild_counters(self) -> dict:
+        """
+        Recount the articles per tag and per language, and replace the counter document.
+        Run by setup.py, and after writing to the articles collection outside of this client.
+        :return: the counter document
+        """
+        with metrics.mongo_duration.time("counters_rebuild"):
+            facets = next(self.db.articles.aggregate([
+                {"$facet": {
+                    "total": [{"$count": "count"}],
+                    "tags": [{"$group": {"_id": "$tag", "count": {"$sum": 1}}}],
+                    "languages": [
+                        {"$project": {"language": {"$objectToArray": "$title"}}},
+                        {"$unwind": "$language"},
+                        {"$group": {"_id": "$language.k", "count": {"$sum": 1}}},
+                    ],
+                }}
+            ]))
+
+        counters = {
+            "total": facets["total"][0]["count"] if facets["total"] else 0,
+            "tags": {entry["_id"]: entry["count"] for entry in facets["tags"]},
+            "languages": {entry["_id"]: entry["count"] for entry in facets["languages"]},
+        }
+        self.db.counters.replace_one({"_id": "articles"}, counters, upsert=True)
+        return counters
+
+    def get_article_counts(self) -> dict:
+        """
+        Number of articles in total, per tag and per language (number of articles translated in the language),
+        read from the counter document in a single lookup. The counters are rebuilt if they do not exist yet.
+        :return: dictionary with the "total", "tags" and "languages" counts
+        """
+        with metrics.mongo_duration.time("counters"):
+            counters = self.db.counters.find_one({"_id": "articles"}, {"_id": 0})
+        if counters is None:
+            counters = self.rebuild_counters()
+
+        return {
+            "total": counters.get("total", 0),
+            "tags": counters.get("tags", {}),
+            "languages": {language: counters.get("languages", {}).get(language, 0)
+                          for language in Article.valid_languages},
+        }
+
+    @staticmethod
+    def missing_languages_stages(languages: Iterable[str]) -> list[dict]:
+        """
+        Aggregation stages projecting every article to its `_id`, `tag` and the list of the languages missing from
+        its title or content. Only the keys of the title and content maps leave the stages, never the texts.
+        """
+        languages = list(languages)
+        return [
+            {"$project": {
+                "tag": 1,
+                "title": {"$map": {"input": {"$objectToArray": {"$ifNull": ["$title", {}]}}, "in": "$$this.k"}},
+                # Languages of the embedded contents, or of the contents in article_bodies with the split layout
+                "content": {"$setUnion": [
+                    {"$map": {"input": {"$objectToArray": {"$ifNull": ["$content", {}]}}, "in": "$$this.k"}},
+                    {"$ifNull": ["$bodies", []]},
+                ]},
+            }},
+            {"$project": {
+                "tag": 1,
+                "missing": {"$filter": {
+                    "input": languages,
+                    "cond": {"$not": [{"$and": [{"$in": ["$$this", "$title"]}, {"$in": ["$$this", "$content"]}]}]},
+                }},
+            }},
+        ]
+
+    def get_translation_coverage(self, languages: Iterable[str] = Article.valid_languages) -> dict:
+        """
+        Count the missing translations on the server.
+        :param languages: languages every article should have
+        :return: dictionary with the number of articles, the number of articles missing at least one language, and
+        the number of missing articles per language and per tag
+        """
+        with metrics.mongo_duration.time("coverage"):
+            facets = next(self.db.articles.aggregate(self.missing_languages_stages(languages) + [
+                {"$facet": {
+                    "total": [{"$count": "count"}],
+                    "incomplete": [{"$match": {"missing.0": {"$exists": True}}}, {"$count": "count"}],
+                    "languages": [{"$unwind": "$missing"}, {"$group": {"_id": "$missing", "count": {"$sum": 1}}}],
+                    "tags": [{"$match": {"missing.0": {"$exists": True}}},
+                             {"$group": {"_id": "$tag", "count": {"$sum": 1}}}],
+                }}
+            ], allowDiskUse=True))
+
+        missing = {entry["_id"]: entry["count"] for entry in facets["languages"]}
+        return {
+            "total": facets["total"][0]["count"] if facets["total"] else 0,
+            "incomplete": facets["incomplete"][0]["count"] if facets["incomplete"] else 0,
+            "languages": {language: missing.get(language, 0) for language in languages},
+            "tags": {entry["_id"]: entry["count"] for entry in facets["tags"]},
+        }
+
+    def iter_missing_translations(self, languages: Iterable[str] = Article.valid_languages) -> Iterator[dict]:
+        """
+        Work list of the translations to do, computed on the server.
+        :param languages: languages every article should have
+        :return: iterator of {"id": MongoDB ID, "tag": tag, "missing": [languages]}, for the incomplete articles only
+        """
+        pipeline = self.missing_languages_stages(languages) + [{"$match": {"missing.0": {"$exists": True}}}]
+        for entry in self.db.articles.aggregate(pipeline, allowDiskUse=True, batchSize=5000):
+            yield {"id": str(entry["_id"]), "tag": entry.get("tag"), "missing": entry["missing"]}
 
 
 class ElasticsearchClient:
-    def __init__(self):
-        self.es = Elasticsearch("http://localhost:9200")
+    # index.max_result_window: hits past this offset can not be read with from/size
+    max_result_window = 10000
+
+    def __init__(self, url: str = "http://localhost:9200", index_prefix: str = "articles",
+                 autocomplete_backend: Optional[str] = None):
+        """
+        Elasticsearch client. Like MongoDBClient, the client is created on first use and `ping` checks the server.
+        :param url: URL of the Elasticsearch server
+        :param index_prefix: prefix of the per-language index names ({prefix}_{language})
+        :param autocomplete_backend: "completion" (completion suggester on the title prefix) or "prefix"
+        (search_as_you_type field, matching the words anywhere in the title). Defaults to the NEO_GUNG_AUTOCOMPLETE
+        environment variable, or "completion".
+        """
+        self.url = url
+        self.index_prefix = index_prefix
+        self.autocomplete_backend = autocomplete_backend or os.environ.get("NEO_GUNG_AUTOCOMPLETE", "completion")
+        if self.autocomplete_backend not in ("completion", "prefix"):
+            raise ValueError(f"Invalid autocomplete backend: {self.autocomplete_backend}")
+        self._es = None
+
+    @property
+    def es(self):
+        if self._es is None:
+            from elasticsearch import Elasticsearch
+            self._es = Elasticsearch(self.url)
+        return self._es
+
+    def ping(self, timeout: float = 2.0) -> bool:
+        """
+        Check if the Elasticsearch server is available.
+        :param timeout: request timeout in seconds
+        :return: True if the server answered, False otherwise.
+        """
         try:
-            self.es.ping()
-            log.info("Connected to Elasticsearch server")
+            if self.es.options(request_timeout=timeout).ping():
+                return True
+            log.error("Failed connecting to Elasticsearch server")
         except Exception as e:
             log.error(f"Failed connecting to Elasticsearch server: {e}")
-            exit(1)
+        return False
 
     def setup_index(self) -> None:
         # reset the index
         for language in Article.valid_languages:
-            index_name = f'articles_{language}'
+            index_name = f'{self.index_prefix}_{language}'
             if self.es.indices.exists(index=index_name):
                 self.es.indices.delete(index=index_name)
                 print(f"Deleted index: {index_name}")
@@ -227,10 +564,23 @@ class ElasticsearchClient:
                 },
                 "mappings": {
                     "properties": {
+                        # Filtered on with term and range clauses by search_articles
+                        "tag": {
+                            "type": "keyword"
+                        },
+                        "time": {
+                            "type": "date"
+                        },
                         "title": {
                             "type": "text",
                             "analyzer": analyzer_name
                         },
+                        # Shingles and edge n-grams of the title words, for the "prefix" autocomplete. A top-level
+                        # field filled by insert_article: search_as_you_type can not be a multi-field of the title.
+                        "title_prefix": {
+                            "type": "search_as_you_type",
+                            "analyzer": analyzer_name
+                        },
                         "text": {
                             "type": "text",
                             "analyzer": analyzer_name
@@ -246,10 +596,13 @@ class ElasticsearchClient:
                     }
                 }
             }
-            index_name = f'articles_{language}'
+            index_name = f'{self.index_prefix}_{language}'
             self.es.indices.create(index=index_name, body=settings)
 
     def insert_article(self, article: Article, entry_id: str, language='ko'):
+        # Only needed when indexing, and pulls in the HTML libraries
+        from modules.utils import strip_markdown
+
         # Prepare the entry for Elasticsearch
         entry_time = datetime.strptime(article.time, "%Y-%m-%d")
         article_text = strip_markdown(article.content)
@@ -260,31 +613,164 @@ class ElasticsearchClient:
             "title": article.title,
             "time": entry_time,
             "text": article_text,
-            "suggest": article.title
+            "suggest": article.title,
+            "title_prefix": article.title
         }
-        index_name = f'articles_{language}'
+        index_name = f'{self.index_prefix}_{language}'
         # Insert the article into Elasticsearch
-        self.es.index(index=index_name, body=es_entry, id=entry_id)
+        with metrics.es_duration.time("index"), \
+                tracing.span("es_index", tracing.article_key(article.source_prefix, article.article_id)):
+            self.es.index(index=index_name, body=es_entry, id=entry_id)
+        metrics.es_documents.inc("index")
+
+    def search_articles(self, query: str, language='ko', cursor: int = 0, limit: int = 20,
+                        tags: Optional[list[str]] = None, date_from: Optional[str] = None,
+                        date_to: Optional[str] = None, min_exact_hits: int = 5):
+        """
+        Search the articles of a language. A query of the exact terms runs first; the fuzzy query, which expands
+        every term into its close spellings, only runs when the exact query matches fewer than `min_exact_hits`
+        articles. The choice depends on the total number of hits, not on the page, so every page of a search is
+        answered by the same tier.
+        :param query: text to search
+        :param language: language of the index to search
+        :param cursor: offset of the first hit
+        :param limit: number of hits
+        :param tags: only the articles of these sources (config.json source prefixes)
+        :param date_from: only the articles published on or after this date (YYYY-MM-DD, or ES date math)
+        :param date_to: only the articles published on or before this date
+        :param min_exact_hits: minimum number of exact hits answering the search without the fuzzy query
+        :return: raw Elasticsearch response
+        """
+        filters = self.search_filters(tags, date_from, date_to)
+        tiers = self.search_tiers(query)
+
+        index_name = f'{self.index_prefix}_{language}'
+        for tier, match in tiers:
+            with metrics.es_duration.time(f"search_{tier}"):
+                response = self.es.search(index=index_name, request_cache=True,
+                                          body=self.search_body(match, filters, cursor, limit))
+            if tier == "fuzzy" or response['hits']['total']['value'] >= min_exact_hits:
+                break
+
+        metrics.search_tiers.inc(tier)
+        metrics.es_documents.inc("search", amount=len(response['hits']['hits']))
+        return response
+
+    def search_languages(self, query: str, languages: Iterable[str] = Article.valid_languages, cursor: int = 0,
+                         limit: int = 20, tags: Optional[list[str]] = None, date_from: Optional[str] = None,
+                         date_to: Optional[str] = None, min_exact_hits: int = 5) -> dict:
+        """
+        Search several languages at once, with one _msearch request per tier instead of one search per language.
+        The indexes of the languages hold the same articles under the same MongoDB IDs, so the hits are merged by ID.
+        The scores of different analyzers are not comparable, so each hit is scored relative to the best hit of its
+        language before merging, and an article keeps its best score across the languages.
+        :param query: text to search
+        :param languages: languages of the indexes to search
+        :param cursor: offset of the first merged hit
+        :param limit: number of merged hits
+        :param min_exact_hits: minimum number of exact hits, over all the languages, answering the search without
+        the fuzzy query
+        See `search_articles` for the other parameters.
+        :return: dictionary with "total", the largest number of hits of a language (the number of distinct articles
+        is at least this), and "hits", the list of {"_id", "score", "languages"} of the page
+        :raise ValueError: if the page ends past `max_result_window`
+        """
+        # Every language contributes up to the end of the page, so the merged page is complete. Past the result
+        # window, Elasticsearch can not return the hits: reject the page rather than return a truncated one.
+        window = cursor + limit
+        if window > self.max_result_window:
+            raise ValueError(f"Invalid cursor. The page must end within the first {self.max_result_window} hits: "
+                             f"{cursor}")
+        languages = list(languages)
+        filters = self.search_filters(tags, date_from, date_to)
+
+        for tier, match in self.search_tiers(query):
+            searches = []
+            for language in languages:
+                searches.append({"index": f'{self.index_prefix}_{language}', "request_cache": True})
+                searches.append({**self.search_body(match, filters, 0, window), "_source": False})
+            with metrics.es_duration.time(f"msearch_{tier}"):
+                responses = self.es.msearch(searches=searches)["responses"]
+
+            total = 0
+            for language, response in zip(languages, responses):
+                if "error" in response:
+                    log.error("Search failed in language %s: %s", language, response["error"])
+                    continue
+                total = max(total, response["hits"]["total"]["value"])
+            if tier == "fuzzy" or total >= min_exact_hits:
+                break
+
+        merged = {}
+        for language, response in zip(languages, responses):
+            if "error" in response or not response["hits"]["hits"]:
+                continue
+            best = response["hits"]["max_score"] or 1.0
+            for hit in response["hits"]["hits"]:
+                score = hit["_score"] / best
+                entry = merged.setdefault(hit["_id"], {"_id": hit["_id"], "score": score, "languages": []})
+                entry["score"] = max(entry["score"], score)
+                entry["languages"].append(language)
+
+        hits = sorted(merged.values(), key=lambda entry: -entry["score"])[cursor:cursor + limit]
+        metrics.search_tiers.inc(tier)
+        metrics.es_documents.inc("msearch", amount=len(hits))
+        return {"total": total, "hits": hits}
+
+    @staticmethod
+    def search_filters(tags: Optional[list[str]], date_from: Optional[str], date_to: Optional[str]) -> list[dict]:
+        # Filter clauses do not score, so they are cached by the node query cache and reused across queries
+        filters = []
+        if tags:
+            filters.append({"terms": {"tag": tags}})
+        if date_from or date_to:
+            time_range = {}
+            if date_from:
+                time_range["gte"] = date_from
+            if date_to:
+                time_range["lte"] = date_to
+            filters.append({"range": {"time": time_range}})
+        return filters
+
+    @staticmethod
+    def search_tiers(query: str) -> list[tuple[str, dict]]:
+        """
+        Queries of the search, from the cheapest: the exact terms (phrase, or all the terms), then the fuzzy match.
+        """
+        fields = ["title^2", "text"]  # Boost title matches
+        return [
+            ("exact", {
+                "bool": {
+                    "should": [
+                        {"multi_match": {"query": query, "fields": fields, "type": "phrase", "boost": 2}},
+                        {"multi_match": {"query": query, "fields": fields, "operator": "and"}},
+                    ],
+                    "minimum_should_match": 1,
+                }
+            }),
+            ("fuzzy", {"multi_match": {"query": query, "fields": fields, "fuzziness": "AUTO"}}),
+        ]
 
-    def search_articles(self, query: str, language='ko', cursor: int = 0, limit: int = 20):
-        index_name = f'articles_{language}'
-        response = self.es.search(index=index_name, body={
+    @staticmethod
+    def search_body(match: dict, filters: list[dict], cursor: int, limit: int) -> dict:
+        return {
             "from": cursor,  # Starting point for the results
             "size": limit,  # Number of search hits to return
             "query": {
                 "function_score": {
                     "query": {
-                        "multi_match": {
-                            "query": query,
-                            "fields": ["title^2", "text"],  # Boost title matches
-                            "fuzziness": "AUTO"
+                        "bool": {
+                            "must": match,
+                            "filter": filters
                         }
                     },
                     "functions": [
                         {
                             "gauss": {
                                 "time": {
-                                    "origin": "now",
+                                    # Rounded to the day, so the same query gives the same request all day
+                                    # and can be served from the shard request cache
+                                    "origin": "now/d",
                                     "scale": "60d",
                                     "offset": "60d",
                                     "decay": 0.5
@@ -295,22 +781,58 @@ class ElasticsearchClient:
                     "score_mode": "multiply"  # Combine the scores from the query and the function
                 }
             },
-        })
-        return response
+        }
 
-    def autocomplete(self, query: str, language='ko') -> list[str]:
-        index_name = f'articles_{language}'
-        response = self.es.search(index=index_name, body={
-            "suggest": {
-                "article_suggest": {
-                    "prefix": query,
-                    "completion": {
-                        "field": "suggest"
+    def autocomplete(self, query: str, language='ko', limit: int = 5) -> list[str]:
+        """
+        Titles completing the query, with the backend chosen by `autocomplete_backend`.
+        :param query: beginning of the title, or with the "prefix" backend, of any words of the title
+        :param language: language of the index
+        :param limit: maximum number of titles
+        """
+        if self.autocomplete_backend == "prefix":
+            return self.autocomplete_prefix(query, language, limit)
+        return self.autocomplete_completion(query, language, limit)
+
+    def autocomplete_completion(self, query: str, language='ko', limit: int = 5) -> list[str]:
+        index_name = f'{self.index_prefix}_{language}'
+        with metrics.es_duration.time("suggest"):
+            response = self.es.search(index=index_name, body={
+                "suggest": {
+                    "article_suggest": {
+                        "prefix": query,
+                        "completion": {
+                            "field": "suggest",
+                            "size": limit
+                        }
                     }
                 }
-            }
-        })
+            })
 
         # Extracting suggestions
         suggestions = response.get('suggest', {}).get('article_suggest', [])[0].get('options', [])
+        metrics.es_documents.inc("suggest", amount=len(suggestions))
         return [suggestion['text'] for suggestion in suggestions]
+
+    def autocomplete_prefix(self, query: str, language='ko', limit: int = 5) -> list[str]:
+        """
+        Titles containing the words of the query, the last word being matched as a prefix, so "야간" completes
+        "[경복궁] 야간관람 안내". Only the titles are read from the source.
+        """
+        index_name = f'{self.index_prefix}_{language}'
+        with metrics.es_duration.time("suggest_prefix"):
+            response = self.es.search(index=index_name, request_cache=True, body={
+                "size": limit * 2,  # Articles may share their title
+                "_source": ["title"],
+                "query": {
+                    "multi_match": {
+                        "query": query,
+                        "type": "bool_prefix",
+                        "fields": ["title_prefix", "title_prefix._2gram", "title_prefix._3gram"]
+                    }
+                }
+            })
+
+        titles = list(dict.fromkeys(hit["_source"]["title"] for hit in response["hits"]["hits"]))[:limit]
+        metrics.es_documents.inc("suggest_prefix", amount=len(titles))
+        return titles
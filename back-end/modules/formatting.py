@@ -1,22 +1,217 @@
 # coding=utf-8
-from openai import OpenAI
+from types import SimpleNamespace
+from typing import Hashable, Optional
+import asyncio
+import hashlib
+import random
 import json
+import zlib
 
-with open("../secrets.json", "r", encoding="utf-8") as f:
-    token = json.loads(f.read())["open_AI_key"]
+from modules.log_manager import log
+from modules import tracing
 
-client = OpenAI(api_key=token)
+secrets_file = "../secrets.json"
+client = None
+
+MODEL = "ft:gpt-3.5-turbo-1106:personal::8QGmm9Pa"
+SYSTEM_PROMPT = "You are a notice editor. For each document, please add the following to the original text:\n1. Refine and Fix the Markdown formatting so it has correct bullets, lists, and formatting.\n2. Remove line breaks if they are in between sentences.\n3. Substitute symbols (Like --> to →)\n4. Do not translate the document, leave it as it is. If there is a translated version, remove it."
+
+
+def format_messages(notice_text: str) -> list[dict]:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": notice_text}
+    ]
+
+
+def read_token() -> str:
+    with open(secrets_file, "r", encoding="utf-8") as f:
+        return json.loads(f.read())["open_AI_key"]
+
+
+def get_client():
+    """
+    Get the OpenAI client, created on first use so importing this module does not need the secrets file
+    or the openai package.
+    :return: OpenAI client
+    """
+    global client
+    if client is None:
+        from openai import OpenAI
+        client = OpenAI(api_key=read_token())
+    return client
+
+
+def create_async_client():
+    """
+    Create an AsyncOpenAI client (without retries, see NoticeFormatter). Its connection pool is bound to the event
+    loop it is used in, so it is not shared: each `NoticeFormatter.run` creates and closes its own.
+    :return: AsyncOpenAI client
+    """
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=read_token(), max_retries=0)
 
 
 def format_notice(notice_text: str) -> str:
-    completion = client.chat.completions.create(
-        model="ft:gpt-3.5-turbo-1106:personal::8QGmm9Pa",
-        messages=[
-            {"role": "system",
-             "content": "You are a notice editor. For each document, please add the following to the original text:\n1. Refine and Fix the Markdown formatting so it has correct bullets, lists, and formatting.\n2. Remove line breaks if they are in between sentences.\n3. Substitute symbols (Like --> to →)\n4. Do not translate the document, leave it as it is. If there is a translated version, remove it."},
-            {"role": "user", "content": notice_text}
-        ]
-    )
+    with tracing.span("format"):
+        completion = get_client().chat.completions.create(
+            model=MODEL,
+            messages=format_messages(notice_text)
+        )
 
     response_text = completion.choices[0].message.content
     return response_text
+
+
+def content_hash(text: str) -> str:
+    """
+    Hash of the markdown sent to the formatter, used to detect unchanged articles.
+    :param text: cleaned markdown of the article
+    :return: hex digest
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class TokenUsage:
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def add(self, usage) -> None:
+        self.requests += 1
+        if usage is not None:
+            self.prompt_tokens += usage.prompt_tokens or 0
+            self.completion_tokens += usage.completion_tokens or 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+        }
+
+    def __str__(self):
+        return f"{self.requests} requests ({self.failures} failed), " \
+               f"{self.prompt_tokens} prompt + {self.completion_tokens} completion tokens"
+
+
+class StubFormattingClient:
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0):
+        """
+        Offline stand-in of AsyncOpenAI, answering `chat.completions.create` with the original text.
+        Delay and failures only depend on the input text, so benchmark runs are reproducible regardless of the
+        order of the calls. A failing text fails on every attempt.
+
+        :param latency: maximum delay of a call in seconds
+        :param error_rate: fraction of the calls (0.0 - 1.0) that raise a RuntimeError
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model: str, messages: list[dict]):
+        self.calls += 1
+        text = messages[-1]["content"]
+        checksum = zlib.crc32(text.encode("utf-8"))
+
+        if self.latency > 0:
+            await asyncio.sleep(self.latency * (checksum % 1000) / 1000)
+        if (checksum >> 10) % 10000 < self.error_rate * 10000:
+            raise RuntimeError("Stub formatting error")
+
+        formatted = text.replace("-->", "→").strip()
+        usage = SimpleNamespace(prompt_tokens=len(SYSTEM_PROMPT + text) // 2, completion_tokens=len(formatted) // 2)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=formatted))], usage=usage)
+
+
+class NoticeFormatter:
+    def __init__(self, async_client=None, max_concurrency: int = 4, max_retries: int = 4, backoff: float = 1.0):
+        """
+        Asynchronous formatting stage for the GPT notice editor.
+
+        :param async_client: AsyncOpenAI compatible client, used as is by every run. By default, each run creates an
+        AsyncOpenAI client with the configured key, and closes it when done.
+        :param max_concurrency: maximum number of requests in flight.
+        :param max_retries: number of retries of a failed request before giving up.
+        :param backoff: base delay in seconds of the exponential backoff between retries.
+        """
+        self.client = async_client
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.usage = TokenUsage()
+        self.results = {}  # content hash -> formatted text
+
+    async def format_one(self, async_client, notice_text: str, semaphore: asyncio.Semaphore,
+                         key: Optional[Hashable] = None) -> Optional[str]:
+        """
+        Format a single notice, reusing the result of an identical notice if it was already formatted.
+        :param async_client: AsyncOpenAI compatible client
+        :param notice_text: cleaned markdown of the notice
+        :param semaphore: semaphore bounding the number of requests in flight
+        :param key: key of the notice in the pipeline trace
+        :return: formatted markdown, or None if every attempt failed
+        """
+        digest = content_hash(notice_text)
+        if digest in self.results:
+            return self.results[digest]
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with semaphore:
+                    with tracing.span("format", key):
+                        completion = await async_client.chat.completions.create(
+                            model=MODEL, messages=format_messages(notice_text))
+                self.usage.add(getattr(completion, "usage", None))
+                self.results[digest] = completion.choices[0].message.content
+                return self.results[digest]
+            except Exception as e:
+                self.usage.requests += 1
+                self.usage.failures += 1
+                if attempt == self.max_retries:
+                    log.error(f"Formatting failed after {self.max_retries + 1} attempts: {e}")
+                    return None
+
+                delay = self.backoff * 2 ** attempt + random.uniform(0, self.backoff)
+                log.warning(f"(Attempt {attempt + 1}/{self.max_retries + 1}) Formatting failed, "
+                            f"retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+
+    async def format_all(self, notices: dict[Hashable, str]) -> dict[Hashable, Optional[str]]:
+        """
+        Format the notices concurrently.
+        :param notices: dictionary of key -> cleaned markdown
+        :return: dictionary of key -> formatted markdown (None for the notices that failed)
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        # Identical notices (e.g. reposted on several boards) are only sent once
+        unique_texts = {}
+        for key, text in notices.items():
+            unique_texts.setdefault(content_hash(text), (key, text))
+        # Retries are handled in format_one, with the backoff shared across the stage
+        async_client = self.client if self.client is not None else create_async_client()
+        try:
+            formatted = await asyncio.gather(*(self.format_one(async_client, text, semaphore, key)
+                                               for key, text in unique_texts.values()))
+        finally:
+            if self.client is None:
+                await async_client.close()
+        by_hash = dict(zip(unique_texts, formatted))
+
+        return {key: by_hash[content_hash(text)] for key, text in notices.items()}
+
+    def run(self, notices: dict[Hashable, str]) -> dict[Hashable, Optional[str]]:
+        """
+        Synchronous entry point of `format_all`.
+        """
+        return asyncio.run(self.format_all(notices))
@@ -0,0 +1,105 @@
+import argparse
+
+from modules.db import MongoDBClient
+from modules.log_manager import Logger, log
+
+
+def split_contents(mongo: MongoDBClient, batch_size: int = 500) -> int:
+    """
+    Move the embedded contents of the articles into the `article_bodies` collection (see MongoDBClient). Once
+    `article_bodies` holds contents, the writers store the new articles in the split layout as well.
+    Runs on the live database: an article is only converted if its contents did not change since they were read,
+    and the conversion can be stopped and started again.
+    :return: number of articles converted
+    """
+    from pymongo import UpdateOne
+
+    mongo.ensure_bodies_collection()
+    converted = 0
+    while True:
+        documents = list(mongo.db.articles.find({"content": {"$exists": True}}, {"content": 1}).limit(batch_size))
+        if not documents:
+            break
+
+        bodies = [UpdateOne({"article": document["_id"], "language": language},
+                            {"$set": {"content": content}, "$currentDate": {"updated": True}}, upsert=True)
+                  for document in documents for language, content in document["content"].items()]
+        if bodies:
+            mongo.db.article_bodies.bulk_write(bodies, ordered=False)
+
+        # The filter on the contents skips the articles translated in the meantime, they are read again next batch
+        result = mongo.db.articles.bulk_write([
+            UpdateOne({"_id": document["_id"], "content": document["content"]},
+                      {"$unset": {"content": ""}, "$set": {"bodies": sorted(document["content"])}})
+            for document in documents
+        ], ordered=False)
+        if result.modified_count == 0:
+            log.warning("No article converted in the last batch, stopping")
+            break
+        converted += result.modified_count
+        log.info("%s articles converted to the split layout", converted)
+    return converted
+
+
+def embed_contents(mongo: MongoDBClient, batch_size: int = 500) -> int:
+    """
+    Move the contents of `article_bodies` back into the article documents. Stop the writers first: a translation
+    added to `article_bodies` during the conversion of its article would not be copied. Once `article_bodies` is
+    empty, the writers store the new articles in the embedded layout.
+    :return: number of articles converted
+    """
+    from pymongo import UpdateOne
+
+    converted = 0
+    while True:
+        documents = mongo.load_contents(list(mongo.db.articles.find({"content": {"$exists": False}},
+                                                                    {"_id": 1}).limit(batch_size)))
+        if not documents:
+            break
+
+        mongo.db.articles.bulk_write([
+            UpdateOne({"_id": document["_id"], "content": {"$exists": False}},
+                      {"$set": {"content": document["content"]}, "$unset": {"bodies": ""}})
+            for document in documents
+        ], ordered=False)
+        mongo.db.article_bodies.delete_many({"article": {"$in": [document["_id"] for document in documents]}})
+        converted += len(documents)
+        log.info("%s articles converted to the embedded layout", converted)
+    return converted
+
+
+def layout_status(mongo: MongoDBClient) -> dict:
+    """
+    Number of articles in each layout, and size of the collections.
+    """
+    status = {
+        "embedded": mongo.db.articles.count_documents({"content": {"$exists": True}}),
+        "split": mongo.db.articles.count_documents({"content": {"$exists": False}}),
+    }
+    for collection in ("articles", "article_bodies"):
+        if collection in mongo.db.list_collection_names():
+            stats = mongo.db.command("collStats", collection)
+            status[collection] = {"documents": stats["count"], "size": stats["size"],
+                                  "storage_size": stats["storageSize"]}
+    return status
+
+
+if __name__ == "__main__":
+    Logger(debug=False)
+
+    parser = argparse.ArgumentParser(description="Convert the stored articles between the storage layouts")
+    parser.add_argument("command", choices=["split", "embed", "status"])
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--mongo-host", default="localhost")
+    parser.add_argument("--mongo-port", type=int, default=27017)
+    args = parser.parse_args()
+
+    mongo = MongoDBClient(args.mongo_host, args.mongo_port)
+    if not mongo.ping():
+        exit(1)
+
+    if args.command == "split":
+        log.info("Converted %s articles to the split layout.", split_contents(mongo, args.batch_size))
+    elif args.command == "embed":
+        log.info("Converted %s articles to the embedded layout.", embed_contents(mongo, args.batch_size))
+    log.info("Layout: %s", layout_status(mongo))
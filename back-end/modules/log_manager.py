@@ -1,4 +1,11 @@
 import logging as log
+import logging.handlers
+import atexit
+import queue
+import json
+import sys
+import copy
+from datetime import datetime, timezone
 
 
 class ColoredFormatter(log.Formatter):
@@ -18,33 +25,140 @@ class ColoredFormatter(log.Formatter):
         return f"{self.colors.get(record.levelname, '')}{log_message}{self.colors.get('RESET', '')}"
 
 
+class JSONFormatter(log.Formatter):
+    # Attributes of every LogRecord. Anything else was passed with `extra=` and is added to the JSON object.
+    reserved = frozenset(vars(log.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName,
+            "process": record.process,
+            # Milliseconds since the logging module was loaded, to measure the time between two records
+            "uptime_ms": round(record.relativeCreated, 3),
+        }
+        for key, value in vars(record).items():
+            if key not in self.reserved:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RecordQueueHandler(log.handlers.QueueHandler):
+    def prepare(self, record):
+        """
+        Merge the arguments into the message in the calling thread, since they may change before the listener
+        handles the record, but leave the rest of the formatting (and the traceback) to the listener's formatters.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = log.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
 class Logger:
-    def __init__(self, debug: bool = False, log_file: str = 'error.log'):
-        # Create logger
+    # Handlers installed on the root logger by the last instantiation, removed when configuring again
+    handlers = []
+    listener = None
+
+    def __init__(self, debug: bool = False, log_file: str = 'error.log', json_format: bool = False,
+                 asynchronous: bool = False):
+        """
+        Configure the root logger. Instantiating it again replaces the previous configuration instead of adding
+        duplicate handlers.
+
+        :param debug: If True, log debug messages to the console and the log file.
+        :param log_file: Path of the file receiving the errors (every message in debug mode). None to disable it.
+        :param json_format: If True, write one JSON object per record instead of colored text.
+        :param asynchronous: If True, the calling thread only puts the records in a queue, and a background thread
+        formats and writes them. Process pools must call `configure_worker` in their workers (see ConversionPool).
+        """
         logger = log.getLogger()
-        logger.setLevel(log.INFO)
+        self.reset()
+
+        level = log.DEBUG if debug else log.INFO
+        logger.setLevel(level)
 
         # Create custom formatter
-        formatter = ColoredFormatter('%(asctime)s [%(levelname)s]: %(message)s', '%y-%m-%d %H:%M:%S')
+        if json_format:
+            formatter = JSONFormatter()
+        elif sys.stderr.isatty():
+            formatter = ColoredFormatter('%(asctime)s [%(levelname)s]: %(message)s', '%y-%m-%d %H:%M:%S')
+        else:
+            formatter = log.Formatter('%(asctime)s [%(levelname)s]: %(message)s', '%y-%m-%d %H:%M:%S')
 
         # Stream handler (console) with colors
         stream_handler = log.StreamHandler()
-        stream_handler.setLevel(log.INFO)
+        stream_handler.setLevel(level)
         stream_handler.setFormatter(formatter)
-        logger.addHandler(stream_handler)
+        handlers = [stream_handler]
 
         if log_file:
-            logger.info(f"Logging to file: {log_file}")
             file_handler = log.FileHandler(log_file)
-            file_handler.setLevel(log.ERROR)
-            file_handler.setFormatter(formatter)
-            logger.addHandler(file_handler)
+            file_handler.setLevel(log.DEBUG if debug else log.ERROR)
+            # No colors in the file
+            file_handler.setFormatter(formatter if json_format else
+                                      log.Formatter('%(asctime)s [%(levelname)s]: %(message)s', '%y-%m-%d %H:%M:%S'))
+            handlers.append(file_handler)
+
+        if asynchronous:
+            Logger.listener = log.handlers.QueueListener(queue.SimpleQueue(), *handlers, respect_handler_level=True)
+            Logger.listener.start()
+            Logger.handlers = [RecordQueueHandler(Logger.listener.queue)]
+        else:
+            Logger.handlers = handlers
 
-            if debug:
-                file_handler.setLevel(log.DEBUG)
+        for handler in Logger.handlers:
+            logger.addHandler(handler)
 
+        if log_file:
+            logger.info("Logging to file: %s", log_file)
         if debug:
             logger.info("Debug mode enabled")
-            logger.setLevel(log.DEBUG)
-            stream_handler.setLevel(log.DEBUG)
 
+    @classmethod
+    def configure_worker(cls) -> None:
+        """
+        Initializer of the forked worker processes. The listener thread of the asynchronous mode only runs in the
+        parent, so the inherited queue handler would silently drop the records of the worker: the worker writes
+        them directly with the listener's handlers instead.
+        """
+        logger = log.getLogger()
+        for handler in cls.handlers:
+            logger.removeHandler(handler)
+        if cls.listener is not None:
+            cls.handlers = list(cls.listener.handlers)
+            cls.listener = None
+            for handler in cls.handlers:
+                logger.addHandler(handler)
+
+    @classmethod
+    def reset(cls) -> None:
+        """
+        Remove the handlers installed by the previous instantiation, flushing the queued records.
+        """
+        logger = log.getLogger()
+        for handler in cls.handlers:
+            logger.removeHandler(handler)
+            handler.close()
+        cls.handlers = []
+        if cls.listener is not None:
+            cls.listener.stop()
+            for handler in cls.listener.handlers:
+                handler.close()
+            cls.listener = None
+
+
+# Write the records still in the queue when the interpreter exits
+atexit.register(Logger.reset)
@@ -0,0 +1,318 @@
+import os
+import json
+import time
+import atexit
+import bisect
+import threading
+import contextvars
+from typing import Iterable, Optional
+
+# Metrics are collected unless the NEO_GUNG_METRICS environment variable is set to 0.
+# When disabled, the timers are a shared no-op object and the API does not install its middleware.
+enabled = os.environ.get("NEO_GUNG_METRICS", "1") != "0"
+# The API runs several worker processes (gunicorn), each with its own registry. When NEO_GUNG_METRICS_DIR is set,
+# every worker writes its values to a file of this directory, and /metrics renders the sum of the files, so a scrape
+# sees the whole pool whichever worker answers it (see `Registry.share`, started by the API). Clear the directory when
+# the pool starts (see prestart.sh).
+shared_directory = os.environ.get("NEO_GUNG_METRICS_DIR")
+# Seconds between two writes of a worker's values. The other workers' values seen by a scrape are at most that old.
+SHARE_INTERVAL = 5.0
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(names: Iterable[str], values: Iterable, extra: str = "") -> str:
+    labels = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        """
+        Base class of the metrics, holding one value per combination of label values.
+        :param name: metric name, in the Prometheus naming convention
+        :param documentation: help text of the metric
+        :param labels: names of the labels
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def check_labels(self, values: tuple) -> None:
+        if len(values) != len(self.labels):
+            raise ValueError(f"{self.name} expects the labels {self.labels}: {values}")
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def empty(self) -> "Metric":
+        """
+        :return: a metric of the same name, labels and kind without any value, to merge values into
+        """
+        return type(self)(self.name, self.documentation, self.labels)
+
+    def snapshot(self) -> list:
+        """
+        :return: JSON serializable list of [label values, value]
+        """
+        with self.lock:
+            return [[list(label_values), value] for label_values, value in self.values.items()]
+
+    def merge(self, snapshot: list) -> None:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        if not enabled:
+            return
+        self.check_labels(label_values)
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def get(self, *label_values) -> float:
+        return self.values.get(label_values, 0)
+
+    def merge(self, snapshot: list) -> None:
+        for label_values, value in snapshot:
+            label_values = tuple(label_values)
+            self.values[label_values] = self.values.get(label_values, 0) + value
+
+    def samples(self) -> Iterable[str]:
+        for label_values, value in sorted(self.values.items()):
+            yield f"{self.name}_total{format_labels(self.labels, label_values)} {value}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        """
+        Distribution of observed values, in cumulative buckets.
+        :param buckets: upper bounds of the buckets, in increasing order. +Inf is added automatically.
+        """
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def empty(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, self.labels, self.buckets)
+
+    def snapshot(self) -> list:
+        with self.lock:
+            return [[list(label_values), [list(counts), total, count]]
+                    for label_values, (counts, total, count) in self.values.items()]
+
+    def merge(self, snapshot: list) -> None:
+        for label_values, (counts, total, count) in snapshot:
+            entry = self.values.setdefault(tuple(label_values), [[0] * (len(self.buckets) + 1), 0.0, 0])
+            entry[0] = [a + b for a, b in zip(entry[0], counts)]
+            entry[1] += total
+            entry[2] += count
+
+    def observe(self, value: float, *label_values) -> None:
+        if not enabled:
+            return
+        self.check_labels(label_values)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(label_values)
+            if entry is None:
+                # [counts per bucket (the last one is +Inf), sum, count]
+                entry = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, *label_values) -> "Timer":
+        """
+        Context manager observing the duration of the block in seconds.
+        """
+        if not enabled:
+            return noop_timer
+        return Timer(self, label_values)
+
+    def samples(self) -> Iterable[str]:
+        for label_values, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                yield f"{self.name}_bucket{format_labels(self.labels, label_values, le)} {cumulative}"
+            yield f"{self.name}_sum{format_labels(self.labels, label_values)} {total}"
+            yield f"{self.name}_count{format_labels(self.labels, label_values)} {count}"
+
+
+class Timer:
+    __slots__ = ("histogram", "label_values", "start", "elapsed")
+
+    def __init__(self, histogram: Histogram, label_values: tuple):
+        self.histogram = histogram
+        self.label_values = label_values
+        self.start = 0.0
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.elapsed = time.perf_counter() - self.start
+        self.histogram.observe(self.elapsed, *self.label_values)
+
+
+class NoopTimer:
+    elapsed = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+noop_timer = NoopTimer()
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.sharing = None  # pid of the process writing its values to the shared directory
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Iterable[str] = (),
+                  buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def write_snapshot(self, directory: str) -> None:
+        """
+        Write the values of the process to `{directory}/{pid}.json`. The file is replaced atomically, so readers
+        never see a partial file.
+        """
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump({name: metric.snapshot() for name, metric in self.metrics.items()}, f)
+        os.replace(path + ".tmp", path)
+
+    def share(self, directory: str, interval: float = SHARE_INTERVAL) -> None:
+        """
+        Write the values of the process to the shared directory every `interval` seconds, and when it exits.
+        The files of the exited workers are kept, so the counters of the pool never go back.
+        Runs once per process, and again in a forked child.
+        """
+        if self.sharing == os.getpid():
+            return
+        self.sharing = os.getpid()
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.write_snapshot(directory)
+                except OSError:
+                    pass
+
+        threading.Thread(target=loop, name="metrics-share", daemon=True).start()
+        atexit.register(self.write_snapshot, directory)
+
+    def collect(self, directory: str) -> list[Metric]:
+        """
+        Sum the values written by every process to the shared directory.
+        """
+        self.write_snapshot(directory)
+        merged = {name: metric.empty() for name, metric in self.metrics.items()}
+        for file_name in os.listdir(directory):
+            if not file_name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(directory, file_name)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, values in snapshot.items():
+                if name in merged:
+                    merged[name].merge(values)
+        return list(merged.values())
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format, summed over the worker processes when
+        NEO_GUNG_METRICS_DIR is set.
+        """
+        metrics = self.collect(shared_directory) if shared_directory else self.metrics.values()
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+registry = Registry()
+
+request_duration = registry.histogram("neo_gung_request_duration_seconds", "Latency of the API requests.",
+                                      ("route", "method", "language", "status"))
+mongo_duration = registry.histogram("neo_gung_mongo_duration_seconds", "Duration of the MongoDB operations.",
+                                    ("operation",))
+mongo_documents = registry.counter("neo_gung_mongo_documents", "Documents returned or written by MongoDB.",
+                                   ("operation",))
+es_duration = registry.histogram("neo_gung_es_duration_seconds", "Duration of the Elasticsearch operations.",
+                                 ("operation",))
+es_documents = registry.counter("neo_gung_es_documents", "Documents returned or written by Elasticsearch.",
+                                ("operation",))
+search_tiers = registry.counter("neo_gung_search_tiers",
+                                "Searches answered by each tier of the search (exact or fuzzy).", ("tier",))
+cache_requests = registry.counter("neo_gung_cache_requests", "Cache lookups, by cache and result (hit or miss).",
+                                  ("cache", "result"))
+
+# Labels filled in while handling a request (e.g. the language, once validated). The middleware sets a new dict for
+# every request; the handlers only mutate it, so the values are visible even from the endpoint's task or thread.
+request_labels = contextvars.ContextVar("request_labels", default=None)
+
+
+def set_request_label(name: str, value: str) -> None:
+    labels = request_labels.get()
+    if labels is not None:
+        labels[name] = value
+
+
+def cache_lookup(cache: str, hits: int, misses: int = 0) -> None:
+    """
+    Record the result of cache lookups.
+    :param cache: name of the cache
+    :param hits: number of keys found
+    :param misses: number of keys not found
+    """
+    if not enabled:
+        return
+    if hits:
+        cache_requests.inc(cache, "hit", amount=hits)
+    if misses:
+        cache_requests.inc(cache, "miss", amount=misses)
+
+
+def cache_hit_ratio(cache: str) -> Optional[float]:
+    hits = cache_requests.get(cache, "hit")
+    total = hits + cache_requests.get(cache, "miss")
+    return hits / total if total else None
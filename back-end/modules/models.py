@@ -1,12 +1,19 @@
 import re
 from typing import Optional
 
+date_re = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
 
 class Article:
-    valid_languages = ["ko", "en", "ja", "zh", "es"]
+    __slots__ = ("source_prefix", "article_id", "url", "title", "time", "content", "language", "mongo_id",
+                 "related")
+
+    valid_languages = ("ko", "en", "ja", "zh", "es")
+    language_set = frozenset(valid_languages)
+    valid_sources = frozenset(("cdg", "cgg", "dsg-e", "dsg-n", "gbg", "jm", "rt-n", "rt-e"))
 
     def __init__(self, source_prefix: str, article_id: int, source_url: str, title: str, time: str, content: str,
-                 language: str = "ko", mongo_id: Optional[str] = None):
+                 language: str = "ko", mongo_id: Optional[str] = None, related: Optional[list[str]] = None):
         """
         Initialize a new article instance.
 
@@ -18,6 +25,8 @@ class Article:
         :param time: Timestamp of the article publication time, in the YYYY-MM-DD format.
         :param content: Main content of the article in markdown format.
         :param language: Language of the article. Must be one of: "ko" or "en".
+        :param mongo_id: MongoDB ID of the article.
+        :param related: MongoDB IDs of the related articles, precomputed by modules.related.
 
         :raises ValueError: If the `source_prefix` is not one of the specified valid values.
         :raises ValueError: If the `article_id` is not an integer or less than 1.
@@ -25,17 +34,17 @@ class Article:
         """
 
         # Check for errors in the input
-        if source_prefix and source_prefix not in ["cdg", "cgg", "dsg-e", "dsg-n", "gbg", "jm", "rt-n", "rt-e"]:
+        if source_prefix and source_prefix not in self.valid_sources:
             raise ValueError(
                 "Invalid source prefix. It must be one of: 'cdg', 'cgg', 'dsg-e', 'dsg-j', 'dsg-n', 'gbg', 'jm'.")
 
         if not article_id or not isinstance(article_id, int) or article_id < 1:
             raise ValueError(f"Invalid article ID. It must be a positive integer: {article_id}")
 
-        if not time or not re.match(r"^\d{4}-\d{2}-\d{2}$", time):
+        if not time or not date_re.match(time):
             raise ValueError(f"Invalid time. It must be in the YYYY-MM-DD format: {time}")
 
-        if not language or language not in self.valid_languages:
+        if not language or language not in self.language_set:
             raise ValueError(f"Invalid language. It must be one of: 'ko', 'en', 'ja', 'zh', 'es': {language}")
 
         self.source_prefix = source_prefix
@@ -46,6 +55,29 @@ class Article:
         self.content = content
         self.language = language
         self.mongo_id = mongo_id
+        self.related = related
+
+    @classmethod
+    def from_mongo(cls, document: dict, language: str = "ko", with_id: bool = True) -> "Article":
+        """
+        Build an article from a MongoDB document, without validation since it was validated on insertion.
+
+        :param document: Document of the articles collection.
+        :param language: Language of the title and content to use.
+        :param with_id: If True, the MongoDB ID of the document is kept in `mongo_id`.
+        :raises KeyError: If the document has no title or content in the language.
+        """
+        article = cls.__new__(cls)
+        article.source_prefix = document["tag"]
+        article.article_id = document["o_id"]
+        article.url = document["url"]
+        article.title = document["title"][language]
+        article.time = document["time"].date().isoformat()
+        article.content = document["content"][language]
+        article.language = language
+        article.mongo_id = str(document["_id"]) if with_id else None
+        article.related = document.get("related", {}).get(language, [])
+        return article
 
     def to_dict(self) -> dict:
         result = {
@@ -59,6 +91,8 @@ class Article:
         }
         if self.mongo_id:
             result["id"] = self.mongo_id
+        if self.related is not None:
+            result["related"] = self.related
 
         return result
 
@@ -70,7 +104,51 @@ class Article:
                f"Content: {self.content}\n"
 
 
+class ArticleSummary:
+    __slots__ = ("mongo_id", "source_prefix", "title", "time", "excerpt", "language")
+
+    def __init__(self, mongo_id: str, source_prefix: str, title: str, time: str, excerpt: Optional[str],
+                 language: str = "ko"):
+        """
+        Card of an article in the feed: the article without its content, with a short plain text excerpt instead.
+
+        :param mongo_id: MongoDB ID of the article.
+        :param source_prefix: Prefix of the source of the article.
+        :param title: Title of the article.
+        :param time: Publication date, in the YYYY-MM-DD format.
+        :param excerpt: Beginning of the content as plain text. None for the articles stored before excerpts were.
+        :param language: Language of the title and excerpt.
+        """
+        self.mongo_id = mongo_id
+        self.source_prefix = source_prefix
+        self.title = title
+        self.time = time
+        self.excerpt = excerpt
+        self.language = language
+
+    @classmethod
+    def from_mongo(cls, document: dict, language: str = "ko") -> "ArticleSummary":
+        """
+        Build a summary from a MongoDB document, projected to the tag, time, title and excerpt fields.
+        :raises KeyError: If the document has no title in the language.
+        """
+        return cls(str(document["_id"]), document["tag"], document["title"][language],
+                   document["time"].date().isoformat(), document.get("excerpt", {}).get(language), language)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.mongo_id,
+            "source_prefix": self.source_prefix,
+            "title": self.title,
+            "time": self.time,
+            "excerpt": self.excerpt,
+            "language": self.language,
+        }
+
+
 class PreviewItem:
+    __slots__ = ("article_id", "title", "url", "time")
+
     def __init__(self, article_id: int = None, title: str = None, url: str = None, time: str = None):
         """
         Initialize a new board entry item instance.
@@ -113,7 +191,7 @@ class PreviewItem:
         if not self.article_id or not isinstance(self.article_id, int) or self.article_id < 1:
             return False
 
-        if re.match(r"^\d{4}-\d{2}-\d{2}$", self.time) is None:
+        if date_re.match(self.time) is None:
             return False
 
         return True
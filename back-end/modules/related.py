@@ -0,0 +1,140 @@
+import argparse
+from typing import Iterable, Optional
+
+from modules.db import MongoDBClient, ElasticsearchClient
+from modules.models import Article
+from modules.log_manager import Logger, log
+from modules import metrics, shared_cache
+
+
+class RelatedArticles:
+    def __init__(self, mongo: MongoDBClient, es: ElasticsearchClient, count: int = 5, batch_size: int = 50):
+        """
+        Batch job precomputing the related articles of every article with more_like_this queries, and storing their
+        IDs on the MongoDB documents (`related.{language}`), so they are read with the article at no extra cost.
+
+        :param mongo: MongoDB client
+        :param es: Elasticsearch client
+        :param count: number of related articles per article and language
+        :param batch_size: number of more_like_this queries per _msearch request
+        """
+        self.mongo = mongo
+        self.es = es
+        self.count = count
+        self.batch_size = batch_size
+
+    def query(self, index_name: str, mongo_id: str) -> dict:
+        return {
+            "size": self.count,
+            "_source": False,
+            "query": {
+                "more_like_this": {
+                    "fields": ["title", "text"],
+                    "like": [{"_index": index_name, "_id": mongo_id}],
+                    "min_term_freq": 1,
+                    "min_doc_freq": 2,
+                    "max_query_terms": 25,
+                }
+            },
+        }
+
+    def find_related(self, language: str, mongo_ids: list[str]) -> dict[str, list[str]]:
+        """
+        Run the more_like_this queries of the articles, `batch_size` articles per request.
+        :return: dictionary of MongoDB ID -> IDs of the related articles, best first
+        """
+        index_name = f"{self.es.index_prefix}_{language}"
+        related = {}
+        for start in range(0, len(mongo_ids), self.batch_size):
+            batch = mongo_ids[start:start + self.batch_size]
+            searches = []
+            for mongo_id in batch:
+                searches.append({"index": index_name})
+                searches.append(self.query(index_name, mongo_id))
+            with metrics.es_duration.time("related"):
+                responses = self.es.es.msearch(searches=searches)["responses"]
+
+            for mongo_id, response in zip(batch, responses):
+                if "error" in response:
+                    log.error("Related articles query failed for %s (%s): %s", mongo_id, language, response["error"])
+                    continue
+                related[mongo_id] = [hit["_id"] for hit in response["hits"]["hits"]]
+        return related
+
+    def store(self, language: str, related: dict[str, list[str]]) -> int:
+        from bson import ObjectId
+        from pymongo import UpdateOne
+
+        if not related:
+            return 0
+        requests = [UpdateOne({"_id": ObjectId(mongo_id)}, {"$set": {f"related.{language}": ids},
+                                                          "$currentDate": {"updated": True}})
+                    for mongo_id, ids in related.items()]
+        with metrics.mongo_duration.time("related_update"):
+            updated = self.mongo.db.articles.bulk_write(requests, ordered=False).matched_count
+        shared_cache.invalidate("articles")
+        return updated
+
+    def update(self, language: str, mongo_ids: Optional[Iterable[str]] = None) -> int:
+        """
+        Compute and store the related articles of a language.
+        :param language: language of the index to query
+        :param mongo_ids: articles to update. Defaults to the articles without related articles in the language
+        (the articles added since the last run), together with the articles related to them, whose lists may now
+        include the new articles.
+        :return: number of articles updated
+        """
+        index_name = f"{self.es.index_prefix}_{language}"
+        if not self.es.es.indices.exists(index=index_name):
+            log.warning("Index %s does not exist, skipping", index_name)
+            return 0
+        # The articles indexed just before must be visible to the queries
+        self.es.es.indices.refresh(index=index_name)
+
+        if mongo_ids is not None:
+            related = self.find_related(language, list(mongo_ids))
+        else:
+            new_ids = [str(document["_id"]) for document in self.mongo.db.articles.find(
+                {f"title.{language}": {"$exists": True}, f"related.{language}": {"$exists": False}}, {"_id": 1})]
+            related = self.find_related(language, new_ids)
+            neighbours = {mongo_id for ids in related.values() for mongo_id in ids} - set(related)
+            related.update(self.find_related(language, sorted(neighbours)))
+
+        updated = self.store(language, related)
+        log.info("Related articles updated for %s articles in %s", updated, language)
+        return updated
+
+    def update_all(self, languages: Iterable[str] = Article.valid_languages) -> int:
+        """
+        Recompute the related articles of every article, e.g. after a reindex.
+        """
+        updated = 0
+        for language in languages:
+            mongo_ids = [str(document["_id"]) for document in
+                         self.mongo.db.articles.find({f"title.{language}": {"$exists": True}}, {"_id": 1})]
+            updated += self.update(language, mongo_ids)
+        return updated
+
+
+if __name__ == "__main__":
+    Logger(debug=False)
+
+    parser = argparse.ArgumentParser(description="Precompute the related articles")
+    parser.add_argument("--language", nargs="+", default=list(Article.valid_languages),
+                        choices=Article.valid_languages)
+    parser.add_argument("--all", action="store_true",
+                        help="recompute every article instead of the new ones and their neighbours")
+    parser.add_argument("--count", type=int, default=5, help="related articles per article")
+    args = parser.parse_args()
+
+    es = ElasticsearchClient()
+    mongo = MongoDBClient(es_client=es)
+    if not mongo.ping() or not es.ping():
+        exit(1)
+
+    job = RelatedArticles(mongo, es, args.count)
+    if args.all:
+        job.update_all(args.language)
+    else:
+        for language in args.language:
+            job.update(language)
@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import sqlite3
+import tempfile
+import threading
+from typing import Any, Callable, Optional
+
+from modules.log_manager import log
+from modules import metrics
+
+# Shared cache of the process, created on first use, see `get_cache`
+active = None
+
+# Default lifetime of the entries in seconds. The SQLite store only sees the invalidations of its own host or
+# container, so a crawl run elsewhere is only picked up when the entries expire: its entries live shorter.
+DEFAULT_TTL = 300.0
+SQLITE_TTL = 30.0
+
+
+class SharedCache:
+    """
+    Cache shared by the API worker processes, so an entry filled by one worker is warm in all of them.
+    Entries are grouped in namespaces with a version number stored in the cache itself. Bumping the version of a
+    namespace (`invalidate`) makes every entry of the namespace unreachable in every process at once; the old entries
+    expire on their own.
+    Subclasses implement the storage of raw values and versions.
+    """
+
+    def __init__(self, ttl: float = 300.0):
+        """
+        :param ttl: lifetime of the entries in seconds
+        """
+        self.ttl = ttl
+
+    def get_raw(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set_raw(self, key: str, value: str, ttl: float) -> None:
+        raise NotImplementedError
+
+    def version(self, namespace: str) -> int:
+        raise NotImplementedError
+
+    def invalidate(self, namespace: str) -> None:
+        """
+        Bump the version of a namespace, e.g. after writing articles.
+        """
+        raise NotImplementedError
+
+    def get(self, namespace: str, key: str) -> Any:
+        """
+        :return: the cached JSON value, or None if it is not cached
+        """
+        value = self.get_raw(f"{namespace}:{self.version(namespace)}:{key}")
+        metrics.cache_lookup(f"shared_{namespace}", hits=int(value is not None), misses=int(value is None))
+        return json.loads(value) if value is not None else None
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.set_raw(f"{namespace}:{self.version(namespace)}:{key}", json.dumps(value, ensure_ascii=False),
+                     self.ttl if ttl is None else ttl)
+
+    def get_or_set(self, namespace: str, key: str, function: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """
+        Get a cached value, or compute and cache it. The version is read before computing the value, so a value
+        computed while the namespace was invalidated is stored under the old version and never served.
+        :param function: computes the value, which must be JSON serializable. None values are not cached.
+        """
+        # The cache is an optimization: when it fails, the value is computed as if it was not cached
+        try:
+            full_key = f"{namespace}:{self.version(namespace)}:{key}"
+            value = self.get_raw(full_key)
+        except Exception as e:
+            log.error(f"Shared cache lookup failed: {e}")
+            return function()
+
+        metrics.cache_lookup(f"shared_{namespace}", hits=int(value is not None), misses=int(value is None))
+        if value is not None:
+            return json.loads(value)
+
+        result = function()
+        if result is not None:
+            try:
+                self.set_raw(full_key, json.dumps(result, ensure_ascii=False), self.ttl if ttl is None else ttl)
+            except Exception as e:
+                log.error(f"Shared cache write failed: {e}")
+        return result
+
+
+class NullCache(SharedCache):
+    """
+    Cache storing nothing, when the shared cache is disabled.
+    """
+
+    def get_raw(self, key: str) -> Optional[str]:
+        return None
+
+    def set_raw(self, key: str, value: str, ttl: float) -> None:
+        pass
+
+    def version(self, namespace: str) -> int:
+        return 0
+
+    def invalidate(self, namespace: str) -> None:
+        pass
+
+
+class SQLiteSharedCache(SharedCache):
+    def __init__(self, path: Optional[str] = None, ttl: float = 300.0, mmap_size: int = 64 * 1024 * 1024):
+        """
+        Shared cache in a SQLite file memory-mapped by every process of the host. By default the file is in
+        /dev/shm, so it lives in shared memory and never touches the disk. Only the processes of the same host (or
+        container) see the invalidations; use Redis when the articles are written from elsewhere.
+
+        :param path: path of the SQLite file
+        :param ttl: lifetime of the entries in seconds
+        :param mmap_size: number of bytes of the file mapped in memory by each connection
+        """
+        super().__init__(ttl)
+        if path is None:
+            directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+            path = os.path.join(directory, "neo-gung-cache.sqlite3")
+        self.path = path
+        self.mmap_size = mmap_size
+        self.local = threading.local()
+        self.writes = 0
+
+        connection = self.connection
+        connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                           "expires REAL NOT NULL) WITHOUT ROWID")
+        connection.execute("CREATE TABLE IF NOT EXISTS versions (namespace TEXT PRIMARY KEY, "
+                           "version INTEGER NOT NULL) WITHOUT ROWID")
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        # One connection per thread: the synchronous endpoints run in a thread pool
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+            self.local.connection = connection
+        return connection
+
+    def get_raw(self, key: str) -> Optional[str]:
+        row = self.connection.execute("SELECT value FROM entries WHERE key = ? AND expires > ?",
+                                      (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set_raw(self, key: str, value: str, ttl: float) -> None:
+        now = time.time()
+        connection = self.connection
+        connection.execute("INSERT OR REPLACE INTO entries (key, value, expires) VALUES (?, ?, ?)",
+                           (key, value, now + ttl))
+        # Expired entries, including the ones of the old versions, are purged from time to time
+        self.writes += 1
+        if self.writes % 1000 == 0:
+            connection.execute("DELETE FROM entries WHERE expires <= ?", (now,))
+
+    def version(self, namespace: str) -> int:
+        row = self.connection.execute("SELECT version FROM versions WHERE namespace = ?", (namespace,)).fetchone()
+        return row[0] if row else 0
+
+    def invalidate(self, namespace: str) -> None:
+        self.connection.execute("INSERT INTO versions (namespace, version) VALUES (?, 1) "
+                                "ON CONFLICT (namespace) DO UPDATE SET version = version + 1", (namespace,))
+
+
+class RedisSharedCache(SharedCache):
+    def __init__(self, url: str, ttl: float = 300.0, prefix: str = "neo-gung"):
+        """
+        Shared cache in Redis (or any server speaking its protocol), for workers spread over several hosts.
+        Needs the `redis` package.
+
+        :param url: redis:// URL of the server
+        :param ttl: lifetime of the entries in seconds
+        :param prefix: prefix of the keys
+        """
+        super().__init__(ttl)
+        import redis
+
+        self.redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get_raw(self, key: str) -> Optional[str]:
+        value = self.redis.get(f"{self.prefix}:{key}")
+        return value.decode("utf-8") if value is not None else None
+
+    def set_raw(self, key: str, value: str, ttl: float) -> None:
+        self.redis.set(f"{self.prefix}:{key}", value, px=int(ttl * 1000))
+
+    def version(self, namespace: str) -> int:
+        value = self.redis.get(f"{self.prefix}:version:{namespace}")
+        return int(value) if value is not None else 0
+
+    def invalidate(self, namespace: str) -> None:
+        self.redis.incr(f"{self.prefix}:version:{namespace}")
+
+
+def create_cache(url: Optional[str] = None, ttl: Optional[float] = None) -> SharedCache:
+    """
+    Create the shared cache described by a URL.
+    :param url: "off" to disable the cache, "sqlite" or "sqlite:///path/of/file" for the SQLite cache,
+    "redis://host:port/db" for Redis. Defaults to the NEO_GUNG_CACHE environment variable, or "sqlite".
+    :param ttl: lifetime of the entries in seconds. Defaults to the NEO_GUNG_CACHE_TTL environment variable, or
+    `SQLITE_TTL` for SQLite and `DEFAULT_TTL` for Redis.
+    """
+    url = url or os.environ.get("NEO_GUNG_CACHE", "sqlite")
+    if ttl is None and os.environ.get("NEO_GUNG_CACHE_TTL"):
+        ttl = float(os.environ["NEO_GUNG_CACHE_TTL"])
+
+    try:
+        if url == "off":
+            return NullCache(DEFAULT_TTL)
+        if url == "sqlite" or url.startswith("sqlite://"):
+            return SQLiteSharedCache(url[len("sqlite:///") - 1:] if url.startswith("sqlite:///") else None,
+                                     SQLITE_TTL if ttl is None else ttl)
+        if url.startswith(("redis://", "rediss://", "unix://")):
+            return RedisSharedCache(url, DEFAULT_TTL if ttl is None else ttl)
+    except Exception as e:
+        log.error(f"Failed creating the shared cache {url}, caching disabled: {e}")
+        return NullCache(DEFAULT_TTL)
+    raise ValueError(f"Invalid shared cache URL: {url}")
+
+
+def get_cache() -> SharedCache:
+    global active
+    if active is None:
+        active = create_cache()
+    return active
+
+
+def invalidate(namespace: str) -> None:
+    """
+    Bump the version of a namespace of the shared cache. Failures are logged, never raised, since they must not
+    fail the write that triggered them.
+    """
+    try:
+        get_cache().invalidate(namespace)
+    except Exception as e:
+        log.error(f"Failed invalidating the shared cache namespace {namespace}: {e}")
@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime, timezone
+from typing import Hashable, Optional
+
+from modules.log_manager import log
+
+# Tracer of the running pipeline, None when no run is being traced
+active = None
+
+
+def article_key(source_prefix: str, article_id: int) -> str:
+    """
+    Key identifying an article across the stages of a trace.
+    """
+    return f"{source_prefix}/{article_id}"
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+class Span:
+    __slots__ = ("tracer", "stage", "key", "items", "start", "duration")
+
+    def __init__(self, tracer: "Tracer", stage: str, key: Optional[Hashable], items: int):
+        self.tracer = tracer
+        self.stage = stage
+        self.key = key
+        self.items = items
+        self.start = 0.0
+        self.duration = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.duration = time.perf_counter() - self.start
+        self.tracer.record(self.stage, self.duration, self.key, self.items, self.start)
+
+
+class NoopSpan:
+    duration = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+noop_span = NoopSpan()
+
+
+class Tracer:
+    def __init__(self, name: str):
+        """
+        Collects the timings of the pipeline stages (list fetch, article fetch, clean, format, cache write,
+        Mongo upsert, ES index) during a run, and summarizes them in a report.
+
+        :param name: name of the run, used in the report file name
+        """
+        self.name = name
+        self.started = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        self.finish = None
+        self.records = []  # (stage, key, items, start, duration)
+        self.lock = threading.Lock()
+
+    def span(self, stage: str, key: Optional[Hashable] = None, items: int = 1) -> Span:
+        """
+        Context manager timing a stage.
+        :param stage: name of the stage
+        :param key: article the work was done for (see `article_key`), None for batch operations
+        :param items: number of articles processed in the span, for the throughput
+        """
+        return Span(self, stage, key, items)
+
+    def record(self, stage: str, duration: float, key: Optional[Hashable] = None, items: int = 1,
+               start: Optional[float] = None) -> None:
+        """
+        Record a stage timed elsewhere, e.g. in a worker process.
+        :param start: perf_counter value at the start of the stage. Defaults to `duration` seconds ago.
+        """
+        if start is None:
+            start = time.perf_counter() - duration
+        with self.lock:
+            self.records.append((stage, key, items, start, duration))
+
+    def report(self, slowest: int = 10) -> dict:
+        """
+        Summarize the run.
+        :param slowest: number of slowest articles to list
+        :return: dictionary with the wall time, per stage statistics and the slowest articles
+        """
+        end = self.finish or time.perf_counter()
+        with self.lock:
+            records = list(self.records)
+
+        stages = {}
+        for stage, key, items, start, duration in records:
+            stages.setdefault(stage, []).append((items, start, duration))
+
+        stage_report = {}
+        for stage, entries in stages.items():
+            durations = sorted(duration for _, _, duration in entries)
+            items = sum(count for count, _, _ in entries)
+            # Stages run concurrently (tabs, worker processes, async requests), so the throughput is measured on the
+            # time between the first start and the last end of the stage, not on the sum of the durations
+            elapsed = max(start + duration for _, start, duration in entries) - min(start for _, start, _ in entries)
+            stage_report[stage] = {
+                "spans": len(entries),
+                "items": items,
+                "busy_seconds": round(sum(durations), 4),
+                "elapsed_seconds": round(elapsed, 4),
+                "items_per_second": round(items / elapsed, 2) if elapsed > 0 else None,
+                "p50_ms": round(percentile(durations, 0.5) * 1000, 2),
+                "p95_ms": round(percentile(durations, 0.95) * 1000, 2),
+                "max_ms": round(durations[-1] * 1000, 2),
+            }
+
+        articles = {}
+        for stage, key, _, _, duration in records:
+            if key is None:
+                continue
+            article = articles.setdefault(str(key), {})
+            article[stage] = article.get(stage, 0.0) + duration
+
+        slowest_articles = sorted(articles.items(), key=lambda item: -sum(item[1].values()))[:slowest]
+        return {
+            "run": self.name,
+            "started": self.started.isoformat(timespec="seconds"),
+            "wall_seconds": round(end - self.start, 4),
+            "stages": stage_report,
+            "slowest_articles": [
+                {"key": key, "total_ms": round(sum(timings.values()) * 1000, 2),
+                 "stages": {stage: round(duration * 1000, 2) for stage, duration in timings.items()}}
+                for key, timings in slowest_articles
+            ],
+        }
+
+    def write(self, directory: str = "reports", slowest: int = 10) -> str:
+        """
+        Write the report of the run as JSON.
+        :param directory: folder of the reports
+        :param slowest: number of slowest articles to list
+        :return: path of the report file
+        """
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.name}-{self.started.strftime('%Y%m%d-%H%M%S')}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(slowest), f, indent=2, ensure_ascii=False)
+        return path
+
+
+def start_run(name: str) -> Tracer:
+    """
+    Start tracing a pipeline run. The spans of the instrumented code are recorded until `finish_run`.
+    """
+    global active
+    active = Tracer(name)
+    return active
+
+
+def finish_run(directory: Optional[str] = "reports", slowest: int = 10) -> Optional[dict]:
+    """
+    Stop tracing the current run and write its report.
+    :param directory: folder of the reports. None to only return the report.
+    :param slowest: number of slowest articles to list
+    :return: the report, or None if no run was being traced
+    """
+    global active
+    tracer, active = active, None
+    if tracer is None:
+        return None
+
+    tracer.finish = time.perf_counter()
+    if directory:
+        log.info("Pipeline report written to %s", tracer.write(directory, slowest))
+    return tracer.report(slowest)
+
+
+def span(stage: str, key: Optional[Hashable] = None, items: int = 1):
+    """
+    Time a stage of the current run. Does nothing when no run is being traced.
+    """
+    if active is None:
+        return noop_span
+    return active.span(stage, key, items)
+
+
+def record(stage: str, duration: float, key: Optional[Hashable] = None, items: int = 1) -> None:
+    if active is not None:
+        active.record(stage, duration, key, items)
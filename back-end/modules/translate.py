@@ -1,82 +1,271 @@
-import translators as ts
+import json
+import time
+import zlib
+import threading
 import concurrent.futures
-from typing import Optional
+from abc import ABC, abstractmethod
+from typing import Optional, Union
 
 from modules.models import Article
-from modules.db import MongoDBClient
 from modules.log_manager import Logger, log
 
 
-def translate(origin_lang: str, target_lang: str, text: str, service: str = "papago") -> Optional[str]:
+class TranslationProvider(ABC):
+    """
+    Base class of the translation backends.
+    Subclasses only need to implement `translate`, which raises on failure.
+    """
+    name = "base"
+
+    @abstractmethod
+    def translate(self, text: str, origin_lang: str, target_lang: str) -> str:
+        pass
+
+
+class TranslatorsProvider(TranslationProvider):
+    def __init__(self, service: str = "papago"):
+        """
+        Translation backend using the `translators` package (papago by default).
+        The package is imported on first use, since it does network lookups at import time.
+
+        :param service: Name of the `translators` service to use.
+        """
+        self.name = service
+        self.service = service
+        self._ts = None
+
+    def translate(self, text: str, origin_lang: str, target_lang: str) -> str:
+        if self._ts is None:
+            import translators as ts
+            self._ts = ts
+        return self._ts.translate_text(translator=self.service, query_text=text, from_language=origin_lang,
+                                       to_language=target_lang)
+
+
+class DeepLProvider(TranslationProvider):
+    name = "deepl"
+
+    # DeepL no longer accepts a bare "EN" as a target language
+    target_codes = {"en": "EN-US"}
+
+    def __init__(self, auth_key: Optional[str] = None, secrets_file: str = "secrets.json"):
+        """
+        Translation backend using the official DeepL client (same as `sync_lang.py`).
+
+        :param auth_key: DeepL API key. When not specified, it is read from `deepl_api_key` in the secrets file.
+        :param secrets_file: Path of the secrets file.
+        """
+        import deepl
+
+        if auth_key is None:
+            with open(secrets_file, "r", encoding="utf-8") as f:
+                auth_key = json.loads(f.read())["deepl_api_key"]
+        self.translator = deepl.Translator(auth_key=auth_key)
+
+    def translate(self, text: str, origin_lang: str, target_lang: str) -> str:
+        target = self.target_codes.get(target_lang, target_lang)
+        return self.translator.translate_text(text, source_lang=origin_lang, target_lang=target).text
+
+
+class StubProvider(TranslationProvider):
+    name = "stub"
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0):
+        """
+        Deterministic local backend for offline tests and load testing.
+        The output, delay and failures only depend on the input text, so runs are reproducible
+        regardless of thread scheduling.
+
+        :param latency: Base delay of every call in seconds.
+        :param jitter: Maximum extra delay in seconds, added on top of `latency`.
+        :param error_rate: Fraction of the calls (0.0 - 1.0) that raise a RuntimeError.
+        """
+        if not 0.0 <= error_rate <= 1.0:
+            raise ValueError(f"Invalid error rate. It must be between 0 and 1: {error_rate}")
+
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def translate(self, text: str, origin_lang: str, target_lang: str) -> str:
+        checksum = zlib.crc32(f"{origin_lang}:{target_lang}:{text}".encode("utf-8"))
+        failed = (checksum % 10000) < self.error_rate * 10000
+
+        with self._lock:
+            self.calls += 1
+            if failed:
+                self.errors += 1
+
+        delay = self.latency + self.jitter * ((checksum >> 16) % 1000) / 1000
+        if delay > 0:
+            time.sleep(delay)
+
+        if failed:
+            raise RuntimeError(f"Stub translation error ({origin_lang} -> {target_lang})")
+        return f"[{target_lang}] {text}"
+
+
+def get_provider(service: Union[str, TranslationProvider] = "papago", **kwargs) -> TranslationProvider:
+    """
+    Resolve a translation provider from its name.
+    :param service: "deepl", "stub" or any `translators` service name. Providers are returned as is.
+    :param kwargs: Keyword arguments for the provider constructor.
+    :return: TranslationProvider instance.
+    """
+    if isinstance(service, TranslationProvider):
+        return service
+    if service == "deepl":
+        return DeepLProvider(**kwargs)
+    if service == "stub":
+        return StubProvider(**kwargs)
+    return TranslatorsProvider(service)
+
+
+# Providers of `translate` by service name, so the clients (and the DeepL secrets) are only set up once
+providers = {}
+providers_lock = threading.Lock()
+
+
+def cached_provider(service: Union[str, TranslationProvider]) -> TranslationProvider:
+    if isinstance(service, TranslationProvider):
+        return service
+    with providers_lock:
+        if service not in providers:
+            providers[service] = get_provider(service)
+        return providers[service]
+
+
+def translate(origin_lang: str, target_lang: str, text: str,
+              service: Union[str, TranslationProvider] = "papago") -> Optional[str]:
     try:
-        translated_text = ts.translate_text(translator=service, query_text=text, from_language=origin_lang,
-                                            to_language=target_lang)
-        return translated_text
+        return cached_provider(service).translate(text, origin_lang, target_lang)
     except Exception as e:
         log.error(f"Error translating article: {e}")
         return None
 
 
 class ArticleTranslationScript:
-    def __init__(self):
-        self.db_manager = MongoDBClient()
-        self.article_id_file = 'cache/mongo_article_id_list.txt'
+    def __init__(self, provider: Union[str, TranslationProvider] = "papago", target_lang: str = "es",
+                 db_manager=None):
+        """
+        Translate every article in the database into the target language.
+
+        :param provider: Translation provider, or the name of one (see `get_provider`).
+        :param target_lang: Language code to translate the articles into.
+        :param db_manager: Database client. A MongoDBClient is created when not specified.
+        """
+        if target_lang not in Article.language_set:
+            raise ValueError(f"Invalid language. It must be one of: {Article.valid_languages}: {target_lang}")
 
-    def fetch_article_ids(self) -> list:
+        if db_manager is None:
+            from modules.db import MongoDBClient
+            db_manager = MongoDBClient()
+
+        self.db_manager = db_manager
+        self.provider = get_provider(provider)
+        self.target_lang = target_lang
+
+    def fetch_article_ids(self, missing_only: bool = True) -> list:
+        """
+        :param missing_only: only the articles without a translation into the target language
+        :return: IDs of the articles to translate
+        """
         try:
-            articles = self.db_manager.db.articles.find({}, {"_id": 1})
-            article_ids = [str(article['_id']) for article in articles]
+            if missing_only:
+                article_ids = [entry["id"] for entry in self.db_manager.iter_missing_translations([self.target_lang])]
+            else:
+                article_ids = [str(article['_id']) for article in self.db_manager.db.articles.find({}, {"_id": 1})]
 
-            log.info("Article IDs fetched.")
+            log.info(f"{len(article_ids)} article IDs fetched.")
             return article_ids
         except Exception as e:
             log.error(f"Error fetching article IDs: {e}")
             return []
 
-    @staticmethod
-    def translate_article(article: Article) -> Optional[Article]:
+    def read_work_list(self, path: str) -> list:
+        """
+        Read the IDs of the articles missing the target language from a work list written by vetify_translation.py.
+        :param path: JSON lines file of {"id", "tag", "missing"} entries
+        """
+        with open(path, encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        return [entry["id"] for entry in entries if self.target_lang in entry["missing"]]
+
+    def translate_article(self, article: Article) -> Optional[Article]:
         try:
-            # uning papago translator to translate the article from Korean to English
-            translated_title = translate(origin_lang="ko", target_lang="es", text=article.title)
-            translated_content = translate(origin_lang="ko", target_lang="es", text=article.content)
+            translated_title = translate(origin_lang="ko", target_lang=self.target_lang, text=article.title,
+                                         service=self.provider)
+            translated_content = translate(origin_lang="ko", target_lang=self.target_lang, text=article.content,
+                                           service=self.provider)
+            if translated_title is None or translated_content is None:
+                return None
 
             return Article(source_prefix=article.source_prefix, article_id=article.article_id, source_url=article.url,
                            title=translated_title,
-                           time=article.time, content=translated_content, language='es')
+                           time=article.time, content=translated_content, language=self.target_lang)
 
         except Exception as e:
             log.error(f"Error translating article: {e}")
             return None
 
-    def process_article(self, article_id: str) -> None:
+    def process_article(self, article_id: str) -> bool:
         try:
             # Fetch the article from the database using the ID
             article = self.db_manager.get_article_from_id(mongo_id=article_id)
 
             if not article:
                 log.error(f"No article found with ID: {article_id}")
-                return
+                return False
+
+            article = self.translate_article(article)
+            if not article:
+                log.error(f"Failed to translate article: {article_id}")
+                return False
+
+            update_result = self.db_manager.add_language(self.target_lang, article, article_id)
+            if update_result:
+                log.info(f"Article updated with translation: {article_id}")
             else:
-                article = self.translate_article(article)
-                update_result = self.db_manager.add_language('es', article, article_id)
-                if update_result:
-                    log.info(f"Article updated with translation: {article_id}")
-                else:
-                    log.error(f"Failed to update article: {article_id}")
+                log.error(f"Failed to update article: {article_id}")
+            return update_result
         except Exception as e:
             log.error(f"Error processing article {article_id}: {e}")
+            return False
 
-    def run(self, num_workers: int = 1) -> None:
-        # Fetch all article IDs
-        article_ids = self.fetch_article_ids()
+    def run(self, num_workers: int = 1, article_ids: Optional[list] = None) -> int:
+        """
+        Translate the articles in parallel.
+        :param num_workers: Number of worker threads.
+        :param article_ids: IDs of the articles to translate. Defaults to the articles missing the target language.
+        :return: Number of articles translated and saved.
+        """
+        if article_ids is None:
+            article_ids = self.fetch_article_ids()
 
         # Use ThreadPoolExecutor for parallel processing
         with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
             # Map the process_article function to each article ID
-            executor.map(self.process_article, article_ids)
+            return sum(executor.map(self.process_article, article_ids))
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Translate the articles missing a language")
+    parser.add_argument("--language", default="es", choices=Article.valid_languages, help="target language")
+    parser.add_argument("--provider", default="papago")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--work-list", help="work list written by vetify_translation.py")
+    parser.add_argument("--all", action="store_true", help="translate every article again")
+    args = parser.parse_args()
+
     Logger(debug=False)
-    script = ArticleTranslationScript()
-    script.run()
+    script = ArticleTranslationScript(args.provider, args.language)
+    if args.work_list:
+        ids = script.read_work_list(args.work_list)
+    else:
+        ids = script.fetch_article_ids(missing_only=not args.all)
+    log.info(f"{script.run(args.workers, ids)} of {len(ids)} articles translated")
@@ -1,10 +1,107 @@
 from bs4 import BeautifulSoup, NavigableString
-from markdownify import markdownify as mdf
+from markdownify import MarkdownConverter, markdownify as mdf
+import lxml.html
+import html
+import os
 import re
-from typing import Union
+from typing import Iterable, Optional, Union
 
-with open("modules/stopwords.txt", "r") as f:
-    stopwords = f.read().splitlines()
+whitespace_re = re.compile(r"\s+")
+
+# Stopword list, loaded on first use. Can be overridden with the NEO_GUNG_STOPWORDS environment variable.
+default_stopwords_path = os.environ.get("NEO_GUNG_STOPWORDS",
+                                        os.path.join(os.path.dirname(os.path.abspath(__file__)), "stopwords.txt"))
+stopword_filters = {}
+
+
+class StopwordFilter:
+    def __init__(self, words: Iterable[str]):
+        """
+        Multi-pattern matcher for the stopwords.
+        The words are compiled into a single regular expression shaped like a trie, so a text is scanned once
+        regardless of the number of stopwords.
+
+        :param words: stopwords to match. Empty words are ignored.
+        """
+        self.words = sorted({word for word in words if word})
+        self.pattern = re.compile(self.trie_pattern(self.words)) if self.words else None
+
+    @classmethod
+    def from_file(cls, path: str) -> "StopwordFilter":
+        """
+        Load the stopwords from a file with one stopword per line.
+        :param path: path of the stopword file
+        :return: StopwordFilter instance
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(line.strip() for line in f)
+
+    @staticmethod
+    def trie_pattern(words: list[str]) -> str:
+        """
+        Build a regular expression matching any of the words, with common prefixes factored out.
+        Longer words are preferred when a word is the prefix of another one.
+        """
+        trie = {}
+        for word in words:
+            node = trie
+            for char in word:
+                node = node.setdefault(char, {})
+            node[""] = {}
+
+        def build(node: dict) -> str:
+            branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+            if not branches:
+                return ""
+            if len(branches) == 1 and "" not in node:
+                return branches[0]
+            group = branches[0] if len(branches) == 1 and len(branches[0]) == 1 else f"(?:{'|'.join(branches)})"
+            return f"{group}?" if "" in node else group
+
+        return build(trie)
+
+    def find(self, text: str) -> Optional[str]:
+        """
+        Find the first stopword in the text.
+        :param text: text to check
+        :return: the matched stopword, or None if there is none
+        """
+        if self.pattern is None:
+            return None
+        match = self.pattern.search(text)
+        return match.group(0) if match else None
+
+    def find_all(self, text: str) -> list[str]:
+        """
+        Find the distinct stopwords in the text, in order of appearance.
+        """
+        if self.pattern is None:
+            return []
+        return list(dict.fromkeys(self.pattern.findall(text)))
+
+    def __len__(self):
+        return len(self.words)
+
+
+def get_stopword_filter(path: Optional[str] = None) -> StopwordFilter:
+    """
+    Get the stopword filter of a stopword file, building it on first use.
+    :param path: path of the stopword file. Defaults to modules/stopwords.txt.
+    :return: StopwordFilter instance
+    """
+    path = path or default_stopwords_path
+    if path not in stopword_filters:
+        stopword_filters[path] = StopwordFilter.from_file(path)
+    return stopword_filters[path]
+
+
+def find_stopword(text: str) -> Optional[str]:
+    """
+    Find the first stopword in the text.
+    :param text: Text to check.
+    :return: The matched stopword, or None if no stopwords are in the text.
+    """
+    return get_stopword_filter().find(text)
 
 
 def no_stopword(text: str) -> bool:
@@ -13,10 +110,7 @@ def no_stopword(text: str) -> bool:
     :param text: Text to check.
     :return: True if no stopwords are in the text, False otherwise.
     """
-    for word in stopwords:
-        if word in text:
-            return False
-    return True
+    return find_stopword(text) is None
 
 
 def is_table_otherwise_empty(table):
@@ -52,9 +146,21 @@ def convert_html_table_to_markdown(html):
     return markdown
 
 
+# Patterns of strip_markdown, applied in this order
+markdown_image_re = re.compile(r'!\[.*?]\(.*?\)')
+markdown_link_re = re.compile(r'\[(.*?)]\(.*?\)')
+markdown_emphasis_re = re.compile(r'\*\*(.*?)\*\*|\*(.*?)\*|__(.*?)__|_(.*?)_')
+markdown_code_re = re.compile(r'`{1,3}(.*?)`{1,3}')
+markdown_strikethrough_re = re.compile(r'~~(.*?)~~')
+markdown_heading_re = re.compile(r'^\s*#{1,6}\s*', re.MULTILINE)
+markdown_list_re = re.compile(r'^\s*[*+-]\s', re.MULTILINE)
+markdown_table_rule_re = re.compile(r'(\n-{3,})+')
+
+
 def strip_markdown(md_string: str) -> Union[str, None]:
     """
     Strip markdown from a string and return plain text.
+    Each substitution only runs when the text contains its marker, since most articles only use a few of them.
 
     :param md_string: A string containing markdown content.
     :return: A string with markdown formatting removed, or None if input is None.
@@ -62,26 +168,48 @@ def strip_markdown(md_string: str) -> Union[str, None]:
     if md_string is None:
         return None
 
-    # Remove images
-    md_string = re.sub(r'!\[.*?]\(.*?\)', '', md_string)
-    # Remove links, keeping the text
-    md_string = re.sub(r'\[(.*?)]\(.*?\)', r'\1', md_string)
+    if '[' in md_string:
+        # Remove images
+        if '![' in md_string:
+            md_string = markdown_image_re.sub('', md_string)
+        # Remove links, keeping the text
+        md_string = markdown_link_re.sub(r'\1', md_string)
     # Remove bold and italic formatting
-    md_string = re.sub(r'\*\*(.*?)\*\*|\*(.*?)\*|__(.*?)__|_(.*?)_', r'\1\2\3\4', md_string)
+    if '*' in md_string or '_' in md_string:
+        md_string = markdown_emphasis_re.sub(r'\1\2\3\4', md_string)
     # Remove inline code and code blocks
-    md_string = re.sub(r'`{1,3}(.*?)`{1,3}', r'\1', md_string)
+    if '`' in md_string:
+        md_string = markdown_code_re.sub(r'\1', md_string)
     # Remove strikethroughs
-    md_string = re.sub(r'~~(.*?)~~', r'\1', md_string)
+    if '~~' in md_string:
+        md_string = markdown_strikethrough_re.sub(r'\1', md_string)
     # Remove headings
-    md_string = re.sub(r'(?m)^\s*#{1,6}\s*', '', md_string)
+    if '#' in md_string:
+        md_string = markdown_heading_re.sub('', md_string)
     # Remove lists
-    md_string = re.sub(r'^\s*[*+-]\s', '', md_string, flags=re.MULTILINE)
+    if '-' in md_string or '*' in md_string or '+' in md_string:
+        md_string = markdown_list_re.sub('', md_string)
     # Handle tables by replacing pipes and dashes with new lines
-    md_string = re.sub(r'\|', '\n', md_string)
-    md_string = re.sub(r'(\n-{3,})+', '\n', md_string)
+    if '|' in md_string:
+        md_string = md_string.replace('|', '\n')
+    if '---' in md_string:
+        md_string = markdown_table_rule_re.sub('\n', md_string)
     # Strip each line and remove empty lines
-    md_string = '\n'.join([line.strip() for line in md_string.splitlines() if line.strip()])
-    return md_string
+    return '\n'.join([line for line in map(str.strip, md_string.splitlines()) if line])
+
+
+def make_excerpt(md_string: str, length: int = 200) -> str:
+    """
+    Plain text excerpt of a markdown text, for the article cards of the feed.
+    :param md_string: markdown content
+    :param length: maximum number of characters, cut at the last space before the limit when there is one
+    :return: excerpt, ending with an ellipsis when the text was cut
+    """
+    text = whitespace_re.sub(" ", strip_markdown(md_string or "")).strip()
+    if len(text) <= length:
+        return text
+    cut = text.rfind(" ", 0, length)
+    return text[:cut if cut > length // 2 else length].rstrip() + "…"
 
 
 class HTMLCleaner:
@@ -253,6 +381,227 @@ class HTMLCleaner:
         return convert_html_table_to_markdown(refined_html)
 
 
+def lxml_tag_string(element) -> Optional[str]:
+    """
+    Equivalent of BeautifulSoup's `Tag.string` for an lxml element: the text of the element if it has a single
+    child node, looking through nested tags with a single child. None if the element has several child nodes.
+    """
+    while len(element):
+        if len(element) > 1 or element.text or element[0].tail:
+            return None
+        element = element[0]
+    return element.text
+
+
+def lxml_to_soup(root) -> BeautifulSoup:
+    """
+    Build the BeautifulSoup tree of the children of an lxml element, with normalized spaces.
+    This gives markdownify the same tree as parsing the serialized HTML, without serializing and parsing it again.
+    """
+    soup = BeautifulSoup('', 'html.parser')
+
+    def build(element, parent):
+        if element.text:
+            parent.append(NavigableString(whitespace_re.sub(' ', element.text)))
+        for child in element:
+            tag = soup.new_tag(child.tag, attrs={k: whitespace_re.sub(' ', v) for k, v in child.attrib.items()})
+            parent.append(tag)
+            build(child, tag)
+            if child.tail:
+                parent.append(NavigableString(whitespace_re.sub(' ', child.tail)))
+
+    build(root, soup)
+    return soup
+
+
+class LxmlHTMLCleaner:
+    """
+    Same cleanup as HTMLCleaner, done on an lxml tree.
+    Attributes, scripts and wrapper tags are handled in a first top-down traversal, and the tag merging,
+    table and stacking simplifications in a single bottom-up traversal, instead of a full scan per step.
+    The cleaned tree is handed to markdownify without being serialized and parsed again.
+
+    Unlike HTMLCleaner, formatting tags are only merged when nothing but whitespace separates them.
+    """
+    formatting_tags = ('b', 'i', 'strong', 'em')
+
+    def __init__(self):
+        self.root = None
+
+    def set_root(self, html_content: str) -> None:
+        """Parse the HTML content into an lxml tree, wrapped in a single <div> root."""
+        self.root = lxml.html.fragment_fromstring(html_content or '', create_parent='div')
+
+    def html_to_text(self, html_content: str) -> str:
+        """
+        Extracts only the text from the HTML content.
+        :param html_content: HTML content to extract text from.
+        :return: Extracted text.
+        """
+        self.set_root(html_content)
+        for element in self.root.xpath('//script|//style'):
+            element.drop_tree()
+        return self.root.text_content()
+
+    def normalize_tags(self, origin: str) -> None:
+        """
+        Remove comments, scripts and styles, keep only the link and image attributes and unwrap div and span tags.
+        """
+        for element in list(self.root.iter()):
+            if element is self.root:
+                continue
+            tag = element.tag
+            if not isinstance(tag, str) or tag in ('script', 'style'):
+                # comments and processing instructions, or scripts and styles
+                element.drop_tree()
+            elif tag == 'a' and element.get('href'):
+                href = element.get('href')
+                element.attrib.clear()
+                # Just keep the href attribute for 'a' tags and open in new tab
+                element.set('href', href if href.startswith('http') else origin + href)
+                element.set('target', '_blank')
+            elif tag == 'img':
+                src, alt = element.get('src'), element.get('alt')
+                if src is None:
+                    element.drop_tree()
+                    continue
+                element.attrib.clear()
+                element.set('src', src if src.startswith('http') else origin + src)
+                if alt is not None:
+                    element.set('alt', alt)
+            elif tag in ('div', 'span'):
+                element.drop_tag()
+            else:
+                element.attrib.clear()
+
+    def simplify_tree(self) -> None:
+        """
+        Merge adjacent formatting tags, simplify identical nested tags and replace tables that only hold an image
+        with the image, in one bottom-up traversal.
+        """
+        # Every element comes after its descendants in the reversed document order
+        for element in reversed(list(self.root.iter())):
+            if len(element):
+                self.merge_formatting_tags(element)
+                for child in list(element):
+                    if child.tag == element.tag:
+                        child.drop_tag()
+
+            if element.tag == 'table':
+                self.extract_single_image(element)
+
+    def merge_formatting_tags(self, parent) -> None:
+        """
+        Merge the runs of identical formatting tags in the children of the parent, separated only by whitespace.
+        """
+        index = 0
+        while index < len(parent) - 1:
+            tag = parent[index]
+            if tag.tag in self.formatting_tags:
+                while index < len(parent) - 1:
+                    next_tag = parent[index + 1]
+                    if next_tag.tag != tag.tag or not tag.tail or tag.tail.strip():
+                        break
+                    merged = (lxml_tag_string(tag) or '') + (lxml_tag_string(next_tag) or '')
+                    for child in list(tag):
+                        tag.remove(child)
+                    tag.text = merged
+                    next_tag.drop_tree()
+            index += 1
+
+    @staticmethod
+    def extract_single_image(table) -> None:
+        """
+        Replace the table with its image if it contains only a single image tag.
+        """
+        descendants = list(table.iterdescendants())
+        images = [element for element in descendants if element.tag == 'img']
+        if len(images) != 1 or table.getparent() is None:
+            return
+        if any(element.tag not in ('img', 'tr', 'td', 'tbody') for element in descendants):
+            return
+        if table.text_content().strip():
+            return
+
+        image = images[0]
+        image.tail = table.tail
+        table.getparent().replace(table, image)
+
+    def remove_empty_tags(self) -> None:
+        """
+        Remove empty tags, in document order, until the first tag containing an image or a line break.
+        """
+        element = self.root[0] if len(self.root) else None
+        while element is not None:
+            if element.tag in ('img', 'br'):
+                element = self._next_element(element)
+                continue
+            if next(element.iter('img', 'br'), None) is not None:
+                return
+
+            text = element.text_content().strip()
+            if not text or text == '\u200b':
+                following = self._next_element(element, descend=False)
+                element.drop_tree()
+                element = following
+            else:
+                element = self._next_element(element)
+
+    def _next_element(self, element, descend: bool = True):
+        """Next element of the tree in document order, optionally skipping the descendants of the element."""
+        if descend and len(element):
+            return element[0]
+        while element is not self.root:
+            following = element.getnext()
+            if following is not None:
+                return following
+            element = element.getparent()
+        return None
+
+    def mark_table_headers(self) -> None:
+        """
+        Convert the cells of the first row to header cells for tables without a header, so they become
+        markdown tables.
+        """
+        for table in self.root.iter('table'):
+            if next(table.iter('thead', 'th'), None) is not None:
+                continue
+            first_row = next(table.iter('tr'), None)
+            if first_row is not None:
+                for cell in first_row.iter('td'):
+                    cell.tag = 'th'
+
+    def serialize(self) -> str:
+        """
+        Serialize the tree into the minimal HTML structure, with normalized spaces.
+        """
+        body = html.escape(self.root.text or '', quote=False) + \
+            ''.join(lxml.html.tostring(child, encoding='unicode', method='xml') for child in self.root)
+        result_html = f'<html><head><meta charset="UTF-8"/></head><body>{body}</body></html>'
+        return whitespace_re.sub(" ", result_html)
+
+    def clean_tree(self, html_content: str, origin: str) -> None:
+        self.set_root(html_content)
+        self.normalize_tags(origin)
+        self.simplify_tree()
+        self.remove_empty_tags()
+
+    def clean_html(self, html_content: str, origin: str) -> str:
+        self.clean_tree(html_content, origin)
+        return self.serialize()
+
+    def html_to_markdown(self, html_content: str, domain: str) -> str:
+        """
+        Converts HTML content to Markdown.
+        :param html_content: HTML content to convert.
+        :param domain: Domain of the website.
+        :return: Converted Markdown content.
+        """
+        self.clean_tree(html_content, domain)
+        self.mark_table_headers()
+        return MarkdownConverter().convert_soup(lxml_to_soup(self.root))
+
+
 # example usage
 if __name__ == '__main__':
     with open('../cache/gyeongbokgung/954.md', 'r') as f:
@@ -0,0 +1,6 @@
+#! /usr/bin/env bash
+# Run by the tiangolo/uvicorn-gunicorn image before starting the workers.
+# Drop the metrics files of the previous worker pool, see NEO_GUNG_METRICS_DIR in modules/metrics.py.
+if [ -n "$NEO_GUNG_METRICS_DIR" ]; then
+    rm -rf "$NEO_GUNG_METRICS_DIR"
+fi
@@ -1,13 +1,17 @@
 # This file is used to setup on the initial run of the back-end
-from pymongo import DESCENDING
+from pymongo import ASCENDING, DESCENDING
 
 from modules.db import MongoDBClient, ElasticsearchClient
 from modules.models import Article
+from modules.related import RelatedArticles
 from tqdm import tqdm
 
 es = ElasticsearchClient()
 mongo = MongoDBClient()
 
+if not es.ping() or not mongo.ping():
+    exit(1)
+
 # Setup MongoDB indexes
 print("Setting up MongoDB indexes...")
 # check if index exists
@@ -16,6 +20,14 @@ if "articles" in mongo.db.list_collection_names() and "time_-1" not in mongo.db.
     print("MongoDB index created.")
 else:
     print("MongoDB index already exists.")
+# Articles are matched on their source and ID when they are crawled again
+mongo.db.articles.create_index([("tag", ASCENDING), ("o_id", ASCENDING)])
+
+# Excerpts of the feed cards, for the articles stored before they were written on insertion
+print("Article excerpts written:", mongo.backfill_excerpts())
+
+# Recount the articles per tag and language
+print("Article counters:", mongo.rebuild_counters())
 
 # Setup Elasticsearch index
 es.setup_index()
@@ -35,3 +47,8 @@ def index_language(lang: str) -> None:
 
 for language in Article.valid_languages:
     index_language(lang=language)
+
+
+# Related articles of the article view, computed on the new indexes
+RelatedArticles(mongo, es).update_all()
+print("Related articles computed.")
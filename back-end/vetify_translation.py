@@ -1,22 +1,40 @@
+import json
+import argparse
+
 from modules.db import MongoDBClient
+from modules.models import Article
 from modules.log_manager import Logger, log
 
-Logger(debug=False)
+# Check that every article has its title and content in every language.
+# The missing (article, language) pairs are computed by MongoDB, so no article text is sent to this script.
+# python vetify_translation.py --output cache/missing_translations.jsonl
+# The work list is read by `python -m modules.translate --language en --work-list cache/missing_translations.jsonl`
 
-# get all article from article collection and itterate over them
-# check the "title" field and "content" object has 5 elements in it
+parser = argparse.ArgumentParser(description="Translation coverage of the articles")
+parser.add_argument("--language", nargs="+", default=list(Article.valid_languages), choices=Article.valid_languages,
+                    help="languages to check")
+parser.add_argument("--output", help="JSON lines file to write the work list to")
+args = parser.parse_args()
+
+Logger(debug=False)
 
 db_manager = MongoDBClient()
-articles = db_manager.db.articles.find({})
+if not db_manager.ping():
+    exit(1)
 
+coverage = db_manager.get_translation_coverage(args.language)
+log.info(f"{coverage['incomplete']} of {coverage['total']} articles are missing some translation")
+for language, missing in coverage["languages"].items():
+    log.info(f"{language}: {missing} missing")
+for tag, missing in sorted(coverage["tags"].items()):
+    log.info(f"{tag}: {missing} incomplete articles")
 
-for article in articles:
-    log.info(f"Checking article: {article['_id']}")
-    if len(article['title']) != 5:
-        log.error(f"Article ID: {article['_id']}")
-        log.error(f"Missing some translation: {article['title']}")
-    if len(article['content']) != 5:
-        log.error(f"Article ID: {article['_id']}")
-        log.error(f"Missing some translation: {article['content']}")
+if args.output:
+    written = 0
+    with open(args.output, "w", encoding="utf-8") as f:
+        for entry in db_manager.iter_missing_translations(args.language):
+            f.write(json.dumps(entry) + "\n")
+            written += 1
+    log.info(f"Work list of {written} articles written to {args.output}")
 
 log.info(f"Done checking articles.")